@@ -0,0 +1,30 @@
+"""
+Guards shared by the revisions under versions/.
+
+0001 builds the schema from live metadata, so a fresh database already has
+every table, column and index a later revision adds. Those revisions only
+upgrade databases created before the change; each helper checks the live
+schema and creates only what is missing.
+
+    from backend.alembic.helpers import add_missing_columns, create_missing_index, has_table
+"""
+from typing import List
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def has_table(table: str) -> bool:
+    return table in sa.inspect(op.get_bind()).get_table_names()
+
+
+def add_missing_columns(table: str, *columns: sa.Column) -> None:
+    existing = {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+    for column in columns:
+        if column.name not in existing:
+            op.add_column(table, column)
+
+
+def create_missing_index(name: str, table: str, columns: List[str]) -> None:
+    if name not in {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(table)}:
+        op.create_index(name, table, columns)
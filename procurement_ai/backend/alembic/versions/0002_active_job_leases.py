@@ -0,0 +1,30 @@
+"""active_jobs lease columns for concurrent workers
+
+Revision ID: 0002_active_job_leases
+Revises: 0001_initial
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import add_missing_columns, create_missing_index
+
+revision = "0002_active_job_leases"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns(
+        "active_jobs",
+        sa.Column("lease_owner", sa.String(255), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+    )
+    create_missing_index("idx_active_jobs_status_lease", "active_jobs", ["status", "lease_expires_at"])
+
+
+def downgrade():
+    op.drop_index("idx_active_jobs_status_lease", table_name="active_jobs")
+    op.drop_column("active_jobs", "lease_expires_at")
+    op.drop_column("active_jobs", "lease_owner")
@@ -0,0 +1,28 @@
+"""active_jobs attempt counter and per-job retry policy override
+
+Revision ID: 0003_active_job_retry_policy
+Revises: 0002_active_job_leases
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import add_missing_columns
+
+revision = "0003_active_job_retry_policy"
+down_revision = "0002_active_job_leases"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns(
+        "active_jobs",
+        sa.Column("attempts", sa.Integer(), nullable=True, server_default="0"),
+        sa.Column("retry_policy", sa.JSON(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("active_jobs", "retry_policy")
+    op.drop_column("active_jobs", "attempts")
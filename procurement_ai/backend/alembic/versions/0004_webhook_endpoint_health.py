@@ -0,0 +1,28 @@
+"""webhook_endpoints failure counter for circuit breaking and auto-disable
+
+Revision ID: 0004_webhook_endpoint_health
+Revises: 0003_active_job_retry_policy
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import add_missing_columns
+
+revision = "0004_webhook_endpoint_health"
+down_revision = "0003_active_job_retry_policy"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns(
+        "webhook_endpoints",
+        sa.Column("consecutive_failures", sa.Integer(), nullable=True, server_default="0"),
+        sa.Column("disabled_reason", sa.String(length=255), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("webhook_endpoints", "disabled_reason")
+    op.drop_column("webhook_endpoints", "consecutive_failures")
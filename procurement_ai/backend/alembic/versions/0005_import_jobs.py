@@ -0,0 +1,45 @@
+"""import_jobs table for background PO file imports
+
+Revision ID: 0005_import_jobs
+Revises: 0004_webhook_endpoint_health
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import has_table
+
+revision = "0005_import_jobs"
+down_revision = "0004_webhook_endpoint_health"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if has_table("import_jobs"):
+        return
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("organization_id", sa.String(), sa.ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("spool_path", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(length=50), nullable=True),
+        sa.Column("records_done", sa.Integer(), nullable=True),
+        sa.Column("rows_processed", sa.Integer(), nullable=True),
+        sa.Column("pos_imported", sa.Integer(), nullable=True),
+        sa.Column("pos_skipped", sa.Integer(), nullable=True),
+        sa.Column("log_offset", sa.Integer(), nullable=True),
+        sa.Column("current_job_id", sa.String(), nullable=True),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("idx_import_jobs_org_created", "import_jobs", ["organization_id", "created_at"])
+
+
+def downgrade():
+    op.drop_index("idx_import_jobs_org_created", table_name="import_jobs")
+    op.drop_table("import_jobs")
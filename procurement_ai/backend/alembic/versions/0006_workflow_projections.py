@@ -0,0 +1,39 @@
+"""workflow_snapshots table and workflow_events replay index
+
+Revision ID: 0006_workflow_projections
+Revises: 0005_import_jobs
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import create_missing_index, has_table
+
+revision = "0006_workflow_projections"
+down_revision = "0005_import_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_missing_index("idx_workflow_events_wf_created", "workflow_events", ["workflow_id", "created_at"])
+    if has_table("workflow_snapshots"):
+        return
+    op.create_table(
+        "workflow_snapshots",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("organization_id", sa.String(), sa.ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("workflow_id", sa.String(), sa.ForeignKey("procurement_workflows.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("state", sa.JSON(), nullable=False),
+        sa.Column("event_count", sa.Integer(), nullable=False),
+        sa.Column("last_event_at", sa.DateTime(), nullable=False),
+        sa.Column("last_event_ids", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("idx_workflow_snapshots_wf_at", "workflow_snapshots", ["workflow_id", "last_event_at"])
+
+
+def downgrade():
+    op.drop_index("idx_workflow_snapshots_wf_at", table_name="workflow_snapshots")
+    op.drop_table("workflow_snapshots")
+    op.drop_index("idx_workflow_events_wf_created", table_name="workflow_events")
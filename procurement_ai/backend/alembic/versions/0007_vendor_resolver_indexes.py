@@ -0,0 +1,32 @@
+"""indexes for inbound vendor -> workflow resolution
+
+Revision ID: 0007_vendor_resolver_indexes
+Revises: 0006_workflow_projections
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+from backend.alembic.helpers import create_missing_index
+
+revision = "0007_vendor_resolver_indexes"
+down_revision = "0006_workflow_projections"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("idx_tasks_vendor_created", "procurement_tasks", ["vendor_id", "created_at"]),
+    ("idx_workflows_org_created", "procurement_workflows", ["organization_id", "created_at"]),
+]
+# schema.sql's phone lookup index, missing from databases built from metadata before it was declared there
+PHONE_INDEX = ("idx_vendors_whatsapp", "vendors", ["phone_number"])
+
+
+def upgrade():
+    for name, table, columns in [PHONE_INDEX] + INDEXES:
+        create_missing_index(name, table, columns)
+
+
+def downgrade():
+    # PHONE_INDEX predates this revision in schema.sql-built databases, so it stays
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,25 @@
+"""active_jobs.ordering_key for per-key ordered execution
+
+Revision ID: 0008_job_ordering_keys
+Revises: 0007_vendor_resolver_indexes
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import add_missing_columns, create_missing_index
+
+revision = "0008_job_ordering_keys"
+down_revision = "0007_vendor_resolver_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_missing_columns("active_jobs", sa.Column("ordering_key", sa.String(255), nullable=True))
+    create_missing_index("idx_active_jobs_ordering", "active_jobs", ["ordering_key", "status", "created_at"])
+
+
+def downgrade():
+    op.drop_index("idx_active_jobs_ordering", table_name="active_jobs")
+    op.drop_column("active_jobs", "ordering_key")
@@ -0,0 +1,29 @@
+"""indexes for delivery receipts and delivery funnels
+
+Revision ID: 0009_message_delivery_indexes
+Revises: 0008_job_ordering_keys
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+from backend.alembic.helpers import create_missing_index
+
+revision = "0009_message_delivery_indexes"
+down_revision = "0008_job_ordering_keys"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("idx_messages_wa_id", "messages", ["whatsapp_message_id"]),
+    ("idx_messages_org_created", "messages", ["organization_id", "created_at"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        create_missing_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
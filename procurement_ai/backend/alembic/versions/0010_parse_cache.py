@@ -0,0 +1,36 @@
+"""parse_cache table for cached vendor message parses
+
+Revision ID: 0010_parse_cache
+Revises: 0009_message_delivery_indexes
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from backend.alembic.helpers import has_table
+
+revision = "0010_parse_cache"
+down_revision = "0009_message_delivery_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if has_table("parse_cache"):
+        return
+    op.create_table(
+        "parse_cache",
+        sa.Column("key", sa.String(length=64), primary_key=True),
+        sa.Column("prompt_version", sa.String(length=20), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=False),
+        sa.Column("eta", sa.String(length=10), nullable=True),
+        sa.Column("eta_offset_days", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("idx_parse_cache_expires", "parse_cache", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("idx_parse_cache_expires", table_name="parse_cache")
+    op.drop_table("parse_cache")
@@ -16,11 +16,13 @@ from datetime import datetime
 from typing import Optional, List
 
 from fastapi import APIRouter, Depends, HTTPException, Header, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, HttpUrl
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
 from app.models import WebhookEndpoint, OutboundWebhookLog
+from app.services.outbound_webhooks import invalidate_routes
 from app.services.subscription import get_plan, get_full_usage_snapshot
 from app.models import Subscription
 
@@ -94,6 +96,8 @@ def _ep_to_dict(ep: WebhookEndpoint) -> dict:
         "event_filter":    ep.event_filter,
         "has_secret":      bool(ep.secret),
         "is_active":       ep.is_active,
+        "consecutive_failures": ep.consecutive_failures or 0,
+        "disabled_reason": ep.disabled_reason,
         "created_at":      ep.created_at.isoformat() if ep.created_at else None,
         "updated_at":      ep.updated_at.isoformat() if ep.updated_at else None,
     }
@@ -136,6 +140,7 @@ def create_endpoint(
     )
     db.add(ep)
     db.commit()
+    invalidate_routes(org_id)
     logger.info(f"Webhook endpoint created: {ep.url} for org {org_id}")
     return {"message": "Endpoint registered.", "endpoint": _ep_to_dict(ep)}
 
@@ -173,8 +178,15 @@ def update_endpoint(
     if body.event_filter is not None: ep.event_filter = body.event_filter
     if body.secret      is not None: ep.secret        = body.secret
     if body.is_active   is not None: ep.is_active     = body.is_active
+    if body.is_active:
+        # Manual re-activation clears auto-disable state and gives the endpoint a fresh circuit
+        from app.services.webhook_delivery import webhook_engine
+        ep.consecutive_failures = 0
+        ep.disabled_reason      = None
+        webhook_engine.reset_breaker(ep.id)
 
     db.commit()
+    invalidate_routes(org_id)
     return {"message": "Endpoint updated.", "endpoint": _ep_to_dict(ep)}
 
 
@@ -192,6 +204,7 @@ def delete_endpoint(
         raise HTTPException(404, "Endpoint not found.")
     db.delete(ep)
     db.commit()
+    invalidate_routes(org_id)
 
 
 @router.get("/endpoints/{endpoint_id}/logs")
@@ -233,27 +246,31 @@ def get_endpoint_logs(
 
 
 @router.post("/endpoints/{endpoint_id}/test")
-def test_endpoint(
+async def test_endpoint(
     endpoint_id: str,
     org_id: str = Depends(_get_org),
     db:     Session = Depends(get_db),
 ):
     """Send a test ping event to the endpoint and return the delivery result."""
-    ep = db.query(WebhookEndpoint).filter(
-        WebhookEndpoint.id == endpoint_id,
-        WebhookEndpoint.organization_id == org_id,
-    ).first()
+    # Sync SQLAlchemy work runs in the threadpool; only the HTTP delivery is awaited on the loop
+    ep = await run_in_threadpool(
+        lambda: db.query(WebhookEndpoint).filter(
+            WebhookEndpoint.id == endpoint_id,
+            WebhookEndpoint.organization_id == org_id,
+        ).first()
+    )
     if not ep:
         raise HTTPException(404, "Endpoint not found.")
 
     from app.services.outbound_webhooks import fanout_event
-    results = fanout_event(
+    results = await fanout_event(
         db              = db,
         organization_id = org_id,
         event_type      = "TEST_PING",
         data            = {"message": "This is a test delivery from AI Procurement Hub.", "endpoint_id": endpoint_id},
+        endpoint_ids    = [endpoint_id],
     )
-    db.commit()
+    await run_in_threadpool(db.commit)
 
     if not results:
         return {"message": "No active endpoints matched.", "results": []}
@@ -120,12 +120,44 @@ def list_jobs(db: Session = Depends(get_db)):
                 "run_at": job.run_at.isoformat() if job.run_at else None,
                 "payload": job.payload,
                 "retries_remaining": job.retries_remaining,
+                "attempts": job.attempts,
+                "lease_owner": job.lease_owner,
+                "lease_expires_at": job.lease_expires_at.isoformat() if job.lease_expires_at else None,
             }
             for job in jobs
         ]
     }
 
 
+@router.get("/jobs/metrics")
+def get_job_metrics(db: Session = Depends(get_db)):
+    """Queue depth by status plus this process's worker pass counters and per-task latency histograms."""
+    from app.services.worker import worker_queue
+    from app.services.retry_policy import describe_policies
+    from app.services.task_registry import task_registry
+    from app.services.rate_limiter import whatsapp_rate_limiter
+    from app.services.webhook_delivery import webhook_engine
+    from app.services.delivery_status import delivery_statuses
+    from app.services.ai_service import ai_service
+    from app.services.parse_cache import parse_cache
+    from app.core.cache import cache_stats
+    depth = dict(db.query(ActiveJob.status, func.count(ActiveJob.id)).group_by(ActiveJob.status).all())
+    return {
+        "worker_id": worker_queue.worker_id,
+        "queue_depth": depth,
+        "last_pass": worker_queue.last_pass_stats.to_dict(),
+        "totals": worker_queue.total_stats.to_dict(),
+        "retry_policies": describe_policies(),
+        "tasks": task_registry.metrics(),
+        "whatsapp_rate_limits": whatsapp_rate_limiter.snapshot(),
+        "webhook_circuits": webhook_engine.snapshot(),
+        "delivery_receipts": delivery_statuses.snapshot(),
+        "ai_parse_batches": ai_service.batcher.snapshot(),
+        "parse_cache": parse_cache.stats(),
+        "caches": cache_stats(),
+    }
+
+
 @router.get("/tasks/{task_id}/items")
 def get_task_items(task_id: str, db: Session = Depends(get_db)):
     """Returns line items for a specific procurement task."""
@@ -200,6 +232,16 @@ def get_audit_log(
     return {"count": len(rows), "audit_log": rows}
 
 
+@router.get("/messages/funnel")
+def get_delivery_funnel(org_id: str, days: Optional[int] = 30, db: Session = Depends(get_db)):
+    """
+    Outbound WhatsApp delivery funnel (sent -> delivered -> read, plus failed) for an organisation
+    over the last `days` days. One grouped count on idx_messages_org_created.
+    """
+    from app.services.delivery_status import delivery_funnel
+    return delivery_funnel(db, org_id, days=days)
+
+
 @router.get("/stats")
 def get_stats(db: Session = Depends(get_db)):
     """Returns aggregate dashboard statistics from live data."""
@@ -1,28 +1,44 @@
 # file: backend/app/api/webhooks.py
 from fastapi import APIRouter, Depends, Request, Response, status, Header
+from fastapi.responses import JSONResponse
+import asyncio
 import hmac
 import hashlib
 import json
 import logging
-from typing import Optional, Dict, Any
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.core.database import get_db
+from app.core.database import get_db, upsert_insert
 from app.core.observability import get_correlation_id
 from app.models import WebhookEvent
 from app.services.ai_service import ai_service
+from app.services.delivery_status import delivery_statuses
+from app.services.webhook_idempotency import webhook_idempotency
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Simulated in-memory DB tables for webhooks & logs to run offline sandbox mode
-SIMULATED_WEBHOOK_EVENTS_DB: Dict[str, Dict[str, Any]] = {}
-SIMULATED_AUDIT_LOGS: list = []
+def _dicts(value: Any) -> List[Dict[str, Any]]:
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
 
-def first_item(value: Any) -> Optional[Dict[str, Any]]:
-    if isinstance(value, list) and value and isinstance(value[0], dict):
-        return value[0]
-    return None
+def iter_notifications(payload: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Yields ("status" | "message", item, change_value) for every status update and message in
+    every entry and change of a Meta webhook POST, in payload order. Meta batches several of
+    each into one POST under load.
+    """
+    for entry in _dicts(payload.get("entry")):
+        for change in _dicts(entry.get("changes")):
+            value = change.get("value")
+            if not isinstance(value, dict):
+                continue
+            for status_update in _dicts(value.get("statuses")):
+                yield "status", status_update, value
+            for message in _dicts(value.get("messages")):
+                yield "message", message, value
 
 def get_text_body(message_data: Dict[str, Any]) -> str:
     msg_type = message_data.get("type")
@@ -36,35 +52,90 @@ def get_text_body(message_data: Dict[str, Any]) -> str:
             return interactive.get("button_reply", {}).get("title", "")
     return ""
 
-def register_event(
-    db: Session,
-    event_id: str,
-    event_type: str,
-    sender_phone: Optional[str],
-    raw_payload: Dict[str, Any],
-    processed_status: str = "received"
-) -> tuple[WebhookEvent, bool]:
-    existing = db.query(WebhookEvent).filter(WebhookEvent.event_id == event_id).first()
-    if existing is not None:
-        return existing, True
-
-    event = WebhookEvent(
-        event_id=event_id,
-        sender_phone=sender_phone,
-        event_type=event_type,
-        raw_payload=raw_payload,
-        processed_status=processed_status,
-        correlation_id=get_correlation_id()
+def idempotency_key(kind: str, item: Dict[str, Any]) -> Optional[str]:
+    """
+    Messages are keyed by their wamid. Status pings for one outbound message share its wamid
+    (sent, delivered, read), so each (wamid, status) pair is its own event.
+    """
+    event_id = item.get("id")
+    if not event_id or kind != "status":
+        return event_id
+    return f"{event_id}:{item.get('status', 'unknown')}"
+
+def register_events(db: Session, notifications: List[Tuple[str, Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Idempotency ledger for a whole webhook batch. Returns the notifications in order; those
+    with a "result" are not to be dispatched (duplicates, malformed).
+
+    Recent ids are answered in memory (services/webhook_idempotency.py). The rest are written
+    in one INSERT ... ON CONFLICT (event_id) DO NOTHING RETURNING; ids that come back are new.
+    Only conflicting ids are read back, to find earlier deliveries whose processing failed;
+    those are dispatched again.
+    """
+    pending = [
+        {"kind": kind, "item": item, "value": value, "event_id": idempotency_key(kind, item)}
+        for kind, item, value in notifications
+    ]
+
+    correlation_id = get_correlation_id()
+    rows, seen = [], set()
+    for n in pending:
+        event_id, item = n["event_id"], n["item"]
+        if not event_id:
+            n["result"] = {"status": f"missing_{n['kind']}_id_ignored"}
+            continue
+        recent = webhook_idempotency.recent_status(event_id)
+        if event_id in seen or (recent is not None and recent != "failed") or (
+            # Status receipts trust the Bloom filter; a rare false positive only drops one receipt
+            recent is None and n["kind"] == "status" and webhook_idempotency.probably_seen(event_id)
+        ):
+            n["result"] = {"status": "duplicate_bypassed", "event_id": event_id}
+            continue
+        seen.add(event_id)
+        if n["kind"] == "status":
+            event_type, sender_phone = f"status_{item.get('status', 'unknown')}", item.get("recipient_id")
+        else:
+            event_type, sender_phone = "message_received", item.get("from")
+        rows.append({
+            "event_id": event_id,
+            "sender_phone": sender_phone,
+            "event_type": event_type,
+            # The single item with its change's metadata, in Meta's own shape
+            "raw_payload": {**{k: v for k, v in n["value"].items() if k not in ("statuses", "messages")},
+                            "statuses" if n["kind"] == "status" else "messages": [item]},
+            "processed_status": "received",
+            "correlation_id": correlation_id,
+            "created_at": datetime.utcnow(),
+        })
+    if not rows:
+        return pending
+
+    stmt = upsert_insert(db, WebhookEvent).on_conflict_do_nothing(index_elements=[WebhookEvent.event_id])
+    inserted = set(db.execute(stmt.returning(WebhookEvent.event_id), rows).scalars())
+    conflicts = [row["event_id"] for row in rows if row["event_id"] not in inserted]
+    if conflicts:
+        existing = dict(
+            db.query(WebhookEvent.event_id, WebhookEvent.processed_status)
+            .filter(WebhookEvent.event_id.in_(conflicts))
+            .all()
+        )
+        duplicates = {event_id: s for event_id, s in existing.items() if s != "failed"}
+        webhook_idempotency.remember(duplicates)   # Already committed by another delivery
+        for n in pending:
+            if "result" not in n and n["event_id"] in duplicates:
+                n["result"] = {"status": "duplicate_bypassed", "event_id": n["event_id"]}
+        # Conflicting ids not in `duplicates` failed earlier: dispatch them again
+    return pending
+
+def _set_event_status(db: Session, event_ids: List[str], processed_status: str, error: Optional[str] = None) -> None:
+    if not event_ids:
+        return
+    db.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.event_id.in_(event_ids))
+        .values(processed_status=processed_status, error_message=error)
+        .execution_options(synchronize_session=False)
     )
-    db.add(event)
-    db.flush()
-    SIMULATED_WEBHOOK_EVENTS_DB[event_id] = {
-        "event_id": event_id,
-        "sender_phone": sender_phone,
-        "event_type": event_type,
-        "processed_status": processed_status
-    }
-    return event, False
 
 def verify_meta_signature(payload: bytes, signature: str) -> bool:
     """Verifies that webhook payloads are originating from official Meta platforms."""
@@ -104,6 +175,12 @@ async def receive_whatsapp_notification(
     """
     Idempotent Meta Cloud API listener.
     Enforces exact-once processing using database event-log tracking.
+    Every entry, change, status and message in the POST is handled: all event ids are
+    deduplicated in one query, new events are recorded in one INSERT, the new messages are parsed
+    concurrently (batched OpenAI requests), then each message is dispatched in payload order. With WEBHOOK_INBOUND_MODE="async", messages are only queued here
+    (see services/inbound_messages.py) so Meta gets its 200 without waiting on the AI parser.
+    A message whose processing fails is marked failed and the POST answers 500, so Meta's
+    redelivery retries just that message.
     """
     raw_payload = await request.body()
     
@@ -114,127 +191,134 @@ async def receive_whatsapp_notification(
                 status_code=status.HTTP_401_UNAUTHORIZED, 
                 content="Meta signature validation failed."
             )
-            
+
     try:
         payload = json.loads(raw_payload)
-        
-        if not isinstance(payload, dict):
-            return {"status": "invalid_payload_ignored"}
+    except ValueError:
+        return {"status": "invalid_payload_ignored"}
+    if not isinstance(payload, dict):
+        return {"status": "invalid_payload_ignored"}
 
-        entry = first_item(payload.get("entry"))
-        if entry is None:
-            return {"status": "empty_entry_ignored"}
+    notifications = list(iter_notifications(payload))
+    if not notifications:
+        return Response(status_code=status.HTTP_200_OK, content="Unhandled webhook notification type.")
 
-        changes = first_item(entry.get("changes"))
-        if changes is None:
-            return {"status": "empty_changes_ignored"}
+    # 2. Batch idempotency: one IN query, one INSERT
+    pending = register_events(db, notifications)
 
-        value = changes.get("value", {})
-        if not isinstance(value, dict):
-            return {"status": "invalid_value_ignored"}
-        
-        # Route A: Handle Message Status Pings (sent, delivered, read)
-        if "statuses" in value:
-            status_update = first_item(value.get("statuses"))
-            if status_update is None:
-                return {"status": "empty_status_ignored"}
-
-            event_id = status_update.get("id")
-            delivery_status = status_update.get("status", "unknown")
-            if not event_id:
-                return {"status": "missing_status_event_id_ignored"}
-
-            event, duplicate = register_event(
-                db=db,
-                event_id=event_id,
-                event_type=f"status_{delivery_status}",
-                sender_phone=status_update.get("recipient_id"),
-                raw_payload=payload,
-                processed_status="processed"
-            )
-            if duplicate:
-                logger.info(f"Duplicate status event {event_id} bypassed.")
-                return {"status": "duplicate_status_bypassed", "event_id": event_id}
-
-            logger.info(f"Log: Webhook message {event_id} status transitioned to: {delivery_status}")
-            return {"status": "status_logged", "event_id": event_id}
-            
-        # Route B: Handle Inbound Customer Messages
-        if "messages" in value:
-            message_data = first_item(value.get("messages"))
-            if message_data is None:
-                return {"status": "empty_message_ignored"}
-
-            message_id = message_data.get("id")
-            from_phone = message_data.get("from")
-            if not message_id:
-                return {"status": "missing_message_id_ignored"}
-            
-            event, duplicate = register_event(
-                db=db,
-                event_id=message_id,
-                event_type="message_received",
-                sender_phone=from_phone,
-                raw_payload=payload,
-                processed_status="received"
-            )
-            if duplicate:
-                logger.warning(f"DUPLICATE DETECTED: Meta message {message_id} already processed. Bypassing safely.")
-                return {
-                    "success": True,
-                    "status": "duplicate_bypassed",
-                    "event_id": message_id,
-                    "reason": "Retry-safe idempotency guard activated."
-                }
-            
-            text_body = get_text_body(message_data)
-                    
-            if not text_body:
-                SIMULATED_WEBHOOK_EVENTS_DB[message_id]["processed_status"] = "processed"
-                event.processed_status = "processed"
-                return {"status": "unsupported_message_format"}
-                
-            # 3. Process vendor response & assess intents
-            parsed_analysis = ai_service.parse_vendor_message(text_body)
-            
-            # 4. Integrate human-in-the-loop (HITL) routing rules (Priority 5)
-            # Fetch global HITL handler
-            from app.services.hitl_service import hitl_service
-            
-            hitl_result = hitl_service.evaluate_message_for_hitl(
-                phone_number=from_phone,
-                text_content=text_body,
-                analysis=parsed_analysis,
-                db=db
-            )
-            
-            # Mark processing as completely successful in our idempotency ledger
-            SIMULATED_WEBHOOK_EVENTS_DB[message_id]["processed_status"] = "processed"
-            event.processed_status = "processed"
-            
-            return {
-                "received": True,
-                "message_id": message_id,
-                "sender_phone": from_phone,
-                "text": text_body,
-                "ai_analysis": parsed_analysis,
-                "hitl_routing": hitl_result
-            }
-            
-        return Response(status_code=status.HTTP_200_OK, content="Unhandled webhook notification type.")
-        
-    except Exception as e:
-        logger.error(f"Failed to process incoming webhook: {e}")
-        # Log failure in event log
-        if 'message_id' in locals() and message_id in SIMULATED_WEBHOOK_EVENTS_DB:
-            SIMULATED_WEBHOOK_EVENTS_DB[message_id]["processed_status"] = "failed"
-            SIMULATED_WEBHOOK_EVENTS_DB[message_id]["error"] = str(e)
-            event = db.query(WebhookEvent).filter(WebhookEvent.event_id == message_id).first()
-            if event is not None:
-                event.processed_status = "failed"
-                event.error_message = str(e)
-            
-        return Response(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content=f"Internal handler error: {str(e)}"
+    # 3. Inline mode: parse every new text message up front, concurrently, so they share batched
+    #    OpenAI requests (with each other and with concurrent POSTs); routing stays in payload order
+    analyses: Dict[str, Any] = {}
+    if settings.WEBHOOK_INBOUND_MODE != "async":
+        from app.services.inbound_messages import message_received_at
+        from app.services.vendor_resolver import vendor_resolver
+        to_parse = [n for n in pending if "result" not in n and n["kind"] == "message" and get_text_body(n["item"])]
+        results = await asyncio.gather(
+            *(
+                ai_service.parse_vendor_message_async(
+                    get_text_body(n["item"]),
+                    received_at=message_received_at(n["item"].get("timestamp")),
+                    language_hint=vendor_resolver.resolve(db, n["item"]["from"])["language"] if n["item"].get("from") else None,
+                    db=db,
+                )
+                for n in to_parse
+            ),
+            return_exceptions=True,
         )
+        analyses = {n["event_id"]: result for n, result in zip(to_parse, results)}
+
+    # 4. Dispatch in payload order
+    processed, queued = [], []
+    failed = 0
+    for n in pending:
+        if "result" in n:
+            if n["result"]["status"] == "duplicate_bypassed":
+                logger.info(f"Duplicate {n['kind']} event {n['event_id']} bypassed.")
+            continue
+        event_id, item = n["event_id"], n["item"]
+
+        # Route A: Message Status Pings (sent, delivered, read, failed), coalesced then bulk-applied
+        if n["kind"] == "status":
+            delivery_statuses.add(item.get("id"), item.get("status"))
+            processed.append(event_id)
+            n["result"] = {"status": "status_logged", "event_id": event_id}
+            continue
+
+        # Route B: Inbound Vendor Messages
+        from_phone = item.get("from")
+        text_body = get_text_body(item)
+        if not text_body:
+            processed.append(event_id)
+            n["result"] = {"status": "unsupported_message_format", "message_id": event_id}
+            continue
+
+        if settings.WEBHOOK_INBOUND_MODE == "async":
+            # Acknowledge Meta now; parsing, HITL routing and transitions run on the worker
+            from app.services.inbound_messages import enqueue_inbound_message
+            job_id = enqueue_inbound_message(db, event_id, from_phone, text_body, item.get("timestamp"))
+            queued.append(event_id)
+            n["result"] = {"status": "queued", "message_id": event_id, "job_id": job_id}
+            continue
+
+        try:
+            # A failure rolls back only this message's writes
+            with db.begin_nested():
+                n["result"] = _process_message(db, event_id, from_phone, text_body, analyses[event_id])
+            processed.append(event_id)
+        except Exception as e:
+            logger.error(f"Failed to process incoming webhook message {event_id}: {e}")
+            _set_event_status(db, [event_id], "failed", str(e))
+            failed += 1
+            n["result"] = {"status": "failed", "message_id": event_id, "error": str(e)}
+
+    _set_event_status(db, processed, "processed")
+    _set_event_status(db, queued, "queued")
+    if delivery_statuses.due():
+        # A full or stale buffer rides on this request's commit instead of waiting for the flusher
+        try:
+            with db.begin_nested():
+                delivery_statuses.flush(db, commit=False)
+        except Exception as e:
+            logger.error(f"Delivery receipt flush failed: {e}")
+    webhook_idempotency.remember_after_commit(
+        db, {**{event_id: "processed" for event_id in processed}, **{event_id: "queued" for event_id in queued}}
+    )
+
+    body = {
+        "received": True,
+        "summary": {
+            "events": len(pending),
+            "processed": len(processed),
+            "queued": len(queued),
+            "failed": failed,
+            "duplicates": sum(1 for n in pending if n.get("result", {}).get("status") == "duplicate_bypassed"),
+        },
+        "events": [n["result"] for n in pending],
+    }
+    if failed:
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=body)
+    return body
+
+def _process_message(
+    db: Session, message_id: str, from_phone: Optional[str], text_body: str, parsed_analysis: Any
+) -> Dict[str, Any]:
+    if isinstance(parsed_analysis, BaseException):
+        raise parsed_analysis   # The parse failed; fail this message only
+
+    # Integrate human-in-the-loop (HITL) routing rules (Priority 5)
+    from app.services.hitl_service import hitl_service
+
+    hitl_result = hitl_service.evaluate_message_for_hitl(
+        phone_number=from_phone,
+        text_content=text_body,
+        analysis=parsed_analysis,
+        db=db
+    )
+    return {
+        "status": "processed",
+        "message_id": message_id,
+        "sender_phone": from_phone,
+        "text": text_body,
+        "ai_analysis": parsed_analysis,
+        "hitl_routing": hitl_result
+    }
@@ -25,9 +25,60 @@ class Settings(BaseSettings):
     META_WHATSAPP_TOKEN: str = "meta_token_placeholder"
     META_PHONE_NUMBER_ID: str = "phone_id_placeholder"
     META_VERIFY_TOKEN: str = "webhook_verification_token" # Token you set in Meta App dashboard
+    META_GRAPH_API_URL: str = "https://graph.facebook.com/v20.0"  # Point at scripts/mock_graph_api.py offline
+    WHATSAPP_HTTP_MAX_CONNECTIONS: int = 20      # Pooled keep-alive connections to the Graph API
+    WHATSAPP_HTTP_TIMEOUT_SECONDS: float = 10.0  # Per-request read/write/pool timeout
+    WHATSAPP_MESSAGES_PER_SECOND: float = 80.0   # Business number throughput tier (per worker process)
+    WHATSAPP_PAIR_INTERVAL_SECONDS: float = 6.0  # Min spacing between messages to one recipient
+    WHATSAPP_PAIR_BURST: int = 1                 # Messages a recipient may receive back-to-back
+    WEBHOOK_INBOUND_MODE: str = "inline"         # "async": ack inbound messages at once, process on the worker
+    WEBHOOK_IDEMPOTENCY_LRU_SIZE: int = 100000           # Recent webhook event ids answered without the DB
+    WEBHOOK_IDEMPOTENCY_BLOOM_CAPACITY: int = 1000000    # Ids per Bloom filter generation (two are kept)
+    WEBHOOK_IDEMPOTENCY_BLOOM_ERROR_RATE: float = 0.001  # False-positive rate; trusted only for status pings
+    WHATSAPP_STATUS_FLUSH_SECONDS: float = 2.0   # Max time a delivery receipt waits in the coalescing buffer
+    WHATSAPP_STATUS_FLUSH_SIZE: int = 500        # Buffered messages that trigger an immediate flush
+    WHATSAPP_STATUS_UNMATCHED_FLUSHES: int = 10  # Flushes a receipt for a not-yet-committed message is retried in
     
+    # Workflow state machine
+    WORKFLOW_CAS_MAX_RETRIES: int = 3           # Optimistic transitions: re-reads after a version conflict
+    PROJECTION_SNAPSHOT_EVERY: int = 50         # Events replayed between stored WorkflowSnapshot rows
+    VENDOR_RESOLVER_CACHE_SIZE: int = 50000     # Vendor phones with a cached inbound-message context
+    VENDOR_RESOLVER_TTL_SECONDS: float = 60.0   # Max staleness of another process's cached vendor context
+
+    # PO ingestion
+    INGESTION_CHUNK_ROWS: int = 5000            # Rows per streamed CSV/XLSX chunk
+    INGESTION_WRITE_BATCH_POS: int = 1000       # POs written per set-based upsert batch
+    INGESTION_SPOOL_DIR: str = "./import_spool" # Uploads awaiting background import, plus their NDJSON logs
+    INGESTION_IMPORT_SLICE_POS: int = 10000     # POs imported per process_import job before it checkpoints
+
+    # Outbound customer webhooks
+    WEBHOOK_HTTP_MAX_CONNECTIONS: int = 50      # Shared connection pool across all endpoints
+    WEBHOOK_TIMEOUT_SECONDS: float = 5.0        # Per-request timeout
+    WEBHOOK_INLINE_RETRIES: int = 2             # Quick retries inside one delivery job (transient errors)
+    WEBHOOK_BREAKER_FAILURES: int = 5           # Consecutive failures that open an endpoint's circuit
+    WEBHOOK_BREAKER_RESET_SECONDS: float = 60.0 # Open circuit cool-down before a half-open probe
+    WEBHOOK_AUTO_DISABLE_FAILURES: int = 50     # Consecutive failed deliveries before auto-disable
+    WEBHOOK_ROUTE_CACHE_TTL_SECONDS: float = 60.0  # Max staleness of another process's cached endpoint routing
+
+    # Durable worker queue (active_jobs leasing)
+    WORKER_BATCH_SIZE: int = 50          # Max jobs claimed per worker pass
+    WORKER_CONCURRENCY: int = 8          # Max claimed jobs executed concurrently per process
+    WORKER_LEASE_SECONDS: int = 120      # Lease length before a running job is reclaimable
+    WORKER_IDLE_POLL_SECONDS: int = 60   # Safety-net poll when no wakeup or scheduled run_at arrives
+    WORKER_COMMIT_BATCH_SIZE: int = 20   # Job outcomes grouped per status commit
+    WORKER_THREAD_POOL_SIZE: int = 8     # Threads for kind="io" (blocking I/O) tasks
+    WORKER_PROCESS_POOL_SIZE: int = 2    # Processes for kind="cpu" tasks
+
     # LLM Settings
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None       # Point at scripts/mock_openai_api.py offline
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    AI_PARSE_BATCH_SIZE: int = 16               # Vendor messages per batched completion (1 disables batching)
+    AI_PARSE_BATCH_WINDOW_MS: float = 250.0     # Max time a message waits for others to share its request
+    AI_PARSE_TIMEOUT_SECONDS: float = 30.0      # Per batched completion request
+    PARSE_CACHE_LRU_SIZE: int = 20000           # Parse results cached in process, by normalized text
+    PARSE_CACHE_TTL_SECONDS: float = 604800.0   # Lifetime of a cached parse in both tiers (7 days)
+    PARSE_CACHE_PURGE_INTERVAL_SECONDS: int = 3600  # Between purges of expired parse_cache rows
 
     # Razorpay (billing)
     RAZORPAY_KEY_ID: Optional[str] = None
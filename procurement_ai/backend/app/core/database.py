@@ -43,6 +43,14 @@ except Exception as e:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def upsert_insert(db: Session, model):
+    """Dialect-specific INSERT supporting on_conflict_do_update/do_nothing (PostgreSQL or SQLite)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
+
 @contextmanager
 def get_db_session():
     """Provides a transactional database session scope with automatic rollback and close."""
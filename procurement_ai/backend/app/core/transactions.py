@@ -0,0 +1,53 @@
+# file: backend/app/core/transactions.py
+"""
+Side effects deferred until a Session's outermost transaction ends.
+
+SQLAlchemy fires after_commit / after_rollback for SAVEPOINTs too: releasing
+or rolling back a Session.begin_nested() block (the webhook handler opens one
+per message) looks like a commit or rollback to a plain listener. Services that
+must act only once their writes are durable queue the work in `session.info`
+under their own key and register one callback here:
+
+    after_outer_commit(_PENDING_KEY, apply)    # apply(session, pending) on the outermost COMMIT
+
+The single listener below runs the callbacks only when the outermost
+transaction commits and drops every registered key when it rolls back.
+Savepoint boundaries are ignored, so work queued inside a savepoint that later
+rolls back is still applied on commit. Every current user tolerates that (an
+extra worker wakeup, cache invalidation or cache row).
+"""
+import logging
+from typing import Any, Callable, Dict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_CALLBACKS: Dict[str, Callable[[Session, Any], None]] = {}
+
+
+def after_outer_commit(key: str, callback: Callable[[Session, Any], None]) -> None:
+    """Calls `callback(session, session.info[key])` after the outermost commit of any session that set `key`."""
+    _CALLBACKS[key] = callback
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_outer_commit(session: Session) -> None:
+    if session.in_nested_transaction():
+        return   # A released SAVEPOINT; the outer transaction can still roll back
+    for key, callback in list(_CALLBACKS.items()):
+        pending = session.info.pop(key, None)
+        if pending:
+            try:
+                callback(session, pending)
+            except Exception as e:
+                logger.error(f"After-commit hook '{key}' failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_outer_rollback(session: Session) -> None:
+    if session.in_nested_transaction():
+        return   # A rolled back SAVEPOINT; earlier work in the transaction may still commit
+    for key in _CALLBACKS:
+        session.info.pop(key, None)
@@ -52,17 +52,24 @@ if frontend_dir.exists():
 async def start_worker_loop():
     import asyncio
     import logging
+    from datetime import datetime
     from app.services.worker import worker_queue
-    from app.core.database import SessionLocal
+    from app.services.job_notifier import job_notifier, start_postgres_listener
+    from app.core.database import SessionLocal, engine
 
     logger = logging.getLogger("app.worker_loop")
+    # Wakeups: in-process after enqueue commits, cross-process via Postgres LISTEN/NOTIFY
+    job_notifier.attach()
+    start_postgres_listener(engine)
     logger.info("Background worker loop started.")
     while True:
+        next_due_at = None
         try:
             db = SessionLocal()
             try:
                 await worker_queue.execute_pending_jobs(db=db)
                 db.commit()
+                next_due_at = worker_queue.next_due_at(db)
             except Exception as e:
                 db.rollback()
                 logger.error(f"Error executing pending jobs in worker loop: {e}")
@@ -70,7 +77,12 @@ async def start_worker_loop():
                 db.close()
         except Exception as e:
             logger.error(f"Error in background worker session: {e}")
-        await asyncio.sleep(5)
+
+        # Sleep until the earliest scheduled job (or an enqueue wakeup), capped by the idle safety poll
+        timeout = settings.WORKER_IDLE_POLL_SECONDS
+        if next_due_at is not None:
+            timeout = min(timeout, max(0.0, (next_due_at - datetime.utcnow()).total_seconds()))
+        await job_notifier.wait(timeout=timeout)
 
 
 @app.on_event("startup")
@@ -95,6 +107,40 @@ async def startup_init_db():
     # Start periodic background worker task (requires async context)
     asyncio.create_task(start_worker_loop())
 
+    # Applies coalesced WhatsApp delivery receipts every WHATSAPP_STATUS_FLUSH_SECONDS
+    from app.services.delivery_status import run_status_flusher
+    asyncio.create_task(run_status_flusher(SessionLocal))
+
+    # Deletes expired parse_cache rows every PARSE_CACHE_PURGE_INTERVAL_SECONDS
+    from app.services.parse_cache import run_parse_cache_purger
+    asyncio.create_task(run_parse_cache_purger(SessionLocal))
+
+
+@app.on_event("shutdown")
+async def shutdown_task_executors():
+    """Flushes buffered delivery receipts and parse cache writes, then releases the task registry's pools and pooled HTTP/OpenAI connections."""
+    import asyncio
+    import logging
+    from app.core.database import SessionLocal
+    from app.services.delivery_status import delivery_statuses
+    from app.services.ai_service import ai_service
+    from app.services.parse_cache import parse_cache
+    from app.services.task_registry import task_registry
+    from app.services.whatsapp_sender import whatsapp_sender
+    from app.services.webhook_delivery import webhook_engine
+    db = SessionLocal()
+    try:
+        await asyncio.to_thread(delivery_statuses.flush, db)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Final delivery receipt flush failed: {e}")
+    finally:
+        db.close()
+    await parse_cache.drain()
+    task_registry.shutdown()
+    await whatsapp_sender.aclose()
+    await webhook_engine.aclose()
+    await ai_service.aclose()
+
 @app.get("/")
 def read_root():
     return {
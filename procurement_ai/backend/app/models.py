@@ -222,15 +222,86 @@ class ActiveJob(Base):
     run_at = Column(DateTime, nullable=False)
     status = Column(String(50), default="queued") # 'queued', 'running', 'completed', 'failed'
     retries_remaining = Column(Integer, default=3)
+    attempts = Column(Integer, default=0)                 # Executions so far; drives exponential backoff
+    retry_policy = Column(JSON, nullable=True)            # Per-job RetryPolicy override (null = task default)
+    lease_owner = Column(String(255), nullable=True)      # Worker id holding the claim while 'running'
+    lease_expires_at = Column(DateTime, nullable=True)    # Stale leases past this point are reclaimed
+    ordering_key = Column(String(255), nullable=True)     # Jobs sharing a key run one at a time, in order
     correlation_id = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 Index("idx_webhook_event_id", WebhookEvent.event_id)
+Index("idx_workflow_events_wf_created", WorkflowEvent.workflow_id, WorkflowEvent.created_at)
 Index("idx_workflows_org_po", ProcurementWorkflow.organization_id, ProcurementWorkflow.po_number)
+# Inbound message resolution (services/vendor_resolver.py)
+Index("idx_vendors_whatsapp", Vendor.phone_number)   # Same index as schema.sql
+Index("idx_tasks_vendor_created", ProcurementTask.vendor_id, ProcurementTask.created_at)
+Index("idx_workflows_org_created", ProcurementWorkflow.organization_id, ProcurementWorkflow.created_at)
+# Delivery receipts (services/delivery_status.py) and per-org delivery funnels
+Index("idx_messages_wa_id", Message.whatsapp_message_id)
+Index("idx_messages_org_created", Message.organization_id, Message.created_at)
 Index("idx_hitl_status", HITLDraft.status)
 Index("idx_active_jobs_status_run", ActiveJob.status, ActiveJob.run_at)
+Index("idx_active_jobs_status_lease", ActiveJob.status, ActiveJob.lease_expires_at)
+Index("idx_active_jobs_ordering", ActiveJob.ordering_key, ActiveJob.status, ActiveJob.created_at)
 
 
+class WorkflowSnapshot(Base):
+    """Projection of a workflow's event stream up to `last_event_at` (see services/projections.py)."""
+    __tablename__ = "workflow_snapshots"
+    id              = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    organization_id = Column(String, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
+    workflow_id     = Column(String, ForeignKey("procurement_workflows.id", ondelete="CASCADE"), nullable=False)
+    state           = Column(JSON, nullable=False)            # Projected workflow state
+    event_count     = Column(Integer, nullable=False)         # Events folded into `state`
+    last_event_at   = Column(DateTime, nullable=False)
+    last_event_ids  = Column(JSON, default=list)              # Folded events stamped exactly last_event_at
+    created_at      = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_workflow_snapshots_wf_at", "workflow_id", "last_event_at"),
+    )
+
+
+class ImportJob(Base):
+    """A PO upload spooled to disk and ingested in checkpointed slices by the `process_import` task."""
+    __tablename__ = "import_jobs"
+    id              = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    organization_id = Column(String, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
+    filename        = Column(String(255), nullable=False)
+    spool_path      = Column(Text, nullable=False)
+    status          = Column(String(50), default="queued")   # queued | running | completed | failed
+    records_done    = Column(Integer, default=0)             # Checkpoint: parsed PO records committed so far
+    rows_processed  = Column(Integer, default=0)
+    pos_imported    = Column(Integer, default=0)
+    pos_skipped     = Column(Integer, default=0)
+    log_offset      = Column(Integer, default=0)             # Committed length of the NDJSON log file
+    current_job_id  = Column(String, nullable=True)          # active_jobs row running the next slice
+    error_message   = Column(Text, nullable=True)
+    created_at      = Column(DateTime, default=datetime.utcnow)
+    started_at      = Column(DateTime, nullable=True)
+    finished_at     = Column(DateTime, nullable=True)
+    updated_at      = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_import_jobs_org_created", "organization_id", "created_at"),
+    )
+
+class ParseCacheEntry(Base):
+    """Shared tier of the vendor message parse cache (see services/parse_cache.py)."""
+    __tablename__ = "parse_cache"
+    key             = Column(String(64), primary_key=True)   # sha256(prompt version, language hint, normalized text)
+    prompt_version  = Column(String(20), nullable=False)
+    result          = Column(JSON, nullable=False)           # Parse without extracted_eta
+    eta             = Column(String(10), nullable=True)      # Explicit ETA, served as-is
+    eta_offset_days = Column(Integer, nullable=True)         # Relative ETA: days after the message date
+    created_at      = Column(DateTime, default=datetime.utcnow)
+    expires_at      = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("idx_parse_cache_expires", "expires_at"),
+    )
+
 # ─────────────────────────────────────────────────────────────────
 # Subscription billing models
 # ─────────────────────────────────────────────────────────────────
@@ -299,6 +370,8 @@ class WebhookEndpoint(Base):
     event_filter    = Column(Text, nullable=True)
     secret          = Column(String(255), nullable=True)   # HMAC signing secret
     is_active       = Column(Boolean, default=True)
+    consecutive_failures = Column(Integer, default=0)      # Reset on success; auto-disable past WEBHOOK_AUTO_DISABLE_FAILURES
+    disabled_reason = Column(String(255), nullable=True)   # Set when the platform deactivates the endpoint
     created_at      = Column(DateTime, default=datetime.utcnow)
     updated_at      = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
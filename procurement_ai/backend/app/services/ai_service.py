@@ -1,24 +1,158 @@
 # file: backend/app/services/ai_service.py
+import asyncio
 import json
 import logging
 import os
 import re
-from typing import Any, Dict
+import weakref
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
 
 from app.core.config import settings
+from app.services.parse_cache import parse_cache
 
 logger = logging.getLogger(__name__)
 
+INTENTS = {"ack_po", "provide_eta", "delay_notice", "price_discrepancy", "general_query"}
+RESULT_FIELDS = ("intent", "extracted_eta", "delay_flag", "reason", "language")
+SYSTEM_PROMPT = "You are a helpful structured extraction assistant."
+PROMPT_VERSION = "2"   # Part of every parse cache key: bump whenever the prompts or model change
+
+# Sent once per request: in a batch the instructions are shared by every message
+EXTRACTION_RULES = """You are a procurement coordinator for a manufacturing factory in Gujarat, India.
+For each WhatsApp message from a vendor, extract:
+1. Intent, one of: ack_po, provide_eta, delay_notice, price_discrepancy, general_query.
+2. Extracted ETA in YYYY-MM-DD if a date is mentioned. Resolve relative dates ("kal", "next week") against the message date.
+3. delay_flag as true when delivery is delayed.
+4. reason for delays, stock issues, or price disputes.
+5. dominant language: en, gu, or hi. A language hint, when given, is the vendor's usual language."""
+
+BATCH_PROMPT = """{rules}
+
+Return exactly one JSON object with one result per message, in any order:
+{{"results": [{{"index": 0, "intent": "provide_eta", "extracted_eta": "2026-05-28", "delay_flag": false, "reason": null, "language": "gu"}}]}}
+
+Messages:
+{messages}"""
+
+
+@dataclass
+class _PendingBatch:
+    items: List[Dict[str, Any]] = field(default_factory=list)
+    futures: List[asyncio.Future] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class ParseBatcher:
+    """
+    Micro-batches parse requests. The first request on an event loop opens a batch that is sent
+    `max_wait` seconds later, or as soon as it holds `max_size` messages; every caller then gets
+    its own item of the one response. Items the model dropped or mangled, and whole batches
+    that failed, are answered by `fallback(item)` instead.
+    """
+
+    def __init__(
+        self,
+        parse_batch: Callable[[List[Dict[str, Any]]], Awaitable[List[Optional[Dict[str, Any]]]]],
+        fallback: Callable[[Dict[str, Any]], Dict[str, Any]],
+        max_size: int,
+        max_wait: float,
+    ):
+        self._parse_batch = parse_batch
+        self._fallback = fallback
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self._pending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _PendingBatch]" = weakref.WeakKeyDictionary()
+        self._running: set = set()
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+
+    async def submit(self, item: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """The parse of `item`, and whether it came from the model (False: fallback)."""
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(loop)
+        if batch is None:
+            batch = self._pending[loop] = _PendingBatch()
+            batch.timer = loop.call_later(self.max_wait, self._dispatch, loop)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_size:
+            self._dispatch(loop)
+        return await future
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop) -> None:
+        batch = self._pending.pop(loop, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = loop.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: _PendingBatch) -> None:
+        self.batches += 1
+        self.items += len(batch.items)
+        try:
+            results = await self._parse_batch(batch.items)
+        except Exception as e:
+            logger.error(f"Batched vendor message parse of {len(batch.items)} message(s) failed: {e}")
+            results = []
+        for i, (item, future) in enumerate(zip(batch.items, batch.futures)):
+            result = results[i] if i < len(results) else None
+            from_model = result is not None
+            if not from_model:
+                self.fallbacks += 1
+                result = self._fallback(item)
+            if not future.done():   # The caller may have timed out meanwhile
+                future.set_result((result, from_model))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "fallbacks": self.fallbacks,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+        }
+
 
 class AIService:
-    def __init__(self):
+    def __init__(self, api_key: Optional[str] = None, http_client: Optional[httpx.AsyncClient] = None):
         # Fall back gracefully if no key is provided during offline sandbox runs.
-        self.api_key = settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key) if self.api_key else None
+        self.api_key = api_key or settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
+        self.client = OpenAI(api_key=self.api_key, base_url=settings.OPENAI_BASE_URL) if self.api_key else None
+        self._http_client = http_client
+        self._async_client: Optional[AsyncOpenAI] = None
+        self.batcher = ParseBatcher(
+            self._parse_batch,
+            lambda item: self._mock_rule_based_parser(item["text"]),
+            max_size=settings.AI_PARSE_BATCH_SIZE,
+            max_wait=settings.AI_PARSE_BATCH_WINDOW_MS / 1000,
+        )
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=self._http_client,
+                timeout=settings.AI_PARSE_TIMEOUT_SECONDS,
+                max_retries=1,   # The rule-based fallback beats a long retry chain
+            )
+        return self._async_client
 
-    def parse_vendor_message(self, message_text: str) -> Dict[str, Any]:
+    def parse_vendor_message(
+        self,
+        message_text: str,
+        received_on: Optional[date] = None,
+        language_hint: Optional[str] = None,
+    ) -> Dict[str, Any]:
         """
         Parses unstructured messages from factory vendors.
         Extracts intent, estimated delivery date (ETA), and potential delays.
@@ -28,18 +162,19 @@ class AIService:
             return self._mock_rule_based_parser(message_text)
 
         try:
-            prompt = f"""
-            You are a procurement coordinator for a manufacturing factory in Gujarat, India.
+            return self._complete_one(message_text, received_on or datetime.utcnow().date(), language_hint)
+        except Exception as e:
+            logger.error(f"Error parsing vendor message via OpenAI: {e}")
+            return self._mock_rule_based_parser(message_text)
+
+    def _complete_one(self, message_text: str, received_on: date, language_hint: Optional[str]) -> Dict[str, Any]:
+        prompt = f"""{EXTRACTION_RULES}
+
+            Message date: {received_on.isoformat()}
+            Language hint: {language_hint or "none"}
             Analyze this incoming WhatsApp message from a vendor:
             "{message_text}"
 
-            Extract:
-            1. Intent, one of: ack_po, provide_eta, delay_notice, price_discrepancy, general_query.
-            2. Extracted ETA in YYYY-MM-DD if a date is mentioned. Assume current date is 2026-05-25.
-            3. delay_flag as true when delivery is delayed.
-            4. reason for delays, stock issues, or price disputes.
-            5. dominant language: en, gu, or hi.
-
             Return exactly one JSON object:
             {{
                 "intent": "provide_eta",
@@ -50,22 +185,80 @@ class AIService:
             }}
             """
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful structured extraction assistant."},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.0,
-                response_format={"type": "json_object"},
+        response = self.client.chat.completions.create(
+            model=settings.OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.0,
+            response_format={"type": "json_object"},
+        )
+        return json.loads(response.choices[0].message.content)
+
+    async def parse_vendor_message_async(
+        self,
+        message_text: str,
+        received_at: Optional[datetime] = None,
+        language_hint: Optional[str] = None,
+        db: Optional[Any] = None,
+    ) -> Dict[str, Any]:
+        """
+        parse_vendor_message for async callers. Repeat texts are answered from the parse cache
+        (in-process LRU, then the parse_cache table when `db` is given), with relative ETAs
+        re-resolved against `received_at`. Other messages arriving within AI_PARSE_BATCH_WINDOW_MS
+        of each other share one completion request (see ParseBatcher). Without an API key it runs
+        parse_vendor_message in a thread, uncached.
+        """
+        if not self.client:
+            return await asyncio.to_thread(self.parse_vendor_message, message_text)
+
+        received_on = (received_at or datetime.utcnow()).date()
+        cached = parse_cache.lookup(db, PROMPT_VERSION, message_text, language_hint, received_on)
+        if cached is not None:
+            return cached
+
+        if self.batcher.max_size <= 1:
+            try:
+                result = await asyncio.to_thread(self._complete_one, message_text, received_on, language_hint)
+                from_model = True
+            except Exception as e:
+                logger.error(f"Error parsing vendor message via OpenAI: {e}")
+                result, from_model = self._mock_rule_based_parser(message_text), False
+        else:
+            result, from_model = await self.batcher.submit(
+                {"text": message_text, "date": received_on.isoformat(), "language_hint": language_hint}
             )
+        if from_model:   # Fallback parses are never cached
+            parse_cache.store(db, PROMPT_VERSION, message_text, language_hint, received_on, result)
+        return result
 
-            result = response.choices[0].message.content
-            return json.loads(result)
+    async def _parse_batch(self, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """One completion for several messages; None for any message without a valid result."""
+        messages = json.dumps([{"index": i, **item} for i, item in enumerate(items)], ensure_ascii=False)
+        response = await self.async_client.chat.completions.create(
+            model=settings.OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": BATCH_PROMPT.format(rules=EXTRACTION_RULES, messages=messages)},
+            ],
+            temperature=0.0,
+            response_format={"type": "json_object"},
+        )
+        body = json.loads(response.choices[0].message.content)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        for item in body.get("results", []) if isinstance(body, dict) else []:
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index")
+            if isinstance(index, int) and 0 <= index < len(items) and item.get("intent") in INTENTS:
+                results[index] = {key: item.get(key) for key in RESULT_FIELDS}
+        return results
 
-        except Exception as e:
-            logger.error(f"Error parsing vendor message via OpenAI: {e}")
-            return self._mock_rule_based_parser(message_text)
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
 
     def generate_multilingual_followup(
         self,
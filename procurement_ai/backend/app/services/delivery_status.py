@@ -0,0 +1,213 @@
+# file: backend/app/services/delivery_status.py
+"""
+Applies Meta delivery receipts (sent / delivered / read / failed) to
+Message.delivery_status.
+
+Receipts are the highest-volume webhook traffic: three per outbound message,
+often redelivered. The webhook handler only adds them to a per-process buffer
+that keeps the highest status per whatsapp_message_id. The buffer is flushed
+every WHATSAPP_STATUS_FLUSH_SECONDS, or sooner once it holds
+WHATSAPP_STATUS_FLUSH_SIZE messages, as one UPDATE per status:
+
+    UPDATE messages SET delivery_status = 'read'
+    WHERE whatsapp_message_id IN (...) AND <rank of delivery_status> < 4
+
+The rank guard keeps statuses monotonic across processes and out-of-order
+receipts. Meta can deliver a receipt before the outbox job that sent the
+message has committed its Message row. A receipt that matches no row stays
+buffered for up to WHATSAPP_STATUS_UNMATCHED_FLUSHES flushes, then is dropped.
+A crash loses at most one window of buffered receipts; the
+WebhookEvent rows for them are already committed.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# A later receipt never moves a message backwards; "failed" outranks only "sent"
+STATUS_RANK: Dict[str, int] = {"sent": 1, "failed": 2, "delivered": 3, "read": 4}
+
+
+class DeliveryStatusBuffer:
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._pending: Dict[str, str] = {}   # whatsapp_message_id -> highest status seen
+        self._unmatched: Dict[str, int] = {}   # whatsapp_message_id -> flushes that found no Message row
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._clock = clock
+        self.received = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.flushes = 0
+        self.requeued = 0
+        self.dropped = 0
+
+    def add(self, whatsapp_message_id: str, status: str) -> None:
+        rank = STATUS_RANK.get(status)
+        if rank is None or not whatsapp_message_id:
+            return
+        with self._lock:
+            self.received += 1
+            current = self._pending.get(whatsapp_message_id)
+            if current is not None:
+                self.coalesced += 1
+                if STATUS_RANK[current] >= rank:
+                    return
+            self._pending[whatsapp_message_id] = status
+            if self._oldest is None:
+                self._oldest = self._clock()
+
+    def due(self) -> bool:
+        with self._lock:
+            if not self._pending:
+                return False
+            return (
+                len(self._pending) >= settings.WHATSAPP_STATUS_FLUSH_SIZE
+                or self._clock() - self._oldest >= settings.WHATSAPP_STATUS_FLUSH_SECONDS
+            )
+
+    def _take(self) -> Dict[str, str]:
+        with self._lock:
+            pending, self._pending, self._oldest = self._pending, {}, None
+            return pending
+
+    def _restore(self, pending: Dict[str, str]) -> None:
+        for whatsapp_message_id, status in pending.items():
+            self.add(whatsapp_message_id, status)
+
+    def _requeue_unmatched(self, pending: Dict[str, str], matched: set) -> None:
+        """Keeps receipts whose Message row is not committed yet for a bounded number of flushes."""
+        with self._lock:
+            for whatsapp_message_id, status in pending.items():
+                if whatsapp_message_id in matched:
+                    self._unmatched.pop(whatsapp_message_id, None)
+                    continue
+                misses = self._unmatched.get(whatsapp_message_id, 0) + 1
+                if misses > settings.WHATSAPP_STATUS_UNMATCHED_FLUSHES:
+                    self._unmatched.pop(whatsapp_message_id, None)
+                    self.dropped += 1
+                    continue
+                self._unmatched[whatsapp_message_id] = misses
+                self.requeued += 1
+                current = self._pending.get(whatsapp_message_id)
+                if current is None or STATUS_RANK[current] < STATUS_RANK[status]:
+                    self._pending[whatsapp_message_id] = status
+                if self._oldest is None:
+                    self._oldest = self._clock()
+
+    def flush(self, db: Session, commit: bool = True) -> int:
+        """
+        Applies the buffered receipts with one UPDATE per status; returns the messages updated.
+        With commit=False the UPDATEs join the caller's transaction (the webhook request's).
+        """
+        from app.models import Message
+
+        pending = self._take()
+        if not pending:
+            return 0
+        by_status: Dict[str, list] = {}
+        for whatsapp_message_id, status in pending.items():
+            by_status.setdefault(status, []).append(whatsapp_message_id)
+
+        current_rank = case(STATUS_RANK, value=Message.delivery_status, else_=0)
+        updated = 0
+        try:
+            for status, ids in by_status.items():
+                updated += db.execute(
+                    update(Message)
+                    .where(Message.whatsapp_message_id.in_(ids), current_rank < STATUS_RANK[status])
+                    .values(delivery_status=status)
+                    .execution_options(synchronize_session=False)
+                ).rowcount or 0
+            matched = set(db.execute(
+                select(Message.whatsapp_message_id).where(Message.whatsapp_message_id.in_(list(pending)))
+            ).scalars())
+            if commit:
+                db.commit()
+        except Exception:
+            if commit:
+                db.rollback()
+            self._restore(pending)   # Retried on the next flush
+            raise
+        self._requeue_unmatched(pending, matched)
+        with self._lock:   # Flushes run on the flusher's thread as well as in webhook requests
+            self.applied += updated
+            self.flushes += 1
+        logger.info(f"Delivery receipts: {len(pending)} message(s) in {len(by_status)} UPDATE(s), {updated} changed")
+        return updated
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending":   len(self._pending),
+                "received":  self.received,
+                "coalesced": self.coalesced,
+                "applied":   self.applied,
+                "flushes":   self.flushes,
+                "requeued":  self.requeued,
+                "dropped":   self.dropped,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending, self._unmatched, self._oldest = {}, {}, None
+            self.received = self.coalesced = self.applied = self.flushes = self.requeued = self.dropped = 0
+
+
+delivery_statuses = DeliveryStatusBuffer()
+
+
+async def run_status_flusher(session_factory: Callable[[], Session]) -> None:
+    """Background loop flushing the buffer whenever it is due (started with the worker loop)."""
+    interval = max(0.05, settings.WHATSAPP_STATUS_FLUSH_SECONDS / 4)
+    while True:
+        await asyncio.sleep(interval)
+        if not delivery_statuses.due():
+            continue
+        db = session_factory()
+        try:
+            await asyncio.to_thread(delivery_statuses.flush, db)   # Blocking UPDATEs + commit stay off the event loop
+        except Exception as e:
+            logger.error(f"Delivery receipt flush failed: {e}")
+        finally:
+            db.close()
+
+
+def delivery_funnel(db: Session, organization_id: str, days: Optional[int] = None) -> Dict[str, Any]:
+    """Outbound WhatsApp messages of an org by furthest delivery stage, with conversion rates."""
+    from app.models import Message
+
+    query = (
+        db.query(Message.delivery_status, func.count(Message.id))
+        .filter(Message.organization_id == organization_id, Message.whatsapp_message_id.isnot(None))
+    )
+    if days:
+        query = query.filter(Message.created_at >= datetime.utcnow() - timedelta(days=days))
+    counts = {status: 0 for status in STATUS_RANK}
+    for status, count in query.group_by(Message.delivery_status).all():
+        counts[status if status in counts else "sent"] += count
+
+    total = sum(counts.values())
+    delivered = counts["delivered"] + counts["read"]   # A read message was delivered
+    return {
+        "organization_id": organization_id,
+        "days":            days,
+        "sent":            total,
+        "delivered":       delivered,
+        "read":            counts["read"],
+        "failed":          counts["failed"],
+        "delivery_rate":   round(delivered / total, 4) if total else None,
+        "read_rate":       round(counts["read"] / delivered, 4) if delivered else None,
+        "failure_rate":    round(counts["failed"] / total, 4) if total else None,
+    }
@@ -7,6 +7,7 @@ from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
 
 from app.services.state_machine import WorkflowState, state_machine
+from app.services.vendor_resolver import vendor_resolver
 
 logger = logging.getLogger(__name__)
 
@@ -17,35 +18,7 @@ SIMULATED_PENDING_APPROVALS: List[Dict[str, Any]] = []
 
 class HITLService:
     def _resolve_workflow_context(self, phone_number: str, db: Session) -> Dict[str, Optional[str]]:
-        from app.models import ProcurementTask, ProcurementWorkflow, Vendor
-
-        vendor = db.query(Vendor).filter(Vendor.phone_number == phone_number).first()
-        organization_id = vendor.organization_id if vendor else None
-        workflow = None
-        task = None
-
-        if vendor is not None:
-            task = db.query(ProcurementTask).filter(
-                ProcurementTask.vendor_id == vendor.id
-            ).order_by(ProcurementTask.created_at.desc()).first()
-            if task is not None:
-                workflow = db.get(ProcurementWorkflow, task.workflow_id)
-
-        if workflow is None and organization_id is not None:
-            workflow = db.query(ProcurementWorkflow).filter(
-                ProcurementWorkflow.organization_id == organization_id,
-                ProcurementWorkflow.current_state.notin_([
-                    WorkflowState.COMPLETED.value,
-                    WorkflowState.CANCELLED.value,
-                ]),
-            ).order_by(ProcurementWorkflow.created_at.desc()).first()
-
-        return {
-            "organization_id": organization_id or (workflow.organization_id if workflow else None),
-            "workflow_id": workflow.id if workflow else None,
-            "task_id": task.id if task is not None else None,
-            "vendor_id": vendor.id if vendor else None,
-        }
+        return vendor_resolver.resolve(db, phone_number)
 
     def evaluate_message_for_hitl(
         self,
@@ -161,6 +134,7 @@ class HITLService:
                         target_state=target_state,
                         organization_id=workflow_context["organization_id"],
                         reason=reason,
+                        optimistic=True,   # Vendor message bursts on one PO must not queue on its row lock
                     )
                 except ValueError as exc:
                     logger.warning(f"HITL workflow transition skipped for draft {draft_id}: {exc}")
@@ -219,6 +193,7 @@ class HITLService:
                             organization_id=organization_id,
                             user_id=approver_user_id,
                             reason="HITL Coordinator manual override approval.",
+                            optimistic=True,
                         )
                 except ValueError as exc:
                     logger.warning(f"HITL approval state transition skipped for draft {draft_id}: {exc}")
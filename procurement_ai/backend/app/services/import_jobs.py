@@ -0,0 +1,247 @@
+# file: backend/app/services/import_jobs.py
+"""
+Background PO imports for large Excel/CSV uploads.
+
+POST /ingestion/imports spools the upload to INGESTION_SPOOL_DIR and returns an
+import id at once. The `process_import` task then ingests the file in slices of
+INGESTION_IMPORT_SLICE_POS POs. Parsing and writing a slice is blocking work,
+so it runs in a worker thread with its own session, off the event loop. Each
+slice is one transaction on that session: its POs, outbox jobs, the ImportJob
+checkpoint and the job for the next slice are committed together. A crashed or
+failed slice is rolled back and the retry resumes from the last checkpoint.
+
+Every slice job carries the checkpoint it starts from. The checkpoint only
+advances if it still holds that value, so a slice that kept running in its
+thread after the task timed out and the retry of that slice cannot both commit.
+
+Resuming re-parses the file up to the checkpoint (parsing is cheap next to the
+writes) so the PO grouping and continuation handling stay identical across slices.
+
+Per-PO log entries are appended to `<spool>.ndjson`. Only the first
+`ImportJob.log_offset` bytes are committed; a retried slice truncates the rest
+before writing again.
+
+The spooled upload is deleted once the import completes or fails; the log is
+kept. A slice job that exhausted its retries keeps the spool so it can still
+be retried.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+from itertools import islice
+from typing import IO, Any, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.ingestion_pipeline import ColumnMappingError, ParsedPO, POStream, UnsupportedFormatError
+from app.services.ingestion_writer import POImport
+from app.services.subscription import check_limit
+from app.services.task_registry import task_registry
+from app.services.worker import worker_queue
+
+logger = logging.getLogger(__name__)
+
+LOG_READ_BYTES = 64 * 1024
+
+
+def log_path(job) -> str:
+    return f"{job.spool_path}.ndjson"
+
+
+def spool_upload(db: Session, organization_id: str, fileobj: IO[bytes], filename: str):
+    """Copies the upload to disk, records an ImportJob and enqueues its first slice."""
+    from app.models import ImportJob
+
+    os.makedirs(settings.INGESTION_SPOOL_DIR, exist_ok=True)
+    import_id = str(uuid.uuid4())
+    _, extension = os.path.splitext(filename or "")
+    spool_path = os.path.join(settings.INGESTION_SPOOL_DIR, f"{import_id}{extension.lower()}")
+    with open(spool_path, "wb") as spool:
+        shutil.copyfileobj(fileobj, spool, length=1024 * 1024)
+
+    job = ImportJob(id=import_id, organization_id=organization_id, filename=filename or "", spool_path=spool_path)
+    db.add(job)
+    db.flush()
+    job.current_job_id = worker_queue.enqueue_job("process_import", {"import_id": import_id, "records_done": 0}, db=db)
+    return job
+
+
+def import_status(db: Session, job) -> Dict[str, Any]:
+    from app.models import ActiveJob
+
+    status, error = job.status, job.error_message
+    if status in ("queued", "running") and job.current_job_id:
+        # The slice job exhausted its retries: report it rather than leaving the import 'running'
+        active = db.get(ActiveJob, job.current_job_id)
+        if active is not None and active.status == "failed":
+            status, error = "failed", (active.payload or {}).get("error_log")
+
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    return {
+        "import_id":        job.id,
+        "organization_id":  job.organization_id,
+        "filename":         job.filename,
+        "status":           status,
+        "rows_processed":   job.rows_processed or 0,
+        "pos_imported":     job.pos_imported or 0,
+        "pos_skipped":      job.pos_skipped or 0,
+        "rows_per_second":  round((job.rows_processed or 0) / elapsed, 1) if elapsed else None,
+        "elapsed_seconds":  round(elapsed, 3) if elapsed is not None else None,
+        "error":            error,
+        "created_at":       job.created_at.isoformat() if job.created_at else None,
+        "started_at":       job.started_at.isoformat() if job.started_at else None,
+        "finished_at":      job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def iter_log(job) -> Iterator[bytes]:
+    """Yields the committed part of the import's NDJSON log in blocks."""
+    remaining = job.log_offset or 0
+    if not remaining or not os.path.exists(log_path(job)):
+        return
+    with open(log_path(job), "rb") as log:
+        while remaining > 0:
+            block = log.read(min(LOG_READ_BYTES, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _remove_spool(job) -> None:
+    try:
+        os.remove(job.spool_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Import {job.id}: could not remove spool {job.spool_path}: {e}")
+
+
+def _fail(job, message: str) -> None:
+    job.status = "failed"
+    job.error_message = message
+    job.finished_at = datetime.utcnow()
+    job.current_job_id = None
+    logger.error(f"Import {job.id} failed: {message}")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# TASK HANDLERS
+# ──────────────────────────────────────────────────────────────────────────────
+
+@task_registry.task("process_import", kind="async", concurrency=2, timeout=600)
+async def process_import(payload: Dict[str, Any], db: Optional[Session] = None) -> Dict[str, Any]:
+    """Ingests the next slice of a spooled upload, then checkpoints and chains the following slice."""
+    if db is None:
+        logger.warning(f"process_import {payload.get('import_id')} needs a database session; skipped.")
+        return {"status": "skipped"}
+    return await asyncio.to_thread(_import_slice, db.get_bind(), payload)
+
+
+def _import_slice(bind, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one slice in the calling thread on a session of its own, committed as one transaction."""
+    from app.models import ImportJob
+
+    db = Session(bind=bind, autoflush=False)
+    try:
+        result = _run_slice(db, payload)
+        db.commit()
+        if result["status"] in ("completed", "failed"):
+            _remove_spool(db.get(ImportJob, payload["import_id"]))
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _run_slice(db: Session, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.models import ImportJob
+
+    job = db.get(ImportJob, payload["import_id"])
+    if job is None or job.status in ("completed", "failed"):
+        return {"status": job.status if job else "missing"}
+    start = job.records_done or 0
+    if payload.get("records_done", start) != start:
+        return {"status": "superseded"}   # This slice was already committed by an earlier run
+    if job.status == "queued":
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+
+    with open(job.spool_path, "rb") as upload, open(log_path(job), "ab") as log:
+        log.truncate(job.log_offset or 0)   # Drop lines of a slice that was rolled back
+        try:
+            stream = POStream(upload, job.filename).open()
+        except (UnsupportedFormatError, ColumnMappingError) as e:
+            _fail(job, str(e))
+            return {"status": "failed"}
+
+        # Replay up to the checkpoint; POs written by earlier slices still take continuation rows
+        records = iter(stream)
+        written = [
+            record.po_number for record in islice(records, start)
+            if isinstance(record, ParsedPO) and not record.continuation
+        ]
+        importer = POImport(
+            db, job.organization_id, job.filename,
+            sink=lambda entry: log.write((json.dumps(entry) + "\n").encode("utf-8")),
+            written=written,
+        )
+        done, finished = start, True
+        for record in records:
+            done += 1
+            if importer.add(record) and importer.imported >= settings.INGESTION_IMPORT_SLICE_POS:
+                finished = False
+                break
+        records.close()   # Release the reader before the spool file closes
+        importer.flush()
+        log.flush()
+        log_offset = log.tell()
+
+    if importer.imported:
+        try:
+            check_limit(db, job.organization_id, "po_uploads", increment=importer.imported)
+        except HTTPException as e:
+            # Over the plan's monthly PO quota: discard this slice, keep earlier ones
+            db.rollback()
+            job = db.get(ImportJob, payload["import_id"])
+            _fail(job, e.detail["message"] if isinstance(e.detail, dict) else str(e.detail))
+            return {"status": "failed"}
+
+    advanced = db.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job.id, func.coalesce(ImportJob.records_done, 0) == start)
+        .values(records_done=done)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not advanced:
+        db.rollback()
+        logger.warning(f"Import {job.id}: checkpoint {start} was committed concurrently; slice discarded.")
+        return {"status": "superseded"}
+
+    job.records_done = done
+    job.rows_processed = stream.rows_read
+    job.pos_imported = (job.pos_imported or 0) + importer.imported
+    job.pos_skipped = (job.pos_skipped or 0) + importer.skipped
+    job.log_offset = log_offset
+    if finished:
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        job.current_job_id = None
+        logger.info(f"Import {job.id} completed: {job.pos_imported} PO(s) imported, {job.pos_skipped} skipped.")
+    else:
+        job.current_job_id = worker_queue.enqueue_job("process_import", {"import_id": job.id, "records_done": done}, db=db)
+        logger.info(f"Import {job.id} checkpointed at record {done}; next slice {job.current_job_id}.")
+    return {"status": job.status, "pos_imported": importer.imported}
@@ -0,0 +1,104 @@
+# file: backend/app/services/inbound_messages.py
+"""
+Worker-side processing of inbound vendor WhatsApp messages.
+
+With WEBHOOK_INBOUND_MODE="async", POST /webhooks/whatsapp only verifies the
+signature, records the WebhookEvent and enqueues `process_inbound_message`,
+then acknowledges Meta. This task does the slow part: AI parsing, HITL routing
+and the state transition. Concurrently running jobs share batched OpenAI
+requests (ai_service.parse_vendor_message_async).
+
+Jobs are enqueued with ordering_key "vendor:<phone>", so one vendor's messages
+are processed one at a time in arrival order, retries included. The
+WebhookEvent's processed_status is flipped in the same transaction as the
+HITL writes, so a redelivered job finds it "processed" and does nothing. A
+job that fails for good flips it to "failed" instead (like inline mode does),
+so Meta's redelivery of the message is processed again rather than treated as
+a duplicate.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.services.task_registry import task_registry
+from app.services.worker import worker_queue
+
+logger = logging.getLogger(__name__)
+
+
+def vendor_ordering_key(phone_number: Optional[str]) -> str:
+    return f"vendor:{phone_number or ''}"
+
+
+def message_received_at(timestamp: Any) -> Optional[datetime]:
+    """A Meta message's `timestamp` (unix seconds, as a string) as a naive UTC datetime."""
+    try:
+        return datetime.utcfromtimestamp(int(timestamp))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def enqueue_inbound_message(
+    db: Session, event_id: str, phone_number: Optional[str], text: str, timestamp: Optional[str] = None
+) -> str:
+    """Queues a recorded inbound message for the worker, ordered per vendor."""
+    return worker_queue.enqueue_job(
+        "process_inbound_message",
+        {"event_id": event_id, "phone_number": phone_number, "text": text, "timestamp": timestamp},
+        db=db,
+        ordering_key=vendor_ordering_key(phone_number),
+    )
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# TASK HANDLERS
+# ──────────────────────────────────────────────────────────────────────────────
+
+def mark_event_failed(payload: Dict[str, Any], error: str, db: Session) -> None:
+    """The job dead-lettered: flag its WebhookEvent 'failed' so Meta's next redelivery is processed again."""
+    from app.models import WebhookEvent
+    from app.services.webhook_idempotency import webhook_idempotency
+
+    db.query(WebhookEvent).filter(
+        WebhookEvent.event_id == payload["event_id"], WebhookEvent.processed_status != "processed"
+    ).update({"processed_status": "failed", "error_message": error}, synchronize_session=False)
+    webhook_idempotency.remember_after_commit(db, {payload["event_id"]: "failed"})
+
+
+@task_registry.task("process_inbound_message", kind="async", concurrency=16, timeout=90, on_failure=mark_event_failed)
+async def process_inbound_message(payload: Dict[str, Any], db: Optional[Session] = None) -> Dict[str, Any]:
+    """Parses one inbound vendor message, routes it through HITL and marks its WebhookEvent processed."""
+    from app.models import WebhookEvent
+    from app.services.ai_service import ai_service
+    from app.services.hitl_service import hitl_service
+    from app.services.vendor_resolver import vendor_resolver
+
+    if db is None:
+        logger.warning(f"process_inbound_message {payload.get('event_id')} needs a database session; skipped.")
+        return {"status": "skipped"}
+    event = db.query(WebhookEvent).filter(WebhookEvent.event_id == payload["event_id"]).first()
+    if event is None:
+        return {"status": "missing"}
+    if event.processed_status == "processed":
+        return {"status": "already_processed"}
+
+    analysis = await ai_service.parse_vendor_message_async(
+        payload["text"],
+        received_at=message_received_at(payload.get("timestamp")),
+        language_hint=vendor_resolver.resolve(db, payload["phone_number"])["language"] if payload["phone_number"] else None,
+        db=db,
+    )
+    hitl_result = hitl_service.evaluate_message_for_hitl(
+        phone_number=payload["phone_number"],
+        text_content=payload["text"],
+        analysis=analysis,
+        db=db,
+    )
+    event.processed_status = "processed"
+    event.error_message = None
+    logger.info(f"Inbound message {event.event_id} processed: intent={analysis.get('intent')} status={hitl_result.get('status')}")
+    return {"status": "processed", "intent": analysis.get("intent")}
@@ -0,0 +1,282 @@
+# file: backend/app/services/ingestion_pipeline.py
+"""
+Streaming PO ingestion for Tally Excel/CSV exports.
+
+The upload is never loaded whole: CSV is read in `INGESTION_CHUNK_ROWS` chunks
+(pandas chunksize) and XLSX through openpyxl's read-only row iterator. Each chunk
+is normalized column-at-a-time (pandas string ops for text, phones and amounts),
+grouped by PO number, and completed POs are yielded as they are assembled, so
+peak memory tracks the chunk size rather than the file size.
+
+A PO whose rows straddle a chunk boundary is held back until the next chunk.
+If a PO's rows reappear later in the file (non-contiguous export), the extra
+rows are yielded as a `continuation` of the already-emitted PO.
+
+    stream = POStream(upload.file, upload.filename)
+    stream.open()                      # Reads the header, raises ColumnMappingError
+    for record in stream:              # ParsedPO | SkippedPO
+        ...
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import IO, Any, Dict, Iterator, List, Optional, Set, Union
+
+import pandas as pd
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Header aliases seen in Tally / ERP exports (matched after lowercasing and stripping)
+REQUIRED_MAPPINGS = {
+    "po_number":    ["po number", "po_number", "order no", "purchase order", "voucher number", "po no"],
+    "vendor_name":  ["vendor name", "vendor", "party name", "party", "supplier"],
+    "vendor_phone": ["phone", "phone number", "mobile", "contact", "whatsapp no", "whatsapp"],
+}
+ITEM_MAPPINGS = {
+    "description": ["item", "item description", "description", "particulars", "item name"],
+    "quantity":    ["qty", "quantity", "quantity ordered"],
+    "rate":        ["rate", "price", "unit price"],
+    "amount":      ["amount", "total", "value"],
+}
+DEFAULT_ITEM_DESCRIPTION = "Industrial Consumables"
+DEFAULT_VENDOR_NAME = "Unknown Vendor"
+
+
+class UnsupportedFormatError(ValueError):
+    """The upload is neither CSV nor Excel."""
+
+
+class ColumnMappingError(ValueError):
+    """The header lacks one of PO number, vendor name or vendor phone."""
+
+    def __init__(self, found: Dict[str, str], columns: List[str]):
+        super().__init__(
+            "Unable to auto-detect essential columns. Required columns: PO Number, Vendor Name, and "
+            f"Vendor Phone/WhatsApp. Found: {list(found.keys())} in columns: {columns}"
+        )
+        self.found = found
+        self.columns = columns
+
+
+@dataclass
+class ParsedPO:
+    po_number: str
+    vendor_name: str
+    vendor_phone: str
+    items: List[Dict[str, Any]] = field(default_factory=list)   # description, quantity, rate, amount
+    total_amount: Decimal = Decimal("0")
+    continuation: bool = False    # Extra rows for a PO already yielded earlier in the file
+
+
+@dataclass
+class SkippedPO:
+    po_number: str
+    reason: str
+
+
+# ─────────────────────────────────────────────────────────────────
+# Vectorized normalization
+# ─────────────────────────────────────────────────────────────────
+
+def normalize_text(column: pd.Series) -> pd.Series:
+    """Stripped strings; missing/blank cells become <NA>."""
+    text = column.astype("string").str.strip()
+    return text.mask(text == "")
+
+
+def normalize_phone(column: pd.Series) -> pd.Series:
+    """Indian numbers to +91XXXXXXXXXX: 10-digit numbers get +91, 12-digit 91... numbers get +."""
+    phone = column.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
+    phone = phone.str.replace(r"[^\d+]", "", regex=True).fillna("")
+    bare = ~phone.str.startswith("+")
+    lengths = phone.str.len()
+    phone = phone.mask(bare & phone.str.startswith("91") & (lengths == 12), "+" + phone)
+    phone = phone.mask(bare & (lengths == 10), "+91" + phone)
+    return phone
+
+
+def normalize_decimal(column: pd.Series) -> pd.Series:
+    """Numeric-looking strings (thousands separators removed); anything unparseable becomes <NA>."""
+    text = column.astype("string").str.replace(",", "", regex=False).str.strip()
+    return text.where(pd.to_numeric(text, errors="coerce").notna())
+
+
+def _decimal(value: Any, default: Decimal) -> Decimal:
+    if value is None or value is pd.NA:
+        return default
+    try:
+        return Decimal(value)
+    except (InvalidOperation, ValueError):
+        return default
+
+
+# ─────────────────────────────────────────────────────────────────
+# Readers
+# ─────────────────────────────────────────────────────────────────
+
+def _iter_csv(fileobj: IO[bytes], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    # dtype=str keeps phone numbers and PO numbers exactly as exported
+    yield from pd.read_csv(fileobj, chunksize=chunk_rows, dtype=str, skipinitialspace=True)
+
+
+def _iter_xlsx(fileobj: IO[bytes], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) if c is not None else f"unnamed: {i}" for i, c in enumerate(header)]
+        buffer: List[tuple] = []
+        for row in rows:
+            if not any(cell is not None for cell in row):
+                continue
+            buffer.append(row[:len(columns)])
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns, dtype=object)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+def iter_frames(fileobj: IO[bytes], filename: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yields the upload as DataFrame chunks of at most `chunk_rows` rows."""
+    chunk_rows = chunk_rows or settings.INGESTION_CHUNK_ROWS
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return _iter_csv(fileobj, chunk_rows)
+    if name.endswith(".xlsx"):
+        return _iter_xlsx(fileobj, chunk_rows)
+    if name.endswith(".xls"):
+        # Legacy BIFF workbooks have no streaming reader; load the (small, old-format) sheet at once
+        return iter([pd.read_excel(fileobj)])
+    raise UnsupportedFormatError("Unsupported file format. Please upload a standard CSV or Excel file.")
+
+
+def resolve_columns(columns: List[str]) -> Dict[str, Optional[str]]:
+    """Maps canonical field names to the upload's (lowercased) header names."""
+    found: Dict[str, Optional[str]] = {}
+    for key, alternatives in REQUIRED_MAPPINGS.items():
+        match = next((alt for alt in alternatives if alt in columns), None)
+        if match:
+            found[key] = match
+    if len(found) < len(REQUIRED_MAPPINGS):
+        raise ColumnMappingError(found, columns)
+    for key, alternatives in ITEM_MAPPINGS.items():
+        found[key] = next((alt for alt in alternatives if alt in columns), None)
+    return found
+
+
+# ─────────────────────────────────────────────────────────────────
+# Stream
+# ─────────────────────────────────────────────────────────────────
+
+class POStream:
+    def __init__(self, fileobj: IO[bytes], filename: str, chunk_rows: Optional[int] = None):
+        self.fileobj = fileobj
+        self.filename = filename
+        self.chunk_rows = chunk_rows
+        self.mapping: Dict[str, Optional[str]] = {}
+        self.rows_read = 0
+        self.chunks_read = 0
+        self._frames: Optional[Iterator[pd.DataFrame]] = None
+        self._first: Optional[pd.DataFrame] = None
+
+    def open(self) -> "POStream":
+        """Reads the first chunk and resolves the column mapping."""
+        self._frames = iter_frames(self.fileobj, self.filename, self.chunk_rows)
+        self._first = next(self._frames, None)
+        columns = [] if self._first is None else [str(c).strip().lower() for c in self._first.columns]
+        self.mapping = resolve_columns(columns)
+        return self
+
+    def _chunks(self) -> Iterator[pd.DataFrame]:
+        if self._frames is None:
+            self.open()
+        if self._first is not None:
+            yield self._first
+            self._first = None
+        yield from self._frames
+
+    def _normalize(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk.columns = [str(c).strip().lower() for c in chunk.columns]
+        m = self.mapping
+        missing = pd.Series(pd.NA, index=chunk.index, dtype="string")
+        return pd.DataFrame({
+            "po_number":    normalize_text(chunk[m["po_number"]]),
+            "vendor_name":  normalize_text(chunk[m["vendor_name"]]),
+            "vendor_phone": normalize_phone(chunk[m["vendor_phone"]]),
+            "description":  normalize_text(chunk[m["description"]]) if m["description"] else missing,
+            "quantity":     normalize_decimal(chunk[m["quantity"]]) if m["quantity"] else missing,
+            "rate":         normalize_decimal(chunk[m["rate"]]) if m["rate"] else missing,
+            "amount":       normalize_decimal(chunk[m["amount"]]) if m["amount"] else missing,
+        })
+
+    @staticmethod
+    def _build(po_number: str, rows: List[tuple], continuation: bool) -> ParsedPO:
+        _, vendor_name, vendor_phone, _, _, _, _ = rows[0]
+        po = ParsedPO(
+            po_number=po_number,
+            vendor_name=vendor_name if vendor_name is not None else DEFAULT_VENDOR_NAME,
+            vendor_phone=vendor_phone,
+            continuation=continuation,
+        )
+        for _, _, _, description, quantity, rate, amount in rows:
+            qty = _decimal(quantity, Decimal("1"))
+            unit_rate = _decimal(rate, Decimal("0"))
+            line_amount = _decimal(amount, qty * unit_rate)
+            po.items.append({
+                "description": description if description is not None else DEFAULT_ITEM_DESCRIPTION,
+                "quantity":    qty,
+                "rate":        unit_rate,
+                "amount":      line_amount,
+            })
+            po.total_amount += line_amount
+        return po
+
+    def __iter__(self) -> Iterator[Union[ParsedPO, SkippedPO]]:
+        emitted: Set[str] = set()
+        carry: Dict[str, List[tuple]] = {}    # Rows of the last PO in the previous chunk
+        missing_po_rows = 0
+
+        def emit(po_number: str, rows: List[tuple]) -> Iterator[Union[ParsedPO, SkippedPO]]:
+            continuation = po_number in emitted
+            emitted.add(po_number)   # Later rows of a skipped PO are skipped with it
+            if not continuation and not rows[0][2]:
+                yield SkippedPO(po_number, "Missing vendor contact number to initiate WhatsApp")
+                return
+            yield self._build(po_number, rows, continuation)
+
+        for raw in self._chunks():
+            self.chunks_read += 1
+            self.rows_read += len(raw)
+            frame = self._normalize(raw)
+            blank = frame["po_number"].isna()
+            missing_po_rows += int(blank.sum())
+            # Normalization is done column-wise; grouping is one pass over plain tuples (<NA> → None)
+            frame = frame[~blank].astype(object).where(frame[~blank].notna(), None)
+            groups: Dict[str, List[tuple]] = carry
+            for row in zip(*(frame[column].tolist() for column in frame.columns)):
+                groups.setdefault(row[0], []).append(row)
+            if not groups:
+                carry = {}
+                continue
+
+            # The chunk's last PO may continue in the next chunk: hold it back
+            last_po = row[0] if len(frame) else next(reversed(groups))
+            carry = {last_po: groups.pop(last_po)}
+            for po_number, rows in groups.items():
+                yield from emit(po_number, rows)
+
+        for po_number, rows in carry.items():
+            yield from emit(po_number, rows)
+        if missing_po_rows:
+            yield SkippedPO("", f"Missing PO number ({missing_po_rows} row(s))")
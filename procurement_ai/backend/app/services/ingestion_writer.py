@@ -0,0 +1,326 @@
+# file: backend/app/services/ingestion_writer.py
+"""
+Set-based persistence for parsed POs (see ingestion_pipeline.py).
+
+POBatchWriter.write() stores a batch of ParsedPO records with a fixed number of
+statements, however many POs the batch holds:
+
+  1-3. SELECT existing vendors, workflows and tasks    (one IN query each)
+  4.   INSERT vendors   ON CONFLICT (uq_vendors_org_phone) DO UPDATE   new or renamed only
+  5.   INSERT workflows ON CONFLICT (uq_workflows_org_po) DO UPDATE    new only
+  6.   INSERT tasks     ON CONFLICT (uq_tasks_org_po) DO UPDATE        all
+  7.   DELETE line items of re-ingested tasks
+  8.   INSERT line items
+  9.   INSERT PO_INGESTED / PO_REINGESTED workflow events
+  +    CREATED -> VENDOR_PENDING for new workflows via state_machine.transition_many
+
+The upserts use RETURNING, so ids come back even when a concurrent import
+inserted the same vendor or PO between the prefetch and the write.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import replace
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.models import ProcurementItem, ProcurementTask, ProcurementWorkflow, Vendor, WorkflowEvent
+from app.services.ingestion_pipeline import ParsedPO, SkippedPO
+from app.services.state_machine import WorkflowState, state_machine
+from app.services.vendor_resolver import vendor_resolver
+from app.services.worker import JobRequest, worker_queue
+
+logger = logging.getLogger(__name__)
+
+
+class POBatchWriter:
+    """Writes one upload's POs batch by batch; remembers task ids so later continuations can be appended."""
+
+    def __init__(self, db: Session, organization_id: str, source_filename: str, written: Iterable[str] = ()):
+        self.db = db
+        self.organization_id = organization_id
+        self.source_filename = source_filename
+        self.task_ids: Dict[str, str] = {}    # po_number -> task id, across batches
+        # POs written before a resumed import's checkpoint; their task ids are looked up on demand
+        self._resumed = set(written)
+
+    def write(self, records: List[ParsedPO]) -> List[JobRequest]:
+        """Upserts a batch and returns the vendor confirmation jobs for its newly registered POs."""
+        db, org_id = self.db, self.organization_id
+
+        # Fold continuation rows into their PO when it is in this batch
+        pos: Dict[str, ParsedPO] = {}
+        late_items: Dict[str, ParsedPO] = {}  # Continuations of POs written by an earlier batch
+        for record in records:
+            if not record.continuation:
+                pos[record.po_number] = replace(record, items=list(record.items))
+            elif record.po_number in pos:
+                pos[record.po_number].items.extend(record.items)
+                pos[record.po_number].total_amount += record.total_amount
+            elif record.po_number in late_items:
+                late_items[record.po_number].items.extend(record.items)
+                late_items[record.po_number].total_amount += record.total_amount
+            elif record.po_number in self.task_ids or record.po_number in self._resumed:
+                late_items[record.po_number] = replace(record, items=list(record.items))
+            # else: continuation of a skipped PO
+
+        now = datetime.utcnow()
+        po_numbers = list(pos)
+        phones = {po.vendor_phone: po.vendor_name for po in pos.values()}   # Last name in the file wins
+
+        existing_vendors = {
+            phone: (vendor_id, name)
+            for vendor_id, phone, name in db.execute(
+                select(Vendor.id, Vendor.phone_number, Vendor.name)
+                .where(Vendor.organization_id == org_id, Vendor.phone_number.in_(list(phones)))
+            )
+        } if phones else {}
+        existing_workflows = {
+            po_number: (workflow_id, state)
+            for workflow_id, po_number, state in db.execute(
+                select(ProcurementWorkflow.id, ProcurementWorkflow.po_number, ProcurementWorkflow.current_state)
+                .where(ProcurementWorkflow.organization_id == org_id, ProcurementWorkflow.po_number.in_(po_numbers))
+            )
+        } if pos else {}
+        existing_tasks = {
+            po_number: task_id
+            for task_id, po_number in db.execute(
+                select(ProcurementTask.id, ProcurementTask.po_number)
+                .where(ProcurementTask.organization_id == org_id, ProcurementTask.po_number.in_(po_numbers))
+            )
+        } if pos else {}
+
+        # Vendors: insert new numbers, rename existing ones whose name changed
+        vendor_ids = {phone: vendor_id for phone, (vendor_id, _) in existing_vendors.items()}
+        vendor_rows = [
+            {"organization_id": org_id, "phone_number": phone, "name": name}
+            for phone, name in phones.items()
+            if phone not in existing_vendors or existing_vendors[phone][1] != name
+        ]
+        if vendor_rows:
+            stmt = upsert_insert(db, Vendor)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Vendor.organization_id, Vendor.phone_number],
+                set_={"name": stmt.excluded.name, "updated_at": now},
+            ).returning(Vendor.id, Vendor.phone_number)
+            vendor_ids.update({phone: vendor_id for vendor_id, phone in db.execute(stmt, vendor_rows)})
+
+        # Workflows: insert missing POs (DO UPDATE rather than DO NOTHING so RETURNING always yields the id)
+        workflows = dict(existing_workflows)
+        new_workflows = [{"organization_id": org_id, "po_number": po} for po in po_numbers if po not in workflows]
+        if new_workflows:
+            stmt = upsert_insert(db, ProcurementWorkflow)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ProcurementWorkflow.organization_id, ProcurementWorkflow.po_number],
+                set_={"po_number": stmt.excluded.po_number},
+            ).returning(ProcurementWorkflow.id, ProcurementWorkflow.po_number, ProcurementWorkflow.current_state)
+            workflows.update({po: (workflow_id, state) for workflow_id, po, state in db.execute(stmt, new_workflows)})
+
+        # Tasks: every PO in the batch is (re)written
+        task_rows = [
+            {
+                "organization_id": org_id,
+                "workflow_id":     workflows[po.po_number][0],
+                "vendor_id":       vendor_ids[po.vendor_phone],
+                "po_number":       po.po_number,
+                "po_date":         date.today(),
+                "total_amount":    po.total_amount,
+                "status":          workflows[po.po_number][1],
+            }
+            for po in pos.values()
+        ]
+        task_ids: Dict[str, str] = {}
+        if task_rows:
+            stmt = upsert_insert(db, ProcurementTask)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ProcurementTask.organization_id, ProcurementTask.po_number],
+                set_={
+                    "workflow_id":  stmt.excluded.workflow_id,
+                    "vendor_id":    stmt.excluded.vendor_id,
+                    "total_amount": stmt.excluded.total_amount,
+                    "status":       stmt.excluded.status,
+                    "updated_at":   now,
+                },
+            ).returning(ProcurementTask.id, ProcurementTask.po_number)
+            task_ids = {po: task_id for task_id, po in db.execute(stmt, task_rows)}
+        self.task_ids.update(task_ids)
+
+        unresolved = [po for po in late_items if po not in self.task_ids]
+        if unresolved:
+            self.task_ids.update({
+                po_number: task_id
+                for task_id, po_number in db.execute(
+                    select(ProcurementTask.id, ProcurementTask.po_number)
+                    .where(ProcurementTask.organization_id == org_id, ProcurementTask.po_number.in_(unresolved))
+                )
+            })
+
+        # Line items: re-ingested POs replace theirs; late continuations append
+        if existing_tasks:
+            db.execute(
+                delete(ProcurementItem)
+                .where(ProcurementItem.task_id.in_(list(existing_tasks.values())))
+                .execution_options(synchronize_session=False)
+            )
+        item_rows = [
+            {
+                "task_id":     ids[po.po_number],
+                "description": item["description"],
+                "quantity":    item["quantity"],
+                "unit_price":  item["rate"],
+                "amount":      item["amount"],
+            }
+            for ids, batch in ((task_ids, pos), (self.task_ids, late_items))
+            for po in batch.values()
+            for item in po.items
+        ]
+        if item_rows:
+            db.execute(insert(ProcurementItem), item_rows)
+        for po in late_items.values():
+            db.execute(
+                update(ProcurementTask)
+                .where(ProcurementTask.id == self.task_ids[po.po_number])
+                .values(total_amount=ProcurementTask.total_amount + po.total_amount)
+                .execution_options(synchronize_session=False)
+            )
+
+        if pos:
+            db.execute(insert(WorkflowEvent), [
+                {
+                    "organization_id": org_id,
+                    "workflow_id":     workflows[po.po_number][0],
+                    "event_type":      "PO_REINGESTED" if po.po_number in existing_workflows else "PO_INGESTED",
+                    "payload": {
+                        "po_number":        po.po_number,
+                        "vendor_id":        vendor_ids[po.vendor_phone],
+                        "task_id":          task_ids[po.po_number],
+                        "task_created":     po.po_number not in existing_tasks,
+                        "line_items_count": len(po.items),
+                        "total_amount":     float(po.total_amount),
+                        "source_filename":  self.source_filename,
+                    },
+                }
+                for po in pos.values()
+            ])
+
+        jobs = [
+            JobRequest(
+                task_name="dispatch_whatsapp_outbox",
+                payload={
+                    "organization_id": org_id,
+                    "workflow_id": workflows[po.po_number][0],
+                    "task_id": task_ids[po.po_number],
+                    "vendor_id": vendor_ids[po.vendor_phone],
+                    "vendor_name": po.vendor_name,
+                    "po_number": po.po_number,
+                    "phone_number": po.vendor_phone,
+                    "message_text": f"Hello {po.vendor_name}, please confirm receipt of Purchase Order {po.po_number} and share ETA."
+                }
+            )
+            for po in pos.values()
+        ]
+        # New tasks change each vendor's active PO; new workflows change the org's newest open one
+        vendor_resolver.invalidate_after_commit(db, phones=vendor_ids, organization_id=org_id if new_workflows else None)
+        created = [
+            (workflow_id, WorkflowState.VENDOR_PENDING)
+            for workflow_id, state in (workflows[po] for po in po_numbers)
+            if state == WorkflowState.CREATED.value
+        ]
+        if created:
+            state_machine.transition_many(
+                db,
+                created,
+                organization_id=org_id,
+                reason="PO ingested and vendor confirmation job queued."
+            )
+        logger.info(
+            f"Ingestion batch for org {org_id}: {len(pos)} PO(s), {len(vendor_rows)} vendor upsert(s), "
+            f"{len(new_workflows)} new workflow(s), {len(item_rows)} line item(s)"
+        )
+        return jobs
+
+
+class POImport:
+    """
+    Consumes one upload's POStream records: batches them through POBatchWriter, enqueues the
+    vendor confirmation jobs per batch, and hands per-PO log entries (in file order) to `sink`
+    as each batch is written. Shared by the inline /ingestion/excel endpoint and `process_import`.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        organization_id: str,
+        source_filename: str,
+        sink: Callable[[Dict[str, Any]], None],
+        written: Iterable[str] = (),
+        batch_size: Optional[int] = None,
+    ):
+        self.writer = POBatchWriter(db, organization_id, source_filename, written=written)
+        self.sink = sink
+        self.batch_size = batch_size or settings.INGESTION_WRITE_BATCH_POS
+        self.imported = 0
+        self.skipped = 0
+        self.jobs_enqueued = 0
+        self._written = set(written)              # POs already flushed (for continuation log lines)
+        self._batch: List[ParsedPO] = []
+        self._logs: List[Dict[str, Any]] = []     # Log entries of the pending batch, in file order
+        self._pending: Dict[str, Dict[str, Any]] = {}   # po_number -> pending log entry
+
+    def add(self, record: Union[ParsedPO, SkippedPO]) -> bool:
+        """Adds one record; returns True when this flushed a batch."""
+        if isinstance(record, SkippedPO):
+            self.skipped += 1
+            self._logs.append({"po_number": record.po_number, "status": "skipped", "reason": record.reason})
+            return False
+
+        if record.continuation:
+            # Rows for a PO seen earlier in the file: the writer appends its line items
+            entry = self._pending.get(record.po_number)
+            if entry is not None:
+                entry["total_amount"] += float(record.total_amount)
+                entry["line_items_count"] += len(record.items)
+            elif record.po_number in self._written:
+                self._logs.append({
+                    "po_number": record.po_number,
+                    "status": "appended",
+                    "total_amount": float(record.total_amount),
+                    "line_items_count": len(record.items),
+                })
+            else:
+                return False   # Continuation of a skipped PO
+            self._batch.append(record)
+            return False
+
+        self.imported += 1
+        entry = {
+            "po_number": record.po_number,
+            "status": "imported",
+            "vendor": record.vendor_name,
+            "phone": record.vendor_phone,
+            "total_amount": float(record.total_amount),
+            "line_items_count": len(record.items)
+        }
+        self._pending[record.po_number] = entry
+        self._logs.append(entry)
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self) -> None:
+        if self._batch:
+            jobs = self.writer.write(self._batch)
+            # One multi-row INSERT for the batch's outbox jobs, in the same transaction
+            worker_queue.enqueue_many(jobs, db=self.writer.db)
+            self.jobs_enqueued += len(jobs)
+            self._written.update(self._pending)
+        for entry in self._logs:
+            self.sink(entry)
+        self._batch, self._logs, self._pending = [], [], {}
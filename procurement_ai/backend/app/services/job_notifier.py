@@ -0,0 +1,139 @@
+"""
+Worker wakeup signalling for the durable job queue.
+
+WorkerQueue.enqueue_job() flags its session; once that transaction commits, the
+in-process notifier wakes the worker loop immediately instead of waiting for the
+next poll. On PostgreSQL the enqueue also issues NOTIFY on the `active_jobs`
+channel, which the server delivers to every LISTENing worker process only when
+the enqueuing transaction commits — so a wakeup never races ahead of its job row.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import select
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core.transactions import after_outer_commit
+
+logger = logging.getLogger(__name__)
+
+JOB_CHANNEL = "active_jobs"
+_WAKE_FLAG  = "wake_worker_on_commit"
+
+
+class JobNotifier:
+    """Loop-bound wakeup event that can be signalled from any thread."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def attach(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Binds the notifier to the event loop running the worker."""
+        self._loop  = loop or asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        """Wakes the worker loop. Safe to call from request threads or the listener thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # Loop is shutting down; nothing left to wake
+            pass
+
+    async def wait(self, timeout: Optional[float]) -> bool:
+        """Sleeps until notified or `timeout` seconds pass. Returns True when woken by a notification."""
+        if self._event is None:
+            self.attach()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+
+
+def mark_session_for_wakeup(db: Session) -> None:
+    """Schedules a worker wakeup for when `db`'s current transaction commits."""
+    if db.info.get(_WAKE_FLAG):
+        return
+    db.info[_WAKE_FLAG] = True
+    if db.get_bind().dialect.name == "postgresql":
+        # Transactional: delivered to listeners on COMMIT, dropped on ROLLBACK
+        db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": JOB_CHANNEL})
+
+
+def _wake_worker_after_commit(session: Session, _flag: bool) -> None:
+    job_notifier.notify()
+
+
+after_outer_commit(_WAKE_FLAG, _wake_worker_after_commit)
+
+
+class PostgresJobListener:
+    """
+    Background thread holding a dedicated LISTEN connection.
+    Each NOTIFY from another process is forwarded to the in-process notifier.
+    """
+
+    def __init__(self, engine: Engine, notifier: JobNotifier, channel: str = JOB_CHANNEL):
+        self._dsn      = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self._notifier = notifier
+        self._channel  = channel
+        self._stopped  = threading.Event()
+        self._thread   = threading.Thread(target=self._run, name="active-jobs-listener", daemon=True)
+
+    def start(self) -> "PostgresJobListener":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        import psycopg2
+
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self._channel}")
+                logger.info(f"Worker listener: LISTEN {self._channel} established.")
+                # Wake once after (re)connecting in case notifications were missed while down
+                self._notifier.notify()
+                while not self._stopped.is_set():
+                    readable, _, _ = select.select([conn], [], [], 5.0)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self._notifier.notify()
+            except Exception as e:
+                logger.warning(f"Worker listener: LISTEN connection lost ({e}). Reconnecting in 5s.")
+                self._stopped.wait(5.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+def start_postgres_listener(engine: Engine) -> Optional[PostgresJobListener]:
+    """Starts a cross-process LISTEN thread on PostgreSQL; returns None for other dialects."""
+    if engine.dialect.name != "postgresql":
+        return None
+    return PostgresJobListener(engine, job_notifier).start()
+
+
+job_notifier = JobNotifier()
@@ -9,38 +9,55 @@ and dispatches HTTP POST requests to each URL with a signed payload.
 Signing: HMAC-SHA256 of the JSON body using the endpoint's secret.
 Header: X-ProcureHub-Signature: sha256=<hex>
 
-Delivery is best-effort (no retry queue in demo mode).
-Production: replace urllib calls with a Celery/RQ task for async retry.
+Workflow code calls enqueue_fanout(), which writes one durable
+`deliver_outbound_webhook` ActiveJob per event inside the caller's
+transaction, so no HTTP happens while workflow row locks are held. The worker
+delivers to every matching endpoint concurrently via webhook_delivery's engine
+(shared connection pool, in-line retries, per-endpoint circuit breakers,
+auto-disable); endpoints that still fail get a follow-up job narrowed to just
+them, scheduled with the task's retry backoff.
+fanout_event() delivers immediately and returns results (endpoint test ping).
 """
 from __future__ import annotations
 
 import hashlib
 import hmac
-import json
 import logging
-import time
 import uuid
-import urllib.request
-import urllib.error
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.retry_policy import get_retry_policy
+from app.services.task_registry import task_registry
+from app.services.webhook_delivery import EndpointTarget, webhook_engine
+
 logger = logging.getLogger(__name__)
 
+DELIVERY_TASK = "deliver_outbound_webhook"
+
 
 # ─────────────────────────────────────────────────────────────────
 # Event Types (mirrors state machine + HITL events)
 # ─────────────────────────────────────────────────────────────────
 class WebhookEvent:
     STATE_TRANSITION  = "STATE_TRANSITION"
+    STATE_TRANSITION_BATCH = "STATE_TRANSITION_BATCH"   # transition_many(): one event listing every transition
     HITL_APPROVED     = "HITL_APPROVED"
     HITL_FLAGGED      = "HITL_FLAGGED"
     PO_IMPORTED       = "PO_IMPORTED"
     ESCALATION        = "ESCALATION"
 
 
+# Subscribing to an event also subscribes to its batched form
+_IMPLIED_EVENTS = {WebhookEvent.STATE_TRANSITION: (WebhookEvent.STATE_TRANSITION_BATCH,)}
+
+
 def _sign_payload(body_bytes: bytes, secret: Optional[str]) -> str:
     """Return HMAC-SHA256 hex signature of body_bytes using secret."""
     if not secret:
@@ -53,117 +70,182 @@ def _build_envelope(
     organization_id: str,
     data: Dict[str, Any],
     delivery_id: str,
+    timestamp: Optional[str] = None,
 ) -> Dict[str, Any]:
     return {
         "delivery_id":    delivery_id,
         "event_type":     event_type,
         "organization_id": organization_id,
-        "timestamp":      datetime.utcnow().isoformat() + "Z",
+        "timestamp":      timestamp or datetime.utcnow().isoformat() + "Z",
         "data":           data,
     }
 
 
-def fanout_event(
+@dataclass(frozen=True)
+class OrgRoutes:
+    """Precompiled routing table for one org. An empty table is the cached "no endpoints" entry."""
+    wildcard: Tuple[EndpointTarget, ...] = ()                                  # No event filter: every event
+    by_event: Dict[str, Tuple[EndpointTarget, ...]] = field(default_factory=dict)
+
+    def for_event(self, event_type: str) -> Tuple[EndpointTarget, ...]:
+        return self.by_event.get(event_type, ()) + self.wildcard
+
+
+_route_cache = TTLCache("webhook_routes", maxsize=10_000, ttl_seconds=settings.WEBHOOK_ROUTE_CACHE_TTL_SECONDS)
+
+
+def _load_routes(db: Session, organization_id: str) -> OrgRoutes:
+    from app.models import WebhookEndpoint
+
+    rows = (
+        db.query(WebhookEndpoint.id, WebhookEndpoint.url, WebhookEndpoint.secret, WebhookEndpoint.event_filter)
+        .filter(
+            WebhookEndpoint.organization_id == organization_id,
+            WebhookEndpoint.is_active       == True,
+        )
+        .order_by(WebhookEndpoint.created_at, WebhookEndpoint.id)
+        .all()
+    )
+    wildcard: List[EndpointTarget] = []
+    by_event: Dict[str, List[EndpointTarget]] = {}
+    for ep_id, url, secret, event_filter in rows:
+        target = EndpointTarget(id=ep_id, url=url, secret=secret)
+        # Comma-separated whitelist; empty = all events
+        allowed = {e.strip() for e in (event_filter or "").split(",") if e.strip()}
+        allowed.update(implied for e in list(allowed) for implied in _IMPLIED_EVENTS.get(e, ()))
+        if not allowed:
+            wildcard.append(target)
+        for event_type in allowed:
+            by_event.setdefault(event_type, []).append(target)
+    return OrgRoutes(tuple(wildcard), {event: tuple(targets) for event, targets in by_event.items()})
+
+
+def invalidate_routes(organization_id: str) -> None:
+    """Drops an org's cached routing table; call after committing any WebhookEndpoint change."""
+    _route_cache.invalidate(organization_id)
+
+
+def _matching_endpoints(
+    db: Session,
+    organization_id: str,
+    event_type: str,
+    endpoint_ids: Optional[List[str]] = None,
+) -> List[EndpointTarget]:
+    """Active endpoints for the org subscribed to event_type, served from the per-org routing cache."""
+    routes = _route_cache.get_or_load(organization_id, lambda: _load_routes(db, organization_id))
+    targets = routes.for_event(event_type)
+    if endpoint_ids is not None:
+        wanted = set(endpoint_ids)
+        targets = tuple(t for t in targets if t.id in wanted)
+    return list(targets)
+
+
+def _envelopes(endpoints: list, deliveries: Dict[str, str], event_type: str, organization_id: str,
+               timestamp: str, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """One signed-payload envelope per endpoint, keyed by endpoint id."""
+    return {
+        ep.id: _build_envelope(event_type, organization_id, data, deliveries[ep.id], timestamp)
+        for ep in endpoints
+    }
+
+
+async def fanout_event(
     db: Session,
     organization_id: str,
     event_type: str,
     data: Dict[str, Any],
-    timeout_seconds: int = 5,
+    endpoint_ids: Optional[List[str]] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Deliver an event to all active webhook endpoints for this org.
+    Deliver an event to all matching active webhook endpoints for this org, concurrently,
+    and wait for the results (used by the endpoint test ping).
 
-    Returns a list of delivery result dicts (one per endpoint).
+    Returns a list of delivery result dicts (one per endpoint). The routing lookup and the
+    result writes are synchronous SQLAlchemy calls, so they run in the threadpool.
     """
-    from app.models import WebhookEndpoint, OutboundWebhookLog
-    from app.services.subscription import get_plan
+    endpoints = await run_in_threadpool(_matching_endpoints, db, organization_id, event_type, endpoint_ids)
+    if not endpoints:
+        return []
 
-    # Fetch active endpoints for this org
-    endpoints = (
-        db.query(WebhookEndpoint)
-        .filter(
-            WebhookEndpoint.organization_id == organization_id,
-            WebhookEndpoint.is_active       == True,
-        )
-        .all()
+    envelopes = _envelopes(
+        endpoints, {ep.id: str(uuid.uuid4()) for ep in endpoints},
+        event_type, organization_id, datetime.utcnow().isoformat() + "Z", data,
     )
+    results = await webhook_engine.fanout([(ep, envelopes[ep.id]) for ep in endpoints])
+    if await run_in_threadpool(webhook_engine.record_results, db, organization_id, envelopes, results):
+        invalidate_routes(organization_id)
+    return [
+        {k: r[k] for k in ("endpoint_id", "url", "delivery_id", "success", "status_code", "duration_ms", "error")}
+        for r in results
+    ]
 
+
+def enqueue_fanout(
+    db: Session,
+    organization_id: str,
+    event_type: str,
+    data: Dict[str, Any],
+) -> Optional[str]:
+    """
+    Queues delivery of an event to the org's matching endpoints as one durable job, in the
+    caller's transaction (the delivery only exists if the transition commits).
+    Returns the job id, or None when no endpoint wants this event.
+    """
+    endpoints = _matching_endpoints(db, organization_id, event_type)
     if not endpoints:
-        return []
+        return None
+
+    from app.services.worker import worker_queue
+    # Delivery ids are fixed at enqueue time so retries reuse them (receivers can de-duplicate)
+    return worker_queue.enqueue_job(
+        task_name = DELIVERY_TASK,
+        payload   = {
+            "organization_id": organization_id,
+            "event_type":      event_type,
+            "timestamp":       datetime.utcnow().isoformat() + "Z",
+            "data":            data,
+            "deliveries":      {ep.id: str(uuid.uuid4()) for ep in endpoints},
+            "attempt":         1,
+        },
+        db        = db,
+    )
 
-    results: List[Dict[str, Any]] = []
-
-    for ep in endpoints:
-        # Check event filter (comma-separated whitelist; empty = all)
-        if ep.event_filter:
-            allowed = {e.strip() for e in ep.event_filter.split(",")}
-            if event_type not in allowed:
-                continue
-
-        delivery_id = str(uuid.uuid4())
-        envelope    = _build_envelope(event_type, organization_id, data, delivery_id)
-        body_bytes  = json.dumps(envelope, default=str).encode("utf-8")
-        signature   = _sign_payload(body_bytes, ep.secret)
-
-        headers = {
-            "Content-Type":            "application/json",
-            "X-ProcureHub-Delivery":   delivery_id,
-            "X-ProcureHub-Event":      event_type,
-            "X-ProcureHub-Signature":  f"sha256={signature}" if signature else "",
-            "User-Agent":              "ProcureHub-Webhooks/1.0",
-        }
-
-        start_ms   = int(time.monotonic() * 1000)
-        success    = False
-        status_code = None
-        resp_body  = ""
-        error_msg  = ""
-
-        try:
-            req      = urllib.request.Request(ep.url, data=body_bytes, headers=headers, method="POST")
-            with urllib.request.urlopen(req, timeout=timeout_seconds) as resp:
-                status_code = resp.status
-                resp_body   = resp.read(512).decode(errors="replace")
-                success     = 200 <= status_code < 300
-        except urllib.error.HTTPError as e:
-            status_code = e.code
-            resp_body   = e.read(512).decode(errors="replace")
-            error_msg   = f"HTTP {e.code}: {e.reason}"
-        except Exception as exc:
-            error_msg = str(exc)
-
-        duration_ms = int(time.monotonic() * 1000) - start_ms
-
-        log = OutboundWebhookLog(
-            id              = str(uuid.uuid4()),
-            endpoint_id     = ep.id,
-            organization_id = organization_id,
-            event_type      = event_type,
-            payload         = envelope,
-            response_status = status_code,
-            response_body   = resp_body[:512] if resp_body else None,
-            duration_ms     = duration_ms,
-            success         = success,
-            error_message   = error_msg or None,
-        )
-        db.add(log)
-
-        level = logger.info if success else logger.warning
-        level(f"Webhook [{ep.url}] event={event_type} status={status_code} ok={success} {duration_ms}ms")
-
-        results.append({
-            "endpoint_id": ep.id,
-            "url":         ep.url,
-            "delivery_id": delivery_id,
-            "success":     success,
-            "status_code": status_code,
-            "duration_ms": duration_ms,
-            "error":       error_msg or None,
-        })
-
-    try:
-        db.flush()
-    except Exception as e:
-        logger.error(f"Failed to flush webhook log: {e}")
-
-    return results
+
+@task_registry.task(DELIVERY_TASK, kind="async", concurrency=10, timeout=120)
+async def deliver_outbound_webhook(payload: Dict[str, Any], db: Optional[Session]) -> None:
+    """Worker task: delivers one queued event; failed endpoints get a narrowed, backed-off follow-up job."""
+    organization_id = payload["organization_id"]
+    event_type      = payload["event_type"]
+    deliveries      = payload["deliveries"]
+    attempt         = payload.get("attempt", 1)
+
+    # Endpoints deleted, disabled or re-filtered since enqueue are skipped
+    endpoints = _matching_endpoints(db, organization_id, event_type, endpoint_ids=list(deliveries))
+    envelopes = _envelopes(endpoints, deliveries, event_type, organization_id, payload["timestamp"], payload["data"])
+    results   = await webhook_engine.fanout([(ep, envelopes[ep.id]) for ep in endpoints])
+    disabled  = set(webhook_engine.record_results(db, organization_id, envelopes, results))
+    if disabled:
+        invalidate_routes(organization_id)
+
+    failed = {r["endpoint_id"]: deliveries[r["endpoint_id"]] for r in results
+              if not r["success"] and r["endpoint_id"] not in disabled}
+    if not failed:
+        return
+    policy = get_retry_policy(DELIVERY_TASK)
+    if attempt >= policy.max_attempts:
+        logger.error(f"Webhook delivery {event_type} gave up on {len(failed)} endpoint(s) after {attempt} attempts.")
+        return
+
+    delay = policy.next_delay(attempt)
+    if any(r["short_circuited"] for r in results if r["endpoint_id"] in failed):
+        # No point retrying before an open circuit can go half-open
+        delay = max(delay, settings.WEBHOOK_BREAKER_RESET_SECONDS)
+
+    from app.services.worker import worker_queue
+    worker_queue.enqueue_job(
+        task_name     = DELIVERY_TASK,
+        payload       = {**payload, "deliveries": failed, "attempt": attempt + 1},
+        delay_seconds = int(delay),
+        db            = db,
+    )
+    logger.info(f"Webhook delivery {event_type}: {len(failed)} endpoint(s) rescheduled (attempt {attempt + 1}).")
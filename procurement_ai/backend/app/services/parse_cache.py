@@ -0,0 +1,238 @@
+# file: backend/app/services/parse_cache.py
+"""
+Content-addressed cache of vendor message parses.
+
+Vendors repeat the same short replies ("ok", "mil gaya", "kal bhej denge"), and
+each one would otherwise cost an LLM round-trip. Entries are keyed by
+sha256(model, prompt version, language hint, normalized text), so switching
+OPENAI_MODEL starts a fresh keyspace. Normalization applies
+NFKC, casefolds, collapses whitespace and strips surrounding punctuation, so
+"Ok." and " OK " share an entry.
+
+Two tiers, both expiring PARSE_CACHE_TTL_SECONDS after the parse:
+  * an in-process LRU (TTLCache "vendor_message_parses");
+  * the parse_cache table, shared by every process. It is read on an LRU miss.
+    Stores are written once the caller's outermost transaction commits, in a
+    short transaction of their own (on a thread when the commit ran on the
+    event loop), so the webhook transaction never holds cache row locks. A
+    background task purges expired rows every PARSE_CACHE_PURGE_INTERVAL_SECONDS.
+
+ETAs are stored according to the text:
+  * Relative ETAs ("kal", "next week") are stored as a day offset from the
+    date of the message that was parsed. A hit re-resolves them against the new
+    message's date.
+  * Explicit dates ("28/05", "5 June") are stored as-is. "2-3 din" is a range,
+    not a date, so it counts as relative.
+  * A message that names a weekday and yields an ETA is not cached, because no
+    fixed offset fits it.
+Only model parses are stored; rule-based fallbacks never are.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.core.transactions import after_outer_commit
+
+logger = logging.getLogger(__name__)
+
+_MONTHS = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+_ABSOLUTE_DATE = re.compile(
+    rf"\d{{4}}-\d{{1,2}}-\d{{1,2}}|\b\d{{1,2}}-\d{{1,2}}-\d{{2,4}}\b|\b\d{{1,2}}\s*[/.]\s*\d{{1,2}}\b"
+    rf"|\b\d{{1,2}}\s*(st|nd|rd|th)?\s*{_MONTHS}\b|\b{_MONTHS}\s*\d{{1,2}}\b"
+)
+_WEEKDAY = re.compile(r"\b(mon|tues?|wed(nes)?|thu(rs)?|fri|sat(ur)?|sun)(day)?\b|somvar|mangalvar|budhvar|guruvar|shukravar|shanivar|ravivar")
+_PENDING_KEY = "parse_cache_pending"   # Session.info: rows to write once the transaction commits
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split()).strip(" .,!?;:-")
+
+
+def cache_key(prompt_version: str, text: str, language_hint: Optional[str]) -> str:
+    material = "\x1f".join((settings.OPENAI_MODEL, prompt_version, language_hint or "", normalize_text(text)))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _eta_mode(text: str) -> str:
+    """'absolute' if the text names a calendar date, 'weekday' if a weekday, else 'relative'."""
+    normalized = normalize_text(text)
+    if _ABSOLUTE_DATE.search(normalized):
+        return "absolute"
+    if _WEEKDAY.search(normalized):
+        return "weekday"
+    return "relative"
+
+
+class ParseCache:
+    def __init__(self, lru_size: int):
+        self.lru = TTLCache("vendor_message_parses", maxsize=lru_size)
+        self.writes: Set[asyncio.Future] = set()   # Row writes handed to a thread after a commit on the loop
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+
+    def lookup(
+        self,
+        db: Optional[Session],
+        prompt_version: str,
+        text: str,
+        language_hint: Optional[str],
+        received_on: date,
+    ) -> Optional[Dict[str, Any]]:
+        """The cached parse of `text` as if received on `received_on`, or None."""
+        key = cache_key(prompt_version, text, language_hint)
+        entry = self.lru.get(key)
+        if entry is None and db is not None:
+            from app.models import ParseCacheEntry
+
+            row = db.execute(
+                select(ParseCacheEntry.result, ParseCacheEntry.eta, ParseCacheEntry.eta_offset_days, ParseCacheEntry.expires_at)
+                .where(ParseCacheEntry.key == key, ParseCacheEntry.expires_at > datetime.utcnow())
+            ).first()
+            if row is not None:
+                entry = {"result": row.result, "eta": row.eta, "eta_offset_days": row.eta_offset_days}
+                self.lru.set(key, entry, ttl_seconds=(row.expires_at - datetime.utcnow()).total_seconds())
+                self.db_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+
+        result = dict(entry["result"])
+        if entry["eta_offset_days"] is not None:
+            result["extracted_eta"] = (received_on + timedelta(days=entry["eta_offset_days"])).isoformat()
+        else:
+            result["extracted_eta"] = entry["eta"]
+        return result
+
+    def store(
+        self,
+        db: Optional[Session],
+        prompt_version: str,
+        text: str,
+        language_hint: Optional[str],
+        received_on: date,
+        result: Dict[str, Any],
+    ) -> None:
+        eta, offset = result.get("extracted_eta"), None
+        if eta:
+            mode = _eta_mode(text)
+            if mode == "weekday":
+                self.skipped += 1
+                return
+            if mode == "relative":
+                try:
+                    offset, eta = (date.fromisoformat(str(eta)) - received_on).days, None
+                except ValueError:
+                    self.skipped += 1   # Not a date we can re-resolve
+                    return
+        entry = {
+            "result": {k: v for k, v in result.items() if k != "extracted_eta"},
+            "eta": eta,
+            "eta_offset_days": offset,
+        }
+        key = cache_key(prompt_version, text, language_hint)
+        self.lru.set(key, entry, ttl_seconds=settings.PARSE_CACHE_TTL_SECONDS)
+        self.stores += 1
+        if db is not None:
+            now = datetime.utcnow()
+            db.info.setdefault(_PENDING_KEY, {})[key] = {
+                **entry,
+                "prompt_version": prompt_version,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=settings.PARSE_CACHE_TTL_SECONDS),
+            }
+
+    def persist(self, db: Session, rows: Dict[str, Dict[str, Any]]) -> None:
+        """Upserts cache rows (key -> values) and commits."""
+        from app.models import ParseCacheEntry
+
+        for key, values in rows.items():
+            stmt = upsert_insert(db, ParseCacheEntry).values(key=key, **values)
+            db.execute(stmt.on_conflict_do_update(index_elements=[ParseCacheEntry.key], set_=values))
+        db.commit()
+
+    def purge_expired(self, db: Session) -> int:
+        from app.models import ParseCacheEntry
+
+        purged = db.execute(delete(ParseCacheEntry).where(ParseCacheEntry.expires_at <= datetime.utcnow())).rowcount or 0
+        db.commit()
+        logger.info(f"Parse cache: purged {purged} expired entr{'y' if purged == 1 else 'ies'}")
+        return purged
+
+    async def drain(self) -> None:
+        """Waits for row writes still running in threads (tests, shutdown)."""
+        while self.writes:
+            await asyncio.gather(*list(self.writes), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lru = self.lru.stats()
+        lookups = lru["hits"] + lru["misses"]
+        return {
+            "lru_hits": lru["hits"],
+            "db_hits":  self.db_hits,
+            "misses":   self.misses,
+            "stores":   self.stores,
+            "skipped":  self.skipped,
+            "hit_rate": round((lru["hits"] + self.db_hits) / lookups, 4) if lookups else None,
+        }
+
+    def clear(self) -> None:
+        self.lru.clear()
+        self.lru.hits = self.lru.misses = self.lru.evictions = 0
+        self.db_hits = self.misses = self.stores = self.skipped = 0
+
+
+parse_cache = ParseCache(lru_size=settings.PARSE_CACHE_LRU_SIZE)
+
+
+def _write_rows(bind, rows: Dict[str, Dict[str, Any]]) -> None:
+    db = Session(bind=bind)
+    try:
+        parse_cache.persist(db, rows)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Parse cache: could not store {len(rows)} entr{'y' if len(rows) == 1 else 'ies'}: {e}")
+    finally:
+        db.close()
+
+
+def _persist_after_commit(session: Session, rows: Dict[str, Dict[str, Any]]) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _write_rows(session.get_bind(), rows)   # Request thread: already off the event loop
+        return
+    # Committed on the loop (worker jobs): never block it on the upsert
+    write = loop.run_in_executor(None, _write_rows, session.get_bind(), rows)
+    parse_cache.writes.add(write)
+    write.add_done_callback(parse_cache.writes.discard)
+
+
+after_outer_commit(_PENDING_KEY, _persist_after_commit)
+
+
+async def run_parse_cache_purger(session_factory: Callable[[], Session]) -> None:
+    """Background loop deleting expired parse_cache rows (started with the worker loop)."""
+    while True:
+        await asyncio.sleep(settings.PARSE_CACHE_PURGE_INTERVAL_SECONDS)
+        db = session_factory()
+        try:
+            await asyncio.to_thread(parse_cache.purge_expired, db)
+        except Exception as e:
+            logger.error(f"Parse cache purge failed: {e}")
+        finally:
+            db.close()
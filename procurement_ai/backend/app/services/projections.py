@@ -0,0 +1,333 @@
+# file: backend/app/services/projections.py
+"""
+Snapshot-plus-replay projections over the append-only `workflow_events` log.
+
+A workflow's projected state is the fold of its events, in (created_at, id)
+order, through apply_event(). Every PROJECTION_SNAPSHOT_EVERY events the fold is
+stored as a WorkflowSnapshot, so the state at any time T costs one snapshot
+load plus a short tail replay:
+
+    state_at(db, workflow_id)                      # Current projected state
+    state_at(db, workflow_id, at=datetime(...))    # Time travel
+
+Transitions call schedule_snapshots() with the workflow versions they just
+bumped. Every PROJECTION_SNAPSHOT_EVERY-th transition of a workflow queues an
+`extend_projections` worker job that writes the missing snapshots, so tails
+stay bounded without rebuilds and the write path runs no extra query.
+
+project_workflows() extends (or, with full=True, rebuilds) the snapshots for a
+set of workflows and reports where the projection disagrees with
+ProcurementWorkflow.current_state. rebuild_organization() runs it over a whole
+org in parallel batches; see backend/scripts/rebuild_projections.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.state_machine import WorkflowState
+from app.services.task_registry import task_registry
+from app.services.worker import worker_queue
+
+logger = logging.getLogger(__name__)
+
+STATE_CHANGED_PREFIX = "STATE_CHANGED_TO_"
+INGESTION_EVENTS = ("PO_INGESTED", "PO_REINGESTED")
+INGESTION_FIELDS = ("po_number", "vendor_id", "task_id", "total_amount", "line_items_count", "source_filename")
+SNAPSHOT_TASK = "extend_projections"
+
+
+def initial_state() -> Dict[str, Any]:
+    return {
+        "state":            WorkflowState.CREATED.value,
+        "po_number":        None,
+        "vendor_id":        None,
+        "task_id":          None,
+        "total_amount":     None,
+        "line_items_count": None,
+        "source_filename":  None,
+        "transitions":      0,
+        "ingestions":       0,
+        "last_reason":      None,
+        "last_event_type":  None,
+        "last_event_at":    None,
+    }
+
+
+def apply_event(state: Dict[str, Any], event_type: str, payload: Optional[Dict[str, Any]], at: datetime) -> None:
+    """Folds one event into `state` (in place)."""
+    payload = payload or {}
+    if event_type in INGESTION_EVENTS:
+        for key in INGESTION_FIELDS:
+            if key in payload:
+                state[key] = payload[key]
+        state["ingestions"] += 1
+    elif event_type.startswith(STATE_CHANGED_PREFIX):
+        state["state"] = payload.get("new_state") or event_type[len(STATE_CHANGED_PREFIX):]
+        state["transitions"] += 1
+        state["last_reason"] = payload.get("reason")
+    state["last_event_type"] = event_type
+    state["last_event_at"] = at.isoformat() if at else None
+
+
+def _event_columns():
+    from app.models import WorkflowEvent
+    return (
+        WorkflowEvent.id, WorkflowEvent.workflow_id, WorkflowEvent.organization_id,
+        WorkflowEvent.event_type, WorkflowEvent.payload, WorkflowEvent.created_at,
+    )
+
+
+def _after_snapshot(snapshot, event_id: str, created_at: datetime) -> bool:
+    """True if the event is not already folded into `snapshot`."""
+    if snapshot is None:
+        return True
+    if created_at != snapshot.last_event_at:
+        return created_at > snapshot.last_event_at
+    return event_id not in set(snapshot.last_event_ids or ())
+
+
+def state_at(db: Session, workflow_id: str, at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Projected state of one workflow as of `at` (default: now): nearest snapshot plus tail replay."""
+    from app.models import WorkflowEvent, WorkflowSnapshot
+
+    snapshot_query = select(WorkflowSnapshot).where(WorkflowSnapshot.workflow_id == workflow_id)
+    if at is not None:
+        snapshot_query = snapshot_query.where(WorkflowSnapshot.last_event_at <= at)
+    snapshot = db.execute(
+        snapshot_query.order_by(WorkflowSnapshot.last_event_at.desc(), WorkflowSnapshot.event_count.desc()).limit(1)
+    ).scalar_one_or_none()
+
+    events = select(*_event_columns()).where(WorkflowEvent.workflow_id == workflow_id)
+    if snapshot is not None:
+        events = events.where(WorkflowEvent.created_at >= snapshot.last_event_at)
+    if at is not None:
+        events = events.where(WorkflowEvent.created_at <= at)
+
+    state = dict(snapshot.state) if snapshot is not None else initial_state()
+    event_count = snapshot.event_count if snapshot is not None else 0
+    replayed = 0
+    for event_id, _, _, event_type, payload, created_at in db.execute(
+        events.order_by(WorkflowEvent.created_at, WorkflowEvent.id)
+    ):
+        if _after_snapshot(snapshot, event_id, created_at):
+            apply_event(state, event_type, payload, created_at)
+            replayed += 1
+    return {
+        "workflow_id":     workflow_id,
+        "as_of":           at.isoformat() if at else None,
+        "state":           state,
+        "event_count":     event_count + replayed,
+        "from_snapshot":   snapshot.last_event_at.isoformat() if snapshot is not None else None,
+        "replayed_events": replayed,
+    }
+
+
+def _latest_snapshots(db: Session, workflow_ids: List[str]) -> Dict[str, Any]:
+    from app.models import WorkflowSnapshot
+
+    latest: Dict[str, Any] = {}
+    for snapshot in db.execute(
+        select(WorkflowSnapshot)
+        .where(WorkflowSnapshot.workflow_id.in_(workflow_ids))
+        .order_by(WorkflowSnapshot.workflow_id, WorkflowSnapshot.last_event_at, WorkflowSnapshot.event_count)
+    ).scalars():
+        latest[snapshot.workflow_id] = snapshot   # Ordered ascending: the last one per workflow wins
+    return latest
+
+
+def project_workflows(
+    db: Session,
+    workflow_ids: Iterable[str],
+    full: bool = False,
+    snapshot_every: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Replays the events of `workflow_ids` from their latest snapshot (or from scratch with full=True,
+    dropping existing snapshots), storing a new snapshot every `snapshot_every` events.
+    Returns counts plus the workflows whose projected state differs from current_state.
+    """
+    from app.models import ProcurementWorkflow, WorkflowEvent, WorkflowSnapshot
+
+    workflow_ids = list(workflow_ids)
+    every = snapshot_every or settings.PROJECTION_SNAPSHOT_EVERY
+    if not workflow_ids:
+        return {"workflows": 0, "events_replayed": 0, "snapshots_written": 0, "drift": []}
+
+    if full:
+        db.execute(
+            delete(WorkflowSnapshot)
+            .where(WorkflowSnapshot.workflow_id.in_(workflow_ids))
+            .execution_options(synchronize_session=False)
+        )
+        snapshots: Dict[str, Any] = {}
+    else:
+        snapshots = _latest_snapshots(db, workflow_ids)
+
+    events = select(*_event_columns()).where(WorkflowEvent.workflow_id.in_(workflow_ids))
+    if snapshots and len(snapshots) == len(workflow_ids):
+        # Every workflow has a snapshot: nothing before the oldest of them is needed
+        events = events.where(WorkflowEvent.created_at >= min(s.last_event_at for s in snapshots.values()))
+    rows = db.execute(events.order_by(WorkflowEvent.workflow_id, WorkflowEvent.created_at, WorkflowEvent.id))
+
+    projected: Dict[str, str] = {}
+    new_snapshots: List[Dict[str, Any]] = []
+    replayed_total = 0
+    for workflow_id, workflow_events in groupby(rows, key=lambda row: row[1]):
+        snapshot = snapshots.get(workflow_id)
+        state = dict(snapshot.state) if snapshot is not None else initial_state()
+        event_count = snapshot.event_count if snapshot is not None else 0
+        since_snapshot = 0
+        last_at, ids_at_last = None, []
+        for event_id, _, organization_id, event_type, payload, created_at in workflow_events:
+            if not _after_snapshot(snapshot, event_id, created_at):
+                continue
+            apply_event(state, event_type, payload, created_at)
+            event_count += 1
+            since_snapshot += 1
+            replayed_total += 1
+            if created_at == last_at:
+                ids_at_last.append(event_id)
+            else:
+                last_at, ids_at_last = created_at, [event_id]
+            if since_snapshot >= every:
+                new_snapshots.append({
+                    "id":              str(uuid.uuid4()),
+                    "organization_id": organization_id,
+                    "workflow_id":     workflow_id,
+                    "state":           dict(state),
+                    "event_count":     event_count,
+                    "last_event_at":   last_at,
+                    "last_event_ids":  list(ids_at_last),
+                    "created_at":      datetime.utcnow(),
+                })
+                since_snapshot = 0
+        projected[workflow_id] = state["state"]
+
+    if new_snapshots:
+        db.execute(insert(WorkflowSnapshot), new_snapshots)
+
+    # Workflows with no events at all project to their initial state
+    current = dict(db.execute(
+        select(ProcurementWorkflow.id, ProcurementWorkflow.current_state)
+        .where(ProcurementWorkflow.id.in_(workflow_ids))
+    ).all())
+    for workflow_id in workflow_ids:
+        if workflow_id not in projected:
+            snapshot = snapshots.get(workflow_id)
+            projected[workflow_id] = snapshot.state["state"] if snapshot is not None else WorkflowState.CREATED.value
+    drift = sorted(
+        workflow_id for workflow_id, state in projected.items()
+        if workflow_id in current and current[workflow_id] != state
+    )
+    return {
+        "workflows":         len(workflow_ids),
+        "events_replayed":   replayed_total,
+        "snapshots_written": len(new_snapshots),
+        "drift":             drift,
+    }
+
+
+def schedule_snapshots(db: Session, organization_id: str, versions: Dict[str, int]) -> List[str]:
+    """
+    Queues a snapshot pass for the workflows whose transition just bumped `version` (new value, keyed
+    by workflow id) to a multiple of PROJECTION_SNAPSHOT_EVERY transitions; returns their ids.
+    Reads no rows: the version comes from the workflow UPDATE the transition already made.
+    """
+    every = settings.PROJECTION_SNAPSHOT_EVERY
+    # Versions start at 1, so version - 1 is the workflow's transition count
+    due = sorted(workflow_id for workflow_id, version in versions.items() if version and (version - 1) % every == 0)
+    if due:
+        # One key per org: passes run one at a time, so a busy workflow never gets duplicate snapshots
+        worker_queue.enqueue_job(SNAPSHOT_TASK, {"workflow_ids": due}, db=db,
+                                 ordering_key=f"projections:{organization_id}")
+    return due
+
+
+def rebuild_organization(
+    organization_id: str,
+    full: bool = False,
+    batch_size: int = 200,
+    workers: int = 4,
+    session_factory: Optional[Callable[[], Session]] = None,
+) -> Dict[str, Any]:
+    """Projects every workflow of an org, `batch_size` workflows per transaction on `workers` threads."""
+    from app.models import ProcurementWorkflow
+
+    if session_factory is None:
+        from app.core.database import SessionLocal
+        session_factory = SessionLocal
+
+    db = session_factory()
+    try:
+        workflow_ids = list(db.execute(
+            select(ProcurementWorkflow.id)
+            .where(ProcurementWorkflow.organization_id == organization_id)
+            .order_by(ProcurementWorkflow.id)
+        ).scalars())
+    finally:
+        db.close()
+    batches = [workflow_ids[i:i + batch_size] for i in range(0, len(workflow_ids), batch_size)]
+
+    def run_batch(batch: List[str]) -> Dict[str, Any]:
+        session = session_factory()
+        try:
+            result = project_workflows(session, batch, full=full)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    totals = {"organization_id": organization_id, "workflows": 0, "events_replayed": 0,
+              "snapshots_written": 0, "batches": len(batches), "drift": []}
+    started = datetime.utcnow()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="projection") as pool:
+        for result in pool.map(run_batch, batches):
+            for key in ("workflows", "events_replayed", "snapshots_written"):
+                totals[key] += result[key]
+            totals["drift"].extend(result["drift"])
+    totals["duration_seconds"] = round((datetime.utcnow() - started).total_seconds(), 3)
+    logger.info(
+        f"Projections for org {organization_id}: {totals['workflows']} workflow(s), "
+        f"{totals['events_replayed']} event(s) replayed, {totals['snapshots_written']} snapshot(s), "
+        f"{len(totals['drift'])} drifted"
+    )
+    return totals
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# TASK HANDLERS
+# ──────────────────────────────────────────────────────────────────────────────
+
+@task_registry.task(SNAPSHOT_TASK, kind="async", concurrency=2, timeout=120)
+async def extend_projections(payload: Dict[str, Any], db: Optional[Session] = None) -> Dict[str, Any]:
+    """Writes the snapshots that schedule_snapshots() found missing."""
+    if db is None:
+        logger.warning("extend_projections needs a database session; skipped.")
+        return {"status": "skipped"}
+    return await asyncio.to_thread(_extend_projections, db.get_bind(), payload["workflow_ids"])
+
+
+def _extend_projections(bind, workflow_ids: List[str]) -> Dict[str, Any]:
+    db = Session(bind=bind, autoflush=False)
+    try:
+        result = project_workflows(db, workflow_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return {key: result[key] for key in ("workflows", "events_replayed", "snapshots_written")}
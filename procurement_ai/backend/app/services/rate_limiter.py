@@ -0,0 +1,120 @@
+"""
+Token-bucket throttling for outbound WhatsApp sends.
+
+Meta caps throughput per business phone number (messages per second, by tier)
+and per business→recipient pair. The outbox task takes one token from the
+META_PHONE_NUMBER_ID bucket and one from the recipient's bucket before sending;
+when either is empty it raises RateLimited, and the worker requeues the job with
+run_at set to when tokens will be available — no attempt is consumed.
+
+Buckets live in process memory, so the configured tier applies per worker process.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.task_registry import DeferJob
+
+
+class RateLimited(DeferJob):
+    """A send would exceed a token bucket; retry after `retry_after` seconds."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate     = rate          # Tokens refilled per second
+        self.capacity = capacity      # Burst size
+        self.tokens   = capacity
+        self._clock   = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def level(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` are available (0 when they already are)."""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self, tokens: float = 1.0) -> None:
+        self.tokens -= tokens
+
+
+class WhatsAppRateLimiter:
+    """Paces sends per business phone number and per recipient."""
+
+    MAX_RECIPIENT_BUCKETS = 10_000   # Full (idle) recipient buckets are pruned beyond this
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._numbers: Dict[str, TokenBucket] = {}
+        self._recipients: Dict[str, TokenBucket] = {}
+        self.deferred = 0
+
+    def _number_bucket(self, phone_number_id: str) -> TokenBucket:
+        bucket = self._numbers.get(phone_number_id)
+        if bucket is None:
+            rate = settings.WHATSAPP_MESSAGES_PER_SECOND
+            bucket = self._numbers[phone_number_id] = TokenBucket(rate, max(1.0, rate), self._clock)
+        return bucket
+
+    def _recipient_bucket(self, recipient: str) -> TokenBucket:
+        bucket = self._recipients.get(recipient)
+        if bucket is None:
+            if len(self._recipients) >= self.MAX_RECIPIENT_BUCKETS:
+                self._prune()
+            interval = settings.WHATSAPP_PAIR_INTERVAL_SECONDS
+            bucket = self._recipients[recipient] = TokenBucket(
+                1.0 / interval, max(1, settings.WHATSAPP_PAIR_BURST), self._clock
+            )
+        return bucket
+
+    def _prune(self) -> None:
+        for key in [k for k, b in self._recipients.items() if b.level() >= b.capacity]:
+            del self._recipients[key]
+
+    def acquire(self, recipient: str, phone_number_id: Optional[str] = None) -> None:
+        """Takes one token from both buckets, or raises RateLimited without taking either."""
+        phone_number_id = phone_number_id or settings.META_PHONE_NUMBER_ID
+        with self._lock:
+            buckets: Tuple[TokenBucket, ...] = (self._number_bucket(phone_number_id), self._recipient_bucket(recipient))
+            wait = max(bucket.wait_time() for bucket in buckets)
+            if wait > 0:
+                self.deferred += 1
+                raise RateLimited(wait, f"WhatsApp send to {recipient} throttled for {wait:.2f}s.")
+            for bucket in buckets:
+                bucket.take()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current bucket levels for the metrics endpoint."""
+        with self._lock:
+            throttled = [key for key, b in self._recipients.items() if b.level() < 1]
+            return {
+                "phone_numbers": {
+                    key: {"tokens": round(b.level(), 3), "capacity": b.capacity, "rate_per_second": b.rate}
+                    for key, b in self._numbers.items()
+                },
+                "recipients_tracked": len(self._recipients),
+                "recipients_throttled": len(throttled),
+                "throttled_sample": throttled[:20],
+                "deferred_total": self.deferred,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._numbers.clear()
+            self._recipients.clear()
+            self.deferred = 0
+
+
+whatsapp_rate_limiter = WhatsAppRateLimiter()
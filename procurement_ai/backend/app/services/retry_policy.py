@@ -0,0 +1,116 @@
+"""
+Retry policies for durable worker jobs.
+
+Every task_name maps to a RetryPolicy: capped exponential backoff with jitter,
+a maximum number of attempts, and exception classes that should fail the job
+immediately instead of being retried. Jitter spreads retries of jobs that failed
+together (e.g. during a Meta Cloud API brownout) so they do not retry in lockstep.
+
+enqueue_job() can override the registered policy for a single job; the override
+is stored on the ActiveJob row so retries keep honouring it across worker restarts.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple, Type, Union
+
+JITTER_MODES = ("full", "equal", "none")
+
+
+def _exception_name(exc_type: Union[str, Type[BaseException]]) -> str:
+    return exc_type if isinstance(exc_type, str) else exc_type.__name__
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 4                 # Total executions, including the first
+    base_delay_seconds: float = 10.0      # Delay before the first retry (pre-jitter)
+    max_delay_seconds: float = 600.0      # Backoff cap
+    jitter: str = "full"                  # 'full' | 'equal' | 'none'
+    non_retryable: Tuple[str, ...] = ()   # Exception class names that fail the job at once
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError("RetryPolicy.max_attempts must be at least 1.")
+        if self.jitter not in JITTER_MODES:
+            raise ValueError(f"RetryPolicy.jitter must be one of {JITTER_MODES}.")
+        # Accept exception classes or names; store names so the policy stays JSON-serialisable
+        object.__setattr__(self, "non_retryable", tuple(_exception_name(e) for e in self.non_retryable))
+
+    def next_delay(self, attempt: int, rng: random.Random = random) -> float:
+        """Seconds to wait after failed attempt number `attempt` (1-based)."""
+        ceiling = min(self.max_delay_seconds, self.base_delay_seconds * (2 ** max(0, attempt - 1)))
+        if self.jitter == "full":
+            return rng.uniform(0, ceiling)
+        if self.jitter == "equal":
+            return ceiling / 2 + rng.uniform(0, ceiling / 2)
+        return ceiling
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        """False when `exc` (or any of its base classes) is listed in non_retryable."""
+        return not any(cls.__name__ in self.non_retryable for cls in type(exc).__mro__)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["non_retryable"] = list(self.non_retryable)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RetryPolicy":
+        return cls(**{**data, "non_retryable": tuple(data.get("non_retryable") or ())})
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+# Registry keyed by ActiveJob.task_name
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    # Meta brownouts recover in minutes: more attempts, wider spread. Malformed payloads never will.
+    "dispatch_whatsapp_outbox": RetryPolicy(
+        max_attempts       = 6,
+        base_delay_seconds = 5,
+        max_delay_seconds  = 900,
+        non_retryable      = (ValueError, KeyError),
+    ),
+    "escalate_unresponsive_vendor": RetryPolicy(
+        max_attempts       = 4,
+        base_delay_seconds = 30,
+        max_delay_seconds  = 1800,
+    ),
+    # Whole-job retries only; per-endpoint failures are rescheduled as narrowed follow-up jobs
+    "deliver_outbound_webhook": RetryPolicy(
+        max_attempts       = 5,
+        base_delay_seconds = 30,
+        max_delay_seconds  = 3600,
+    ),
+    # Later messages from the same vendor wait behind a retrying one, so keep the backoff short
+    "process_inbound_message": RetryPolicy(
+        max_attempts       = 5,
+        base_delay_seconds = 2,
+        max_delay_seconds  = 120,
+        non_retryable      = (KeyError,),
+    ),
+    # Each attempt resumes from the import's last committed checkpoint; a missing spool file cannot recover
+    "process_import": RetryPolicy(
+        max_attempts       = 4,
+        base_delay_seconds = 10,
+        max_delay_seconds  = 600,
+        non_retryable      = (FileNotFoundError,),
+    ),
+}
+
+
+def register_retry_policy(task_name: str, policy: RetryPolicy) -> None:
+    RETRY_POLICIES[task_name] = policy
+
+
+def get_retry_policy(task_name: str, override: Optional[Dict[str, Any]] = None) -> RetryPolicy:
+    """Per-job override (as stored on ActiveJob.retry_policy) wins over the task registry."""
+    if override:
+        return RetryPolicy.from_dict(override)
+    return RETRY_POLICIES.get(task_name, DEFAULT_RETRY_POLICY)
+
+
+def describe_policies(task_names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    names = task_names if task_names is not None else RETRY_POLICIES.keys()
+    return {name: get_retry_policy(name).to_dict() for name in names}
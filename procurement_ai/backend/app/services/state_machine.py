@@ -1,7 +1,7 @@
 # file: backend/app/services/state_machine.py
 import logging
 from enum import Enum
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, FrozenSet, Optional, List, Sequence, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
 from app.core.config import settings
@@ -35,12 +35,91 @@ VALID_TRANSITIONS: Dict[WorkflowState, List[WorkflowState]] = {
     WorkflowState.CANCELLED: []
 }
 
+# ─────────────────────────────────────────────────────────────────
+# Compiled at import: O(1) lookups for the per-webhook hot path
+# ─────────────────────────────────────────────────────────────────
+
+def _compile_successors() -> Dict[WorkflowState, FrozenSet[WorkflowState]]:
+    # Any non-COMPLETED state may be cancelled, on top of the explicit table
+    return {
+        state: frozenset(VALID_TRANSITIONS.get(state, [])) | (
+            frozenset() if state == WorkflowState.COMPLETED else frozenset({WorkflowState.CANCELLED})
+        )
+        for state in WorkflowState
+    }
+
+
+SUCCESSORS: Dict[WorkflowState, FrozenSet[WorkflowState]] = _compile_successors()
+# Reverse index: states from which each target can be reached in one transition
+PREDECESSORS: Dict[WorkflowState, FrozenSet[WorkflowState]] = {
+    target: frozenset(state for state, targets in SUCCESSORS.items() if target in targets)
+    for target in WorkflowState
+}
+_STATE_BY_VALUE: Dict[str, WorkflowState] = {state.value: state for state in WorkflowState}
+# States that end a PO: entering one changes which workflow is "open" for a vendor's org
+CLOSED_STATES: FrozenSet[WorkflowState] = frozenset({WorkflowState.COMPLETED, WorkflowState.CANCELLED})
+
+
+def parse_state(value: str) -> WorkflowState:
+    """WorkflowState for a stored state string; a dict lookup instead of the Enum constructor."""
+    try:
+        return _STATE_BY_VALUE[value]
+    except KeyError:
+        return WorkflowState(value)   # Raises the usual ValueError for unknown states
+
+class TransitionConflictError(ValueError):
+    """An optimistic transition kept losing the version compare-and-swap to concurrent writers."""
+
+
 class StateMachineService:
     @staticmethod
     def is_transition_valid(current: WorkflowState, target: WorkflowState) -> bool:
-        if target == WorkflowState.CANCELLED and current != WorkflowState.COMPLETED:
-            return True
-        return target in VALID_TRANSITIONS.get(current, [])
+        return target in SUCCESSORS[current]
+
+    @staticmethod
+    def _validate(current: WorkflowState, target: WorkflowState) -> None:
+        if not StateMachineService.is_transition_valid(current, target):
+            raise ValueError(f"State integrity breach: Invalid transition from '{current.value}' to '{target.value}' rejected.")
+
+    @staticmethod
+    def _compare_and_swap(
+        db: Session,
+        workflow_id: str,
+        target_state: WorkflowState,
+        max_retries: Optional[int] = None
+    ) -> Tuple[WorkflowState, int]:
+        """Swaps the workflow's state if its version is unchanged since it was read; returns the previous state and new version."""
+        from sqlalchemy import select, update
+        from app.models import ProcurementWorkflow
+
+        retries = settings.WORKFLOW_CAS_MAX_RETRIES if max_retries is None else max_retries
+        for attempt in range(retries + 1):
+            row = db.execute(
+                select(ProcurementWorkflow.current_state, ProcurementWorkflow.version)
+                .where(ProcurementWorkflow.id == workflow_id)
+            ).first()
+            if row is None:
+                raise ValueError(f"Workflow ID {workflow_id} not found in database records.")
+            current_state = parse_state(row.current_state)
+            StateMachineService._validate(current_state, target_state)
+
+            version_matches = (
+                ProcurementWorkflow.version == row.version if row.version is not None
+                else ProcurementWorkflow.version.is_(None)
+            )
+            new_version = (row.version or 1) + 1
+            swapped = db.execute(
+                update(ProcurementWorkflow)
+                .where(ProcurementWorkflow.id == workflow_id, version_matches)
+                .values(current_state=target_state.value, version=new_version, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session="fetch")
+            ).rowcount
+            if swapped:
+                return current_state, new_version
+            logger.info(f"Optimistic transition conflict on workflow {workflow_id} (version {row.version}); retry {attempt + 1}/{retries}")
+        raise TransitionConflictError(
+            f"Workflow {workflow_id} changed concurrently {retries + 1} times; transition to '{target_state.value}' abandoned."
+        )
 
     @staticmethod
     def transition_workflow(
@@ -49,33 +128,46 @@ class StateMachineService:
         target_state: WorkflowState,
         organization_id: str,
         user_id: Optional[str] = None,
-        reason: Optional[str] = None
+        reason: Optional[str] = None,
+        optimistic: bool = False,
+        max_retries: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Executes a database transition using Row-Level Locking (SELECT ... FOR UPDATE).
         Ensures thread-safe isolated commits and appends directly to the event sourcing logs.
+
+        optimistic=True skips the row lock: the state is swapped with
+        UPDATE ... WHERE id = ? AND version = ? and, if a concurrent writer bumped the version
+        first, re-read and re-validated up to `max_retries` times (WORKFLOW_CAS_MAX_RETRIES)
+        before TransitionConflictError. Use it for hot POs whose writers would otherwise queue
+        on the lock (bursts of vendor messages, HITL reviews).
         """
         # Import models locally to avoid circular dependencies
         from app.models import ProcurementWorkflow, WorkflowEvent, AuditLog, ProcurementTask
 
-        # 1. ACQUIRE THREAD-SAFE CONCURRENCY ROW LOCK (Priority 4)
-        # Using with_for_update() blocks concurrent webhooks from writing to the same PO simultaneously
-        workflow = db.query(ProcurementWorkflow).filter(
-            ProcurementWorkflow.id == workflow_id
-        ).with_for_update().first()
+        if optimistic:
+            # 1-3. LOCK-FREE COMPARE-AND-SWAP ON workflow.version
+            current_state, new_version = StateMachineService._compare_and_swap(db, workflow_id, target_state, max_retries)
+        else:
+            # 1. ACQUIRE THREAD-SAFE CONCURRENCY ROW LOCK (Priority 4)
+            # Using with_for_update() blocks concurrent webhooks from writing to the same PO simultaneously
+            workflow = db.query(ProcurementWorkflow).filter(
+                ProcurementWorkflow.id == workflow_id
+            ).with_for_update().first()
 
-        if not workflow:
-            raise ValueError(f"Workflow ID {workflow_id} not found in database records.")
+            if not workflow:
+                raise ValueError(f"Workflow ID {workflow_id} not found in database records.")
 
-        current_state = WorkflowState(workflow.current_state)
+            current_state = parse_state(workflow.current_state)
 
-        # 2. VALIDATE STATE BOUNDARIES
-        if not StateMachineService.is_transition_valid(current_state, target_state):
-            raise ValueError(f"State integrity breach: Invalid transition from '{current_state.value}' to '{target_state.value}' rejected.")
+            # 2. VALIDATE STATE BOUNDARIES
+            StateMachineService._validate(current_state, target_state)
 
-        # 3. TRANSITION PERSISTENT VALUE
-        workflow.current_state = target_state.value
-        workflow.updated_at = datetime.utcnow()
+            # 3. TRANSITION PERSISTENT VALUE (version bump lets optimistic writers detect this change)
+            workflow.current_state = target_state.value
+            new_version = (workflow.version or 1) + 1
+            workflow.version = new_version
+            workflow.updated_at = datetime.utcnow()
 
         # Update matching ProcurementTask status if exists
         task = db.query(ProcurementTask).filter(ProcurementTask.workflow_id == workflow_id).first()
@@ -114,10 +206,19 @@ class StateMachineService:
         # Flush to DB (relying on get_db_session() transaction manager to commit/rollback safely)
         db.flush()
 
-        # Fan out to customer-registered outbound webhooks (Growth+ feature)
+        if target_state in CLOSED_STATES:
+            from app.services.vendor_resolver import vendor_resolver
+            vendor_resolver.invalidate_after_commit(db, organization_id=organization_id)
+
+        # Keep the projection tail short: every PROJECTION_SNAPSHOT_EVERY-th version queues a snapshot pass
+        from app.services.projections import schedule_snapshots
+        schedule_snapshots(db, organization_id, {workflow_id: new_version})
+
+        # Queue fan-out to customer-registered outbound webhooks (Growth+ feature).
+        # Delivery runs on the worker after commit, never while the row lock above is held.
         try:
-            from app.services.outbound_webhooks import fanout_event, WebhookEvent as WHEvent
-            fanout_event(
+            from app.services.outbound_webhooks import enqueue_fanout, WebhookEvent as WHEvent
+            enqueue_fanout(
                 db              = db,
                 organization_id = organization_id,
                 event_type      = WHEvent.STATE_TRANSITION,
@@ -130,7 +231,7 @@ class StateMachineService:
                 },
             )
         except Exception as _wh_err:
-            logger.warning(f"Outbound webhook fanout failed (non-critical): {_wh_err}")
+            logger.warning(f"Outbound webhook fanout enqueue failed (non-critical): {_wh_err}")
 
         return {
             "success":        True,
@@ -139,6 +240,146 @@ class StateMachineService:
             "new_state":      target_state
         }
 
+    @staticmethod
+    def transition_many(
+        db: Session,
+        transitions: Sequence[Tuple[str, WorkflowState]],
+        organization_id: str,
+        user_id: Optional[str] = None,
+        reason: Optional[str] = None,
+        skip_invalid: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Set-based transition_workflow for mass imports and sweeps: [(workflow_id, target_state), ...].
+        Locks every target row in one SELECT ... FOR UPDATE ordered by id (concurrent batches always
+        lock in the same order, so they cannot deadlock), then applies one UPDATE per target state to
+        workflows and tasks, bulk-inserts the events and audit rows, and queues a single
+        STATE_TRANSITION_BATCH webhook fanout.
+        An unknown workflow or invalid transition raises ValueError and nothing is written,
+        unless skip_invalid=True, in which case it is reported under "rejected".
+        """
+        from sqlalchemy import func, insert, select, update
+        from app.models import ProcurementWorkflow, WorkflowEvent, AuditLog, ProcurementTask
+
+        targets: Dict[str, WorkflowState] = {}
+        for workflow_id, target_state in transitions:
+            targets[workflow_id] = WorkflowState(target_state)   # Last request for a workflow wins
+        if not targets:
+            return {"success": True, "transitioned": [], "rejected": []}
+
+        # 1. ONE ORDERED ROW-LOCK ACQUISITION FOR THE WHOLE BATCH
+        locked = db.execute(
+            select(ProcurementWorkflow.id, ProcurementWorkflow.current_state, ProcurementWorkflow.version)
+            .where(
+                ProcurementWorkflow.id.in_(sorted(targets)),
+                ProcurementWorkflow.organization_id == organization_id
+            )
+            .order_by(ProcurementWorkflow.id)
+            .with_for_update()
+        ).all()
+        current = {workflow_id: state for workflow_id, state, _ in locked}
+        versions = {workflow_id: (version or 1) + 1 for workflow_id, _, version in locked}   # After the UPDATE below
+
+        # 2. VALIDATE STATE BOUNDARIES
+        accepted: List[Tuple[str, WorkflowState, WorkflowState]] = []
+        rejected: List[Dict[str, Any]] = []
+        for workflow_id, target_state in targets.items():
+            if workflow_id not in current:
+                error = f"Workflow ID {workflow_id} not found in database records."
+            else:
+                current_state = parse_state(current[workflow_id])
+                if StateMachineService.is_transition_valid(current_state, target_state):
+                    accepted.append((workflow_id, current_state, target_state))
+                    continue
+                error = f"State integrity breach: Invalid transition from '{current_state.value}' to '{target_state.value}' rejected."
+            if not skip_invalid:
+                raise ValueError(error)
+            rejected.append({"workflow_id": workflow_id, "error": error})
+        if not accepted:
+            return {"success": True, "transitioned": [], "rejected": rejected}
+
+        # 3. SET-BASED STATE UPDATES (one per distinct target state)
+        now = datetime.utcnow()
+        by_target: Dict[WorkflowState, List[str]] = {}
+        for workflow_id, _, target_state in accepted:
+            by_target.setdefault(target_state, []).append(workflow_id)
+        for target_state, workflow_ids in by_target.items():
+            db.execute(
+                update(ProcurementWorkflow)
+                .where(ProcurementWorkflow.id.in_(workflow_ids))
+                .values(
+                    current_state=target_state.value,
+                    version=func.coalesce(ProcurementWorkflow.version, 1) + 1,
+                    updated_at=now
+                )
+                .execution_options(synchronize_session="fetch")
+            )
+            db.execute(
+                update(ProcurementTask)
+                .where(ProcurementTask.workflow_id.in_(workflow_ids))
+                .values(status=target_state.value, updated_at=now)
+                .execution_options(synchronize_session="fetch")
+            )
+
+        # 4-5. BULK EVENT SOURCING + AUDIT TRAIL
+        db.execute(insert(WorkflowEvent), [
+            {
+                "organization_id": organization_id,
+                "workflow_id": workflow_id,
+                "event_type": f"STATE_CHANGED_TO_{target_state.value}",
+                "payload": {
+                    "previous_state": current_state.value,
+                    "new_state": target_state.value,
+                    "reason": reason or "System automated transition",
+                    "triggered_by": user_id
+                },
+                "created_at": now,
+            }
+            for workflow_id, current_state, target_state in accepted
+        ])
+        db.execute(insert(AuditLog), [
+            {
+                "organization_id": organization_id,
+                "workflow_id": workflow_id,
+                "user_id": user_id,
+                "action": "STATE_TRANSITION",
+                "description": f"PO transitioned from {current_state.value} to {target_state.value}. {reason or ''}",
+                "payload_before": {"state": current_state.value},
+                "payload_after": {"state": target_state.value},
+                "created_at": now,
+            }
+            for workflow_id, current_state, target_state in accepted
+        ])
+        logger.info(f"Durable Commit: {len(accepted)} workflow(s) transitioned in one batch ({len(rejected)} rejected)")
+        if any(target_state in CLOSED_STATES for _, _, target_state in accepted):
+            from app.services.vendor_resolver import vendor_resolver
+            vendor_resolver.invalidate_after_commit(db, organization_id=organization_id)
+        from app.services.projections import schedule_snapshots
+        schedule_snapshots(db, organization_id, {workflow_id: versions[workflow_id] for workflow_id, _, _ in accepted})
+
+        transitioned = [
+            {"workflow_id": workflow_id, "previous_state": current_state.value, "new_state": target_state.value}
+            for workflow_id, current_state, target_state in accepted
+        ]
+        # One batched outbound webhook for the whole set, delivered by the worker after commit
+        try:
+            from app.services.outbound_webhooks import enqueue_fanout, WebhookEvent as WHEvent
+            enqueue_fanout(
+                db              = db,
+                organization_id = organization_id,
+                event_type      = WHEvent.STATE_TRANSITION_BATCH,
+                data            = {
+                    "transitions":  transitioned,
+                    "count":        len(transitioned),
+                    "reason":       reason,
+                    "triggered_by": user_id,
+                },
+            )
+        except Exception as _wh_err:
+            logger.warning(f"Outbound webhook fanout enqueue failed (non-critical): {_wh_err}")
+
+        return {"success": True, "transitioned": transitioned, "rejected": rejected}
+
     @staticmethod
     def check_variance_threshold(
         original_eta: Optional[str],
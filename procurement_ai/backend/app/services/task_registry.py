@@ -0,0 +1,248 @@
+"""
+Decorator-based registry for durable worker tasks.
+
+Each task declares how it must run so it never stalls the event loop that also
+serves FastAPI requests:
+
+  kind="async"  coroutine `handler(payload, db)` awaited on the event loop (non-blocking I/O)
+  kind="io"     blocking function `handler(payload)` run in a shared thread pool
+  kind="cpu"    CPU-bound function `handler(payload)` run in a process pool
+                (must be a module-level function with a picklable payload/result)
+
+Tasks also declare a per-task concurrency limit and timeout. Every execution is
+recorded in a per-task latency histogram, exposed via GET /review/jobs/metrics.
+
+    @task_registry.task("dispatch_whatsapp_outbox", concurrency=20, timeout=30)
+    async def dispatch_whatsapp_outbox(payload, db): ...
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import functools
+import importlib
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TASK_KINDS = ("async", "io", "cpu")
+
+# Modules whose import registers tasks; loaded on first lookup to avoid import cycles
+TASK_MODULES = (
+    "app.services.worker",
+    "app.services.outbound_webhooks",
+    "app.services.import_jobs",
+    "app.services.inbound_messages",
+    "app.services.projections",
+)
+
+
+class UnknownTaskError(LookupError):
+    """Raised when a job names a task that no module has registered."""
+
+
+class DeferJob(Exception):
+    """
+    Raised by a handler that cannot run yet (e.g. throttled). The worker requeues the job
+    `retry_after` seconds out without consuming an attempt.
+    """
+
+    def __init__(self, retry_after: float, message: str = ""):
+        super().__init__(message or f"Deferred for {retry_after:.2f}s.")
+        self.retry_after = retry_after
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds) with approximate percentiles."""
+
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)   # Last slot is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Upper bound of the bucket holding the pct-th observation."""
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.BUCKETS_MS + (self.max_ms,), self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return float(min(bound, self.max_ms))
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in self.BUCKETS_MS] + ["le_inf"]
+        return {
+            "count":   self.count,
+            "avg_ms":  round(self.sum_ms / self.count, 2) if self.count else None,
+            "p50_ms":  self.percentile(50),
+            "p95_ms":  self.percentile(95),
+            "p99_ms":  self.percentile(99),
+            "max_ms":  round(self.max_ms, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+@dataclass
+class TaskSpec:
+    name: str
+    handler: Callable[..., Any]
+    kind: str = "async"
+    concurrency: Optional[int] = None       # None = bounded only by WORKER_CONCURRENCY
+    timeout_seconds: Optional[float] = None
+    on_failure: Optional[Callable[[Dict[str, Any], str, Session], None]] = None   # Called once the job dead-letters
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    succeeded: int = 0
+    errored: int = 0
+    deferred: int = 0
+    in_flight: int = 0
+    _semaphore: Optional[asyncio.Semaphore] = field(default=None, repr=False)
+
+    @property
+    def semaphore(self) -> Optional[asyncio.Semaphore]:
+        if self.concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+
+class TaskRegistry:
+    def __init__(self):
+        self._tasks: Dict[str, TaskSpec] = {}
+        self._modules_loaded = False
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def task(
+        self,
+        name: str,
+        *,
+        kind: str = "async",
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        on_failure: Optional[Callable[[Dict[str, Any], str, Session], None]] = None,
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """
+        Registers the decorated function as the handler for jobs named `name`.
+        `on_failure(payload, error, db)` runs when a job of the task fails for good, on the session that
+        records the failure, so its writes commit together with the dead-lettered job.
+        """
+        if kind not in TASK_KINDS:
+            raise ValueError(f"Task kind must be one of {TASK_KINDS}, got '{kind}'.")
+
+        def decorator(handler: Callable[..., Any]) -> Callable[..., Any]:
+            if kind == "async" and not asyncio.iscoroutinefunction(handler):
+                raise TypeError(f"Task '{name}' is declared async but {handler.__name__} is not a coroutine function.")
+            self._tasks[name] = TaskSpec(
+                name=name, handler=handler, kind=kind, concurrency=concurrency, timeout_seconds=timeout,
+                on_failure=on_failure,
+            )
+            return handler
+
+        return decorator
+
+    def _load_task_modules(self) -> None:
+        if not self._modules_loaded:
+            self._modules_loaded = True
+            for module in TASK_MODULES:
+                importlib.import_module(module)
+
+    def get(self, name: str) -> TaskSpec:
+        self._load_task_modules()
+        spec = self._tasks.get(name)
+        if spec is None:
+            raise UnknownTaskError(f"No worker task registered under '{name}'.")
+        return spec
+
+    def names(self) -> List[str]:
+        self._load_task_modules()
+        return sorted(self._tasks)
+
+    async def run(self, name: str, payload: Dict[str, Any], db: Optional[Session] = None) -> Any:
+        """Runs one execution of task `name`, honouring its concurrency, timeout and executor kind."""
+        spec = self.get(name)
+        semaphore = spec.semaphore
+        if semaphore is not None:
+            await semaphore.acquire()
+        spec.in_flight += 1
+        started = time.perf_counter()
+        deferred = False
+        try:
+            if spec.kind == "async":
+                pending = spec.handler(payload, db)
+            else:
+                loop = asyncio.get_running_loop()
+                executor = self._thread_pool() if spec.kind == "io" else self._process_pool()
+                # Executor work cannot be interrupted: a timeout abandons the result, not the thread/process
+                pending = loop.run_in_executor(executor, functools.partial(spec.handler, payload))
+            result = await asyncio.wait_for(pending, spec.timeout_seconds)
+            spec.succeeded += 1
+            return result
+        except DeferJob:
+            deferred = True
+            spec.deferred += 1
+            raise
+        except BaseException:
+            spec.errored += 1
+            raise
+        finally:
+            if not deferred:
+                spec.histogram.observe((time.perf_counter() - started) * 1000)
+            spec.in_flight -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=settings.WORKER_THREAD_POOL_SIZE, thread_name_prefix="task-io")
+        return self._threads
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=settings.WORKER_PROCESS_POOL_SIZE)
+        return self._processes
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        self._load_task_modules()
+        return {
+            name: {
+                "kind":            spec.kind,
+                "concurrency":     spec.concurrency,
+                "timeout_seconds": spec.timeout_seconds,
+                "in_flight":       spec.in_flight,
+                "succeeded":       spec.succeeded,
+                "errored":         spec.errored,
+                "deferred":        spec.deferred,
+                "latency":         spec.histogram.snapshot(),
+            }
+            for name, spec in sorted(self._tasks.items())
+        }
+
+    def shutdown(self) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+
+task_registry = TaskRegistry()
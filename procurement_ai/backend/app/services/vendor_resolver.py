@@ -0,0 +1,137 @@
+# file: backend/app/services/vendor_resolver.py
+"""
+Cached phone -> (org, vendor, active task, workflow) resolution for inbound
+WhatsApp messages.
+
+Resolution (on a cache miss):
+  1. Vendor by phone number (idx_vendors_whatsapp).
+  2. The vendor's newest ProcurementTask and its workflow (idx_tasks_vendor_created).
+  3. Otherwise the org's newest open workflow (idx_workflows_org_created).
+
+Results, including "unknown phone", are cached per phone for
+VENDOR_RESOLVER_TTL_SECONDS. Writers that change which PO is active invalidate
+once their transaction commits, so a lookup racing the write cannot re-cache
+the old context:
+
+    vendor_resolver.invalidate_after_commit(db, phones=phones)           # Ingestion: new/renamed vendors, new tasks
+    vendor_resolver.invalidate_after_commit(db, organization_id=org_id)  # New workflows, workflows closed/cancelled
+
+Organization invalidation is O(1): it bumps the org's generation, and entries
+cached under an older generation count as misses.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.transactions import after_outer_commit
+from app.services.state_machine import CLOSED_STATES
+
+_PENDING_KEY = "vendor_resolver_pending"   # Session.info: invalidations to apply once the transaction commits
+
+Context = Dict[str, Optional[str]]
+EMPTY_CONTEXT: Context = {"organization_id": None, "workflow_id": None, "task_id": None, "vendor_id": None, "language": None}
+
+
+class VendorResolver:
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache = TTLCache("vendor_context", maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _generation(self, organization_id: Optional[str]) -> int:
+        return self._generations.get(organization_id, 0) if organization_id else 0
+
+    def resolve(self, db: Session, phone_number: str) -> Context:
+        """The workflow context for a vendor phone; one in-process lookup when cached."""
+        entry = self._cache.get(phone_number)
+        if entry is not None:
+            generation, context = entry
+            if generation == self._generation(context["organization_id"]):
+                return dict(context)
+        generations = dict(self._generations)   # Taken before loading: an invalidation racing the load wins
+        context = self._load(db, phone_number)
+        self._cache.set(phone_number, (generations.get(context["organization_id"], 0), context))
+        return dict(context)
+
+    @staticmethod
+    def _load(db: Session, phone_number: str) -> Context:
+        from app.models import ProcurementTask, ProcurementWorkflow, Vendor
+
+        vendor = db.execute(
+            select(Vendor.id, Vendor.organization_id, Vendor.preferred_language).where(Vendor.phone_number == phone_number).limit(1)
+        ).first()
+        if vendor is None:
+            return dict(EMPTY_CONTEXT)
+
+        task = db.execute(
+            select(ProcurementTask.id, ProcurementTask.workflow_id)
+            .where(ProcurementTask.vendor_id == vendor.id)
+            .order_by(ProcurementTask.created_at.desc())
+            .limit(1)
+        ).first()
+        workflow_id = None
+        if task is not None:
+            workflow_id = db.execute(
+                select(ProcurementWorkflow.id).where(ProcurementWorkflow.id == task.workflow_id)
+            ).scalar_one_or_none()
+        if workflow_id is None:
+            workflow_id = db.execute(
+                select(ProcurementWorkflow.id)
+                .where(
+                    ProcurementWorkflow.organization_id == vendor.organization_id,
+                    ProcurementWorkflow.current_state.notin_([state.value for state in CLOSED_STATES]),
+                )
+                .order_by(ProcurementWorkflow.created_at.desc())
+                .limit(1)
+            ).scalar_one_or_none()
+
+        return {
+            "organization_id": vendor.organization_id,
+            "workflow_id": workflow_id,
+            "task_id": task.id if task is not None else None,
+            "vendor_id": vendor.id,
+            "language": vendor.preferred_language,   # Parse cache language hint
+        }
+
+    def invalidate_phones(self, phone_numbers: Iterable[str]) -> None:
+        for phone_number in phone_numbers:
+            self._cache.invalidate(phone_number)
+
+    def invalidate_organization(self, organization_id: str) -> None:
+        with self._lock:
+            self._generations[organization_id] = self._generations.get(organization_id, 0) + 1
+
+    def invalidate_after_commit(
+        self, db: Session, phones: Iterable[str] = (), organization_id: Optional[str] = None
+    ) -> None:
+        """Invalidates once `db`'s outermost transaction commits; a rollback leaves the cache as it was."""
+        pending = db.info.setdefault(_PENDING_KEY, {"phones": set(), "organizations": set()})
+        pending["phones"].update(phones)
+        if organization_id:
+            pending["organizations"].add(organization_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        with self._lock:
+            self._generations.clear()
+
+
+vendor_resolver = VendorResolver(
+    maxsize=settings.VENDOR_RESOLVER_CACHE_SIZE,
+    ttl_seconds=settings.VENDOR_RESOLVER_TTL_SECONDS,
+)
+
+
+def _invalidate_after_commit(session: Session, pending: Dict[str, set]) -> None:
+    vendor_resolver.invalidate_phones(pending["phones"])
+    for organization_id in pending["organizations"]:
+        vendor_resolver.invalidate_organization(organization_id)
+
+
+after_outer_commit(_PENDING_KEY, _invalidate_after_commit)
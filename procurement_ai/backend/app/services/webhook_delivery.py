@@ -0,0 +1,273 @@
+"""
+Async delivery engine for customer outbound webhooks.
+
+A fan-out POSTs to every matching endpoint concurrently over one shared
+httpx.AsyncClient connection pool, so an event's fan-out time tracks its
+slowest endpoint rather than the sum of all of them.
+
+Per endpoint:
+  - transient failures (network errors, 429, 5xx) are retried in-line with short
+    jittered backoff (WEBHOOK_INLINE_RETRIES); longer outages are left to the
+    durable follow-up job scheduled by outbound_webhooks.deliver_outbound_webhook
+  - a circuit breaker opens after WEBHOOK_BREAKER_FAILURES consecutive failures and
+    short-circuits deliveries until WEBHOOK_BREAKER_RESET_SECONDS pass (then one
+    half-open probe decides whether it closes again)
+  - WebhookEndpoint.consecutive_failures is tracked in the database; past
+    WEBHOOK_AUTO_DISABLE_FAILURES the endpoint is deactivated
+
+OutboundWebhookLog rows for a fan-out are written with one multi-row INSERT.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EndpointTarget:
+    """Plain snapshot of a WebhookEndpoint row, safe to use across awaits."""
+    id: str
+    url: str
+    secret: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, ep) -> "EndpointTarget":
+        return cls(id=ep.id, url=ep.url, secret=ep.secret)
+
+
+class CircuitBreaker:
+    """closed → (N consecutive failures) → open → (reset timeout) → half_open → closed | open"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._clock = clock
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True   # Exactly one trial request while half-open
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = self._clock()
+
+
+def _is_transient(status_code: Optional[int]) -> bool:
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+class WebhookDeliveryEngine:
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                limits=httpx.Limits(
+                    max_connections=settings.WEBHOOK_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.WEBHOOK_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=30.0,
+                ),
+                timeout=httpx.Timeout(settings.WEBHOOK_TIMEOUT_SECONDS),
+                headers={"User-Agent": "ProcureHub-Webhooks/1.0", "Content-Type": "application/json"},
+            )
+        return self._client
+
+    def breaker(self, endpoint_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint_id)
+        if breaker is None:
+            breaker = self._breakers[endpoint_id] = CircuitBreaker(
+                settings.WEBHOOK_BREAKER_FAILURES, settings.WEBHOOK_BREAKER_RESET_SECONDS
+            )
+        return breaker
+
+    def reset_breaker(self, endpoint_id: str) -> None:
+        self._breakers.pop(endpoint_id, None)
+
+    async def deliver(self, target: EndpointTarget, envelope: Dict[str, Any]) -> Dict[str, Any]:
+        """Delivers one envelope to one endpoint with in-line retries. Never raises."""
+        from app.services.outbound_webhooks import _sign_payload
+
+        breaker = self.breaker(target.id)
+        body_bytes = json.dumps(envelope, default=str).encode("utf-8")
+        signature = _sign_payload(body_bytes, target.secret)
+        headers = {
+            "X-ProcureHub-Delivery":  envelope["delivery_id"],
+            "X-ProcureHub-Event":     envelope["event_type"],
+            "X-ProcureHub-Signature": f"sha256={signature}" if signature else "",
+        }
+        result = {
+            "endpoint_id":   target.id,
+            "url":           target.url,
+            "delivery_id":   envelope["delivery_id"],
+            "success":       False,
+            "status_code":   None,
+            "duration_ms":   0,
+            "error":         None,
+            "response_body": None,
+            "attempts":      0,
+            "short_circuited": False,
+        }
+
+        started = time.monotonic()
+        for attempt in range(settings.WEBHOOK_INLINE_RETRIES + 1):
+            if not breaker.allow():
+                result["short_circuited"] = True
+                result["error"] = result["error"] or "Circuit open: endpoint is failing; delivery deferred."
+                break
+            if attempt:
+                # Full jitter on 0.5s, 1s, 2s ... so retries from a burst spread out
+                await asyncio.sleep(random.uniform(0, 0.5 * 2 ** (attempt - 1)))
+            result["attempts"] += 1
+            try:
+                response = await self.client.post(target.url, content=body_bytes, headers=headers)
+                result["status_code"] = response.status_code
+                result["response_body"] = response.text[:512] or None
+                result["success"] = 200 <= response.status_code < 300
+                result["error"] = None if result["success"] else f"HTTP {response.status_code}: {response.reason_phrase}"
+            except httpx.HTTPError as e:
+                result["status_code"] = None
+                result["error"] = str(e) or type(e).__name__
+
+            if result["success"]:
+                breaker.record_success()
+                break
+            breaker.record_failure()
+            if not _is_transient(result["status_code"]):
+                break
+
+        result["duration_ms"] = int((time.monotonic() - started) * 1000)
+        level = logger.info if result["success"] else logger.warning
+        level(
+            f"Webhook [{target.url}] event={envelope['event_type']} status={result['status_code']} "
+            f"ok={result['success']} attempts={result['attempts']} {result['duration_ms']}ms"
+        )
+        return result
+
+    async def fanout(self, deliveries: List[tuple]) -> List[Dict[str, Any]]:
+        """Delivers [(EndpointTarget, envelope), ...] concurrently; results are in input order."""
+        return list(await asyncio.gather(*(self.deliver(target, envelope) for target, envelope in deliveries)))
+
+    def record_results(self, db: Session, organization_id: str, envelopes: Dict[str, Dict[str, Any]], results: List[Dict[str, Any]]) -> List[str]:
+        """
+        Persists a fan-out: one multi-row INSERT of OutboundWebhookLog rows plus the endpoints'
+        consecutive-failure counters. Returns ids of endpoints auto-disabled by this fan-out.
+        Short-circuited deliveries (no request made) are neither logged nor counted.
+        """
+        from app.models import OutboundWebhookLog, WebhookEndpoint
+
+        attempted = [r for r in results if r["attempts"]]
+        if attempted:
+            db.execute(insert(OutboundWebhookLog), [
+                {
+                    "id":              str(uuid.uuid4()),
+                    "endpoint_id":     r["endpoint_id"],
+                    "organization_id": organization_id,
+                    "event_type":      envelopes[r["endpoint_id"]]["event_type"],
+                    "payload":         envelopes[r["endpoint_id"]],
+                    "response_status": r["status_code"],
+                    "response_body":   r["response_body"],
+                    "duration_ms":     r["duration_ms"],
+                    "success":         r["success"],
+                    "error_message":   r["error"],
+                    "created_at":      datetime.utcnow(),
+                }
+                for r in attempted
+            ])
+
+        succeeded = [r["endpoint_id"] for r in attempted if r["success"]]
+        failed    = [r["endpoint_id"] for r in attempted if not r["success"]]
+        if succeeded:
+            db.execute(
+                update(WebhookEndpoint)
+                .where(WebhookEndpoint.id.in_(succeeded), WebhookEndpoint.consecutive_failures != 0)
+                .values(consecutive_failures=0)
+                .execution_options(synchronize_session=False)
+            )
+        if not failed:
+            return []
+
+        threshold = settings.WEBHOOK_AUTO_DISABLE_FAILURES
+        failures = func.coalesce(WebhookEndpoint.consecutive_failures, 0) + 1
+        tripped = failures >= threshold
+        db.execute(
+            update(WebhookEndpoint)
+            .where(WebhookEndpoint.id.in_(failed))
+            .values(
+                consecutive_failures=failures,
+                is_active=case((tripped, False), else_=WebhookEndpoint.is_active),
+                disabled_reason=case(
+                    (tripped, f"Auto-disabled after {threshold} consecutive failed deliveries."),
+                    else_=WebhookEndpoint.disabled_reason,
+                ),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        disabled = [
+            ep_id for (ep_id,) in db.query(WebhookEndpoint.id).filter(
+                WebhookEndpoint.id.in_(failed),
+                WebhookEndpoint.is_active == False,
+                WebhookEndpoint.consecutive_failures == threshold,
+            )
+        ]
+        for ep_id in disabled:
+            self.reset_breaker(ep_id)
+            logger.error(f"Webhook endpoint {ep_id} auto-disabled after {threshold} consecutive failed deliveries.")
+        return disabled
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            ep_id: {"state": b.state, "consecutive_failures": b.failures}
+            for ep_id, b in self._breakers.items()
+            if b.failures
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+webhook_engine = WebhookDeliveryEngine()
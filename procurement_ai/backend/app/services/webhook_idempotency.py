@@ -0,0 +1,129 @@
+# file: backend/app/services/webhook_idempotency.py
+"""
+In-process front for Meta webhook idempotency.
+
+The `webhook_events.event_id` unique constraint remains the source of truth:
+new events are written with INSERT ... ON CONFLICT DO NOTHING RETURNING, so a
+concurrent delivery in another process can never be recorded twice. This
+module keeps most duplicates from reaching the database at all:
+
+  * an LRU (TTLCache) of recent event ids -> processed_status answers exactly
+    for the last WEBHOOK_IDEMPOTENCY_LRU_SIZE events;
+  * a rotating Bloom filter remembers a much longer window in a few MB. A
+    positive can be a false positive (about WEBHOOK_IDEMPOTENCY_BLOOM_ERROR_RATE),
+    so it is only trusted for status pings, where dropping one receipt is
+    harmless next to a later one. Messages it flags still go to the database.
+
+Ids are remembered only after the recording transaction commits, so a rolled
+back delivery is not mistaken for a duplicate on redelivery.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.transactions import after_outer_commit
+
+_PENDING_KEY = "webhook_idempotency_pending"
+
+
+class RotatingBloomFilter:
+    """
+    Two-generation Bloom filter. Adds go to the current generation; when it holds
+    `capacity` ids it becomes the previous one and a fresh generation starts, so
+    memory stays bounded and every id is remembered for at least `capacity` adds.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous: Optional[bytearray] = None
+        self._count = 0
+        self._lock = threading.Lock()
+        self.rotations = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    @staticmethod
+    def _has(bits: bytearray, positions) -> bool:
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, key: str) -> None:
+        positions = self._positions(key)
+        with self._lock:
+            if self._count >= self.capacity:
+                self._previous, self._current = self._current, bytearray(len(self._current))
+                self._count = 0
+                self.rotations += 1
+            for p in positions:
+                self._current[p >> 3] |= 1 << (p & 7)
+            self._count += 1
+
+    def __contains__(self, key: str) -> bool:
+        positions = self._positions(key)
+        with self._lock:
+            return self._has(self._current, positions) or (
+                self._previous is not None and self._has(self._previous, positions)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._current = bytearray(len(self._current))
+            self._previous = None
+            self._count = 0
+
+
+class WebhookIdempotency:
+    def __init__(self, lru_size: int, bloom_capacity: int, bloom_error_rate: float):
+        self.recent = TTLCache("webhook_event_ids", maxsize=lru_size)
+        self.bloom = RotatingBloomFilter(bloom_capacity, bloom_error_rate)
+        self.bloom_hits = 0
+
+    def recent_status(self, event_id: str) -> Optional[str]:
+        """processed_status of a recently recorded event, or None if not in the LRU."""
+        return self.recent.get(event_id)
+
+    def probably_seen(self, event_id: str) -> bool:
+        seen = event_id in self.bloom
+        if seen:
+            self.bloom_hits += 1
+        return seen
+
+    def remember(self, statuses: Dict[str, str]) -> None:
+        for event_id, processed_status in statuses.items():
+            self.recent.set(event_id, processed_status)
+            self.bloom.add(event_id)
+
+    def remember_after_commit(self, db: Session, statuses: Dict[str, str]) -> None:
+        """Records the ids once `db`'s transaction commits; a rollback discards them."""
+        db.info.setdefault(_PENDING_KEY, {}).update(statuses)
+
+    def clear(self) -> None:
+        self.recent.clear()
+        self.bloom.clear()
+        self.bloom_hits = 0
+
+
+webhook_idempotency = WebhookIdempotency(
+    lru_size=settings.WEBHOOK_IDEMPOTENCY_LRU_SIZE,
+    bloom_capacity=settings.WEBHOOK_IDEMPOTENCY_BLOOM_CAPACITY,
+    bloom_error_rate=settings.WEBHOOK_IDEMPOTENCY_BLOOM_ERROR_RATE,
+)
+
+
+def _remember_after_commit(session: Session, statuses: Dict[str, str]) -> None:
+    webhook_idempotency.remember(statuses)
+
+
+after_outer_commit(_PENDING_KEY, _remember_after_commit)
@@ -1,7 +1,7 @@
 # file: backend/app/services/whatsapp_policy.py
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -10,14 +10,19 @@ class WhatsAppPolicyService:
         self,
         vendor_phone: str,
         proposed_text: str,
-        last_inbound_timestamp: datetime,
-        template_fallback_name: str = "po_followup_ack"
+        last_inbound_timestamp: Optional[datetime],
+        template_fallback_name: str = "po_followup_ack",
+        template_parameters: Optional[List[str]] = None
     ) -> Tuple[bool, Dict[str, Any], str]:
         """
         Validates outbound payloads against official Meta conversation guidelines.
         Enforces the 24-Hour Conversation Window rule.
+        A vendor who has never messaged us (`last_inbound_timestamp` None) is outside the window.
+        `template_parameters` fill the fallback template's body variables (vendor name, PO number).
         """
         now = datetime.utcnow()
+        if last_inbound_timestamp is None:
+            last_inbound_timestamp = datetime.min
         elapsed_hours = (now - last_inbound_timestamp).total_seconds() / 3600.0
         
         # 1. 24-HOUR WINDOW GATING
@@ -41,8 +46,8 @@ class WhatsAppPolicyService:
                         {
                             "type": "body",
                             "parameters": [
-                                { "type": "text", "text": "Laxmi Fasteners" },
-                                { "type": "text", "text": "PO-2026-102" }
+                                { "type": "text", "text": value }
+                                for value in (template_parameters or ["Laxmi Fasteners", "PO-2026-102"])
                             ]
                         }
                     ]
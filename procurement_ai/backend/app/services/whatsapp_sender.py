@@ -0,0 +1,137 @@
+"""
+Async sender for the WhatsApp Cloud API (Graph API /{phone_number_id}/messages).
+
+One shared httpx.AsyncClient per process keeps a pool of keep-alive connections
+to graph.facebook.com. When the `h2` package is installed the client negotiates
+HTTP/2, so concurrent outbox jobs are multiplexed as parallel streams over a few
+connections instead of each paying a TCP+TLS handshake.
+
+Response handling maps onto the worker's retry semantics:
+  2xx        → returns the `wamid` message id
+  429        → RateLimited (job requeued after Retry-After, no attempt consumed)
+  5xx / I/O  → WhatsAppTransientError (retried with backoff)
+  other 4xx  → WhatsAppRejectedError (ValueError: non-retryable for the outbox policy)
+
+With the placeholder META_WHATSAPP_TOKEN and the real Graph API URL, sends are
+logged instead of made (local development). Point META_GRAPH_API_URL at
+backend/scripts/mock_graph_api.py to exercise the full HTTP path offline.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.rate_limiter import RateLimited
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_TOKEN = "meta_token_placeholder"
+
+
+class WhatsAppTransientError(ConnectionError):
+    """Network failure or 5xx from the Graph API; safe to retry."""
+
+
+class WhatsAppRejectedError(ValueError):
+    """The Graph API rejected the message (bad number, template, token); retrying will not help."""
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Seconds to wait from a Retry-After header: delta-seconds or an HTTP-date; `default` if unusable."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return default
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return max(0.0, (at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class WhatsAppSender:
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        token: Optional[str] = None,
+        phone_number_id: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = (base_url or settings.META_GRAPH_API_URL).rstrip("/")
+        self.token = token or settings.META_WHATSAPP_TOKEN
+        self.phone_number_id = phone_number_id or settings.META_PHONE_NUMBER_ID
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def dry_run(self) -> bool:
+        return self._transport is None and self.token == PLACEHOLDER_TOKEN and "graph.facebook.com" in self.base_url
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            connections = settings.WHATSAPP_HTTP_MAX_CONNECTIONS
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self._transport is None and _http2_available(),
+                transport=self._transport,
+                headers={"Authorization": f"Bearer {self.token}"},
+                limits=httpx.Limits(
+                    max_connections=connections,
+                    max_keepalive_connections=connections,
+                    keepalive_expiry=60.0,
+                ),
+                timeout=httpx.Timeout(settings.WHATSAPP_HTTP_TIMEOUT_SECONDS, connect=5.0),
+            )
+        return self._client
+
+    async def send(self, payload: Dict[str, Any]) -> str:
+        """POSTs one message payload (as built by WhatsAppPolicyService) and returns its wamid."""
+        if self.dry_run:
+            message_id = f"wamid.local.{uuid.uuid4().hex}"
+            logger.info(f"WhatsApp Sender (dry run): {payload.get('type')} message to {payload.get('to')} as {message_id}")
+            return message_id
+
+        try:
+            response = await self.client.post(f"/{self.phone_number_id}/messages", json=payload)
+        except httpx.TransportError as e:
+            raise WhatsAppTransientError(f"Graph API request failed: {e!r}") from e
+
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            raise RateLimited(retry_after, f"Graph API throttled send to {payload.get('to')} (429).")
+        if response.status_code >= 500:
+            raise WhatsAppTransientError(f"Graph API returned {response.status_code}: {response.text[:200]}")
+        if response.status_code >= 400:
+            raise WhatsAppRejectedError(f"Graph API rejected message ({response.status_code}): {response.text[:200]}")
+
+        try:
+            return response.json()["messages"][0]["id"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise WhatsAppTransientError(f"Unexpected Graph API response body: {response.text[:200]}") from e
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+whatsapp_sender = WhatsAppSender()
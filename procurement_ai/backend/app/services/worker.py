@@ -1,10 +1,23 @@
 # file: backend/app/services/worker.py
 import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import os
+import socket
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Dict, Any, Iterable, List, Optional
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, exists, func, insert, or_, select, update
+from sqlalchemy.orm import Session, aliased
+from app.core.config import settings
 from app.core.observability import get_correlation_id, get_logger
+from app.services.job_notifier import job_notifier, mark_session_for_wakeup
+from app.services.retry_policy import RetryPolicy, get_retry_policy
+from app.services.task_registry import DeferJob, UnknownTaskError, task_registry
+from app.services.rate_limiter import whatsapp_rate_limiter
+from app.services.whatsapp_policy import whatsapp_policy
+from app.services.whatsapp_sender import whatsapp_sender
 
 logger = get_logger(__name__)
 
@@ -12,96 +25,267 @@ logger = get_logger(__name__)
 OFFLINE_ACTIVE_JOBS: List[Dict[str, Any]] = []
 OFFLINE_DLQ: List[Dict[str, Any]] = []
 
+
+@dataclass
+class WorkerPassStats:
+    """Outcome counters for one execute_pending_jobs() pass over the durable queue."""
+    claimed: int = 0
+    completed: int = 0
+    retried: int = 0
+    deferred: int = 0
+    failed: int = 0
+    commits: int = 0
+    duration_ms: int = 0
+
+    def record(self, outcome: str) -> None:
+        setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class JobRequest:
+    """One job for WorkerQueue.enqueue_many(); fields mirror enqueue_job()'s arguments."""
+    task_name: str
+    payload: Dict[str, Any]
+    delay_seconds: int = 0
+    retry_policy: Optional[RetryPolicy] = None
+    ordering_key: Optional[str] = None
+
+
+def _in_order():
+    """
+    Predicate on ActiveJob: the job has no ordering_key, or no older job with the same key
+    is still queued or running.
+    """
+    from app.models import ActiveJob
+    older = aliased(ActiveJob)
+    blocked = exists().where(
+        older.ordering_key == ActiveJob.ordering_key,
+        older.status.in_(("queued", "running")),
+        or_(
+            older.created_at < ActiveJob.created_at,
+            and_(older.created_at == ActiveJob.created_at, older.id < ActiveJob.id),
+        ),
+    )
+    return or_(ActiveJob.ordering_key.is_(None), ~blocked)
+
+
 class WorkerQueue:
+    def __init__(self, worker_id: Optional[str] = None):
+        # Unique per process so leases identify which worker owns a running job
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.last_pass_stats = WorkerPassStats()
+        self.total_stats = WorkerPassStats()
+
     def enqueue_job(
         self, 
         task_name: str, 
         payload: Dict[str, Any], 
         delay_seconds: int = 0,
-        db: Optional[Session] = None
+        db: Optional[Session] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        ordering_key: Optional[str] = None
     ) -> str:
         """
         Enqueues a background job.
         If a database session is provided, commits to the persistent active_jobs table.
         Otherwise, falls back to a sandbox memory array.
+        `retry_policy` overrides the task's registered policy for this job only.
+        Jobs sharing an `ordering_key` run one at a time, oldest first (see claim_jobs).
         """
-        import uuid
-        job_id = f"job_{str(uuid.uuid4())[:8]}"
-        run_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+        return self.enqueue_many([JobRequest(task_name, payload, delay_seconds, retry_policy, ordering_key)], db=db)[0]
+
+    def enqueue_many(self, jobs: Iterable[JobRequest], db: Optional[Session] = None) -> List[str]:
+        """
+        Enqueues several jobs at once and returns their ids (in input order).
+        With a database session, all rows go into active_jobs as one multi-row INSERT with
+        client-assigned ids, and the worker is woken once when the transaction commits.
+        """
+        from app.models import ActiveJob
+        now = datetime.utcnow()
         correlation_id = get_correlation_id()
+        rows = []
+        for position, job in enumerate(jobs):
+            policy_override = job.retry_policy.to_dict() if job.retry_policy else None
+            rows.append({
+                "id": f"job_{uuid.uuid4().hex}",   # Full 128 bits: one duplicate would abort the whole INSERT
+                "task_name": job.task_name,
+                "payload": job.payload,
+                "run_at": now + timedelta(seconds=job.delay_seconds),
+                "status": "queued",
+                "retries_remaining": get_retry_policy(job.task_name, policy_override).max_attempts - 1,
+                "attempts": 0,
+                "retry_policy": policy_override,
+                "ordering_key": job.ordering_key,
+                "correlation_id": correlation_id,
+                # Distinct per row so jobs sharing an ordering_key keep their input order
+                "created_at": now + timedelta(microseconds=position),
+            })
+        if not rows:
+            return []
 
         if db is not None:
             # Persistent DB Queue Insertion (Priority 1)
-            from app.models import ActiveJob
-            job = ActiveJob(
-                id=job_id,
-                task_name=task_name,
-                payload=payload,
-                run_at=run_at,
-                status="queued",
-                retries_remaining=3,
-                correlation_id=correlation_id
-            )
-            db.add(job)
-            db.flush()
-            logger.info(f"Durable Queue: Job '{task_name}' ({job_id}) committed to active_jobs table. Scheduled: {run_at.isoformat()}")
+            db.execute(insert(ActiveJob), rows)
+            mark_session_for_wakeup(db)
+            if len(rows) == 1:
+                logger.info(f"Durable Queue: Job '{rows[0]['task_name']}' ({rows[0]['id']}) committed to active_jobs table. Scheduled: {rows[0]['run_at'].isoformat()}")
+            else:
+                logger.info(f"Durable Queue: {len(rows)} jobs bulk-inserted into active_jobs table.")
         else:
             # Memory array fallback
-            job_entry = {
-                "job_id": job_id,
-                "task_name": task_name,
-                "payload": payload,
-                "run_at": run_at.isoformat(),
-                "status": "queued",
-                "retries_remaining": 3,
-                "correlation_id": correlation_id,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            OFFLINE_ACTIVE_JOBS.append(job_entry)
-            logger.info(f"Memory Queue: Job '{task_name}' ({job_id}) enqueued in memory sandbox. Scheduled: {run_at.isoformat()}")
+            for row in rows:
+                OFFLINE_ACTIVE_JOBS.append({
+                    "job_id": row["id"],
+                    **{k: v for k, v in row.items() if k not in ("id", "run_at", "created_at")},
+                    "run_at": row["run_at"].isoformat(),
+                    "created_at": row["created_at"].isoformat(),
+                })
+                logger.info(f"Memory Queue: Job '{row['task_name']}' ({row['id']}) enqueued in memory sandbox. Scheduled: {row['run_at'].isoformat()}")
+            job_notifier.notify()
+
+        return [row["id"] for row in rows]
+
+    def next_due_at(self, db: Session) -> Optional[datetime]:
+        """
+        Earliest moment the worker has something to do: a queued run_at or a lease that will lapse.
+        Jobs waiting behind an older job of their ordering key are not counted; the older job's run_at is.
+        """
+        from app.models import ActiveJob
+        next_run, next_expiry = db.execute(select(
+            select(func.min(ActiveJob.run_at)).where(ActiveJob.status == "queued", _in_order()).scalar_subquery(),
+            select(func.min(ActiveJob.lease_expires_at)).where(ActiveJob.status == "running").scalar_subquery(),
+        )).one()
+        return min((t for t in (next_run, next_expiry) if t is not None), default=None)
+
+    def reclaim_stale_leases(self, db: Session, now: Optional[datetime] = None) -> int:
+        """
+        Returns 'running' jobs whose lease has expired to the queue.
+        A lapsed lease means the owning worker crashed or stalled mid-job.
+        """
+        from app.models import ActiveJob
+        now = now or datetime.utcnow()
+        result = db.execute(
+            update(ActiveJob)
+            .where(ActiveJob.status == "running", ActiveJob.lease_expires_at < now)
+            .values(status="queued", lease_owner=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            logger.warning(f"Worker: Reclaimed {result.rowcount} job(s) with expired leases.")
+        return result.rowcount or 0
+
+    def claim_jobs(
+        self,
+        db: Session,
+        limit: Optional[int] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Any]:
+        """
+        Claims a bounded batch of due jobs for this worker and commits the lease.
+        PostgreSQL uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers pick disjoint rows.
+        SQLite has no row locks; the status-guarded UPDATE is the claim, so a racing worker
+        simply claims nothing instead of double-executing.
+
+        A job with an `ordering_key` is only claimable while no older job with the same key is
+        queued or running, so each key's jobs run strictly in enqueue order, including retries.
+        """
+        from app.models import ActiveJob
+        now = datetime.utcnow()
+        limit = limit or settings.WORKER_BATCH_SIZE
+        lease_until = now + timedelta(seconds=lease_seconds or settings.WORKER_LEASE_SECONDS)
+
+        self.reclaim_stale_leases(db, now)
+
+        candidates = (
+            select(ActiveJob.id)
+            .where(ActiveJob.status == "queued", ActiveJob.run_at <= now, _in_order())
+            .order_by(ActiveJob.run_at)
+            .limit(limit)
+        )
+        if db.get_bind().dialect.name == "postgresql":
+            candidates = candidates.with_for_update(skip_locked=True)
+        candidate_ids = db.execute(candidates).scalars().all()
+        if not candidate_ids:
+            db.commit()
+            return []
+
+        db.execute(
+            update(ActiveJob)
+            .where(ActiveJob.id.in_(candidate_ids), ActiveJob.status == "queued")
+            .values(status="running", lease_owner=self.worker_id, lease_expires_at=lease_until)
+            .execution_options(synchronize_session=False)
+        )
+        # Commit so the lease is visible to other workers and row locks are released before execution
+        db.commit()
 
-        return job_id
+        claimed = db.query(ActiveJob).filter(
+            ActiveJob.id.in_(candidate_ids),
+            ActiveJob.status == "running",
+            ActiveJob.lease_owner == self.worker_id
+        ).populate_existing().all()
+        logger.info(f"Worker {self.worker_id}: Claimed {len(claimed)}/{len(candidate_ids)} job(s) until {lease_until.isoformat()}")
+        return claimed
 
-    async def execute_pending_jobs(self, db: Optional[Session] = None) -> int:
+    async def execute_pending_jobs(
+        self,
+        db: Optional[Session] = None,
+        concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ) -> int:
         """
         Processes pending tasks.
-        Queries database-backed 'active_jobs' if session is present to ensure crash recovery.
+        With a database session, claims a leased batch from 'active_jobs' (crash recovery via lease expiry)
+        and runs up to `concurrency` jobs at once (one at a time on SQLite), so several worker processes can
+        drain the table in parallel.
         """
         executed_count = 0
         now = datetime.utcnow()
 
         if db is not None:
-            # 1. DURABLE CRASH RECOVERY LOOP (Priority 1)
-            # Query all 'queued' active_jobs where run_at <= now
-            from app.models import ActiveJob
-            pending_jobs = db.query(ActiveJob).filter(
-                ActiveJob.status == "queued",
-                ActiveJob.run_at <= now
-            ).all()
-
-            for job in pending_jobs:
-                job.status = "running"
-                db.flush()
-                logger.info(f"Worker: Processing active job {job.id} [{job.task_name}]... Context Trace: {job.correlation_id}")
-
-                try:
-                    await self._process_task(job.task_name, job.payload, db=db)
-                    job.status = "completed"
-                    executed_count += 1
-                except Exception as e:
-                    logger.error(f"Worker: Persistent Job {job.id} execution failed: {e}")
-                    
-                    if job.retries_remaining > 0:
-                        job.retries_remaining -= 1
-                        job.status = "queued"
-                        job.run_at = datetime.utcnow() + timedelta(seconds=10) # 10s retry backoff
-                        logger.info(f"Worker: Retrying job {job.id}. Retries left: {job.retries_remaining}")
-                    else:
-                        # Quarantine into failure status inside table (Dead-Letter Queue representation)
-                        job.status = "failed"
-                        job.payload = {**job.payload, "error_log": str(e), "failed_at": datetime.utcnow().isoformat()}
-                        logger.error(f"Worker CRITICAL: Job {job.id} exceeded retries. Quarantined inside database active_jobs DLQ.")
-                db.flush()
+            # 1. DURABLE LEASED EXECUTION (Priority 1)
+            # Each job runs in its own short transaction; outcomes are committed on `db` in groups,
+            # so one failing job can no longer roll back the completed status of its neighbours.
+            started = time.monotonic()
+            stats = WorkerPassStats()
+            jobs = self.claim_jobs(db, limit=batch_size)
+            stats.claimed = len(jobs)
+            limit = concurrency or settings.WORKER_CONCURRENCY
+            if db.get_bind().dialect.name == "sqlite":
+                # One writer per SQLite file: a job awaiting with its writes flushed holds the lock, and every
+                # other job's session would block the event loop for the busy timeout, then fail and re-run
+                limit = 1
+            semaphore = asyncio.Semaphore(limit)
+            commit_every = max(1, settings.WORKER_COMMIT_BATCH_SIZE)
+            uncommitted = 0
+
+            async def run_with_limit(job) -> None:
+                nonlocal uncommitted
+                async with semaphore:
+                    outcome = await self._run_claimed_job(job, db)
+                stats.record(outcome)
+                uncommitted += 1
+                if uncommitted >= commit_every:
+                    uncommitted = 0
+                    db.commit()
+                    stats.commits += 1
+
+            errors = [
+                e for e in await asyncio.gather(*(run_with_limit(job) for job in jobs), return_exceptions=True)
+                if isinstance(e, BaseException)
+            ]
+            if errors:
+                # Outcomes not yet committed stay leased and are reclaimed once the lease lapses
+                raise errors[0]
+            if uncommitted:
+                db.commit()
+                stats.commits += 1
+
+            stats.duration_ms = int((time.monotonic() - started) * 1000)
+            self._record_pass(stats)
+            executed_count = stats.completed
         else:
             # 2. OFFLINE MEMORY ENGINE FALLBACK
             for job in list(OFFLINE_ACTIVE_JOBS):
@@ -115,46 +299,170 @@ class WorkerQueue:
                         job["status"] = "completed"
                         OFFLINE_ACTIVE_JOBS.remove(job)
                         executed_count += 1
+                    except DeferJob as e:
+                        job["status"] = "queued"
+                        job["run_at"] = (datetime.utcnow() + timedelta(seconds=e.retry_after)).isoformat()
                     except Exception as e:
                         logger.error(f"Worker: Sandbox Job {job['job_id']} execution failed: {e}")
-                        
-                        if job["retries_remaining"] > 0:
-                            job["retries_remaining"] -= 1
+                        policy = get_retry_policy(job["task_name"], job.get("retry_policy"))
+                        job["attempts"] = job.get("attempts", 0) + 1
+
+                        retryable = policy.is_retryable(e) and not isinstance(e, UnknownTaskError)
+                        if retryable and job["attempts"] < policy.max_attempts:
+                            job["retries_remaining"] = policy.max_attempts - 1 - job["attempts"]
                             job["status"] = "queued"
-                            job["run_at"] = (datetime.utcnow() + timedelta(seconds=10)).isoformat()
-                            logger.info(f"Worker: Retrying job {job['job_id']}. Retries left: {job['retries_remaining']}")
+                            job["run_at"] = (datetime.utcnow() + timedelta(seconds=policy.next_delay(job["attempts"]))).isoformat()
+                            logger.info(f"Worker: Retrying job {job['job_id']} at {job['run_at']}. Retries left: {job['retries_remaining']}")
                         else:
                             job["status"] = "failed"
+                            job["retries_remaining"] = 0
                             job["error_log"] = str(e)
                             OFFLINE_DLQ.append(job)
                             OFFLINE_ACTIVE_JOBS.remove(job)
-                            logger.error(f"Worker CRITICAL: Sandbox Job {job['job_id']} exceeded retries. Quarantined in memory DLQ.")
+                            logger.error(f"Worker CRITICAL: Sandbox Job {job['job_id']} failed permanently. Quarantined in memory DLQ.")
 
         return executed_count
 
+    def _record_pass(self, stats: WorkerPassStats) -> None:
+        self.last_pass_stats = stats
+        for field, value in stats.to_dict().items():
+            setattr(self.total_stats, field, getattr(self.total_stats, field) + value)
+        if stats.claimed:
+            logger.info(
+                f"Worker pass: claimed={stats.claimed} completed={stats.completed} retried={stats.retried} deferred={stats.deferred} "
+                f"failed={stats.failed} commits={stats.commits} in {stats.duration_ms}ms"
+            )
+
+    async def _run_claimed_job(self, job, db: Session) -> str:
+        """
+        Executes one leased job inside its own session/transaction and records the outcome on `job`
+        (owned by the coordinating session `db`). Returns 'completed', 'retried', 'deferred' or 'failed'.
+        """
+        logger.info(f"Worker: Processing active job {job.id} [{job.task_name}]... Context Trace: {job.correlation_id}")
+        job_db = Session(bind=db.get_bind(), autoflush=False)
+        try:
+            await self._process_task(job.task_name, job.payload, db=job_db)
+            job_db.commit()
+            job.attempts = (job.attempts or 0) + 1
+            job.status = "completed"
+            return "completed"
+        except DeferJob as e:
+            # Throttled, not failed: reschedule without consuming an attempt
+            job_db.rollback()
+            job.status = "queued"
+            job.run_at = datetime.utcnow() + timedelta(seconds=e.retry_after)
+            logger.info(f"Worker: Deferred job {job.id} by {e.retry_after:.2f}s ({e}).")
+            return "deferred"
+        except Exception as e:
+            job_db.rollback()
+            logger.error(f"Worker: Persistent Job {job.id} execution failed: {e}")
+            policy = get_retry_policy(job.task_name, job.retry_policy)
+            job.attempts = (job.attempts or 0) + 1
+            retryable = policy.is_retryable(e) and not isinstance(e, UnknownTaskError)
+
+            if retryable and job.attempts < policy.max_attempts:
+                delay = policy.next_delay(job.attempts)
+                job.retries_remaining = policy.max_attempts - 1 - job.attempts
+                job.status = "queued"
+                job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+                logger.info(f"Worker: Retrying job {job.id} in {delay:.1f}s. Retries left: {job.retries_remaining}")
+                return "retried"
+            # Quarantine into failure status inside table (Dead-Letter Queue representation)
+            reason = "exceeded retries" if retryable else f"raised non-retryable {type(e).__name__}"
+            job.retries_remaining = 0
+            job.status = "failed"
+            job.payload = {**job.payload, "error_log": str(e), "failed_at": datetime.utcnow().isoformat()}
+            logger.error(f"Worker CRITICAL: Job {job.id} {reason}. Quarantined inside database active_jobs DLQ.")
+            self._run_failure_hook(job, str(e), db)
+            return "failed"
+        finally:
+            job_db.close()
+            job.lease_owner = None
+            job.lease_expires_at = None
+
+    @staticmethod
+    def _run_failure_hook(job, error: str, db: Session) -> None:
+        """Lets the task clean up after a dead-lettered job, in the transaction that records the failure."""
+        try:
+            hook = task_registry.get(job.task_name).on_failure
+        except UnknownTaskError:
+            return
+        if hook is None:
+            return
+        try:
+            with db.begin_nested():
+                hook(job.payload, error, db)
+        except Exception as hook_error:
+            logger.error(f"Worker: Failure hook of job {job.id} [{job.task_name}] raised: {hook_error}")
+
     async def _process_task(self, task_name: str, payload: Dict[str, Any], db: Optional[Session] = None):
-        """Executes corresponding operational logic."""
+        """Executes corresponding operational logic via the task registry."""
         if payload.get("force_failure"):
             raise ConnectionError("Meta Cloud API gateway timeout (Simulated 503 Network Timeout).")
+        return await task_registry.run(task_name, payload, db)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# TASK HANDLERS
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _last_inbound_at(db: Optional[Session], phone_number: str) -> Optional[datetime]:
+    """Time of the vendor's most recent inbound WhatsApp message (opens Meta's 24h session window)."""
+    if db is None or not phone_number:
+        return None
+    from app.models import WebhookEvent
+    # Meta reports senders without the leading '+'; ingestion stores numbers with it
+    return db.query(func.max(WebhookEvent.created_at)).filter(
+        WebhookEvent.event_type == "message_received",
+        WebhookEvent.sender_phone.in_({phone_number, phone_number.lstrip("+")})
+    ).scalar()
+
+
+@task_registry.task("dispatch_whatsapp_outbox", kind="async", concurrency=20, timeout=30)
+async def dispatch_whatsapp_outbox(payload: Dict[str, Any], db: Optional[Session]) -> None:
+    recipient  = payload.get("phone_number")
+    text       = payload.get("message_text")
+    org_id     = payload.get("organization_id")
+    # Meta throughput tier + per-recipient pair limit; raises RateLimited (job requeued) when over
+    whatsapp_rate_limiter.acquire(recipient)
+
+    # Free-form text inside the 24h session window, approved template outside it
+    within_window, message_payload, policy_note = whatsapp_policy.validate_and_prepare_outbox(
+        vendor_phone=recipient,
+        proposed_text=text,
+        last_inbound_timestamp=_last_inbound_at(db, recipient),
+        template_parameters=[payload.get("vendor_name") or "Supplier", payload.get("po_number") or ""],
+    )
+    whatsapp_message_id = await whatsapp_sender.send(message_payload)
+    logger.info(f"Outbox Dispatcher: Message {whatsapp_message_id} sent to {recipient}: '{text}'")
+
+    if db is not None and org_id:
+        from app.models import Message
+        db.add(Message(
+            organization_id=org_id,
+            workflow_id=payload.get("workflow_id"),
+            task_id=payload.get("task_id"),
+            vendor_id=payload.get("vendor_id"),
+            sender_type="system_outbox",
+            whatsapp_message_id=whatsapp_message_id,
+            message_content=text if within_window else f"[template:{message_payload['template']['name']}] {text}",
+            delivery_status="sent",
+            correlation_id=get_correlation_id(),
+            message_metadata={"message_type": message_payload["type"], "policy_note": policy_note},
+        ))
+        # Track WhatsApp message usage against subscription plan
+        try:
+            from app.services.subscription import check_limit
+            check_limit(db, org_id, "whatsapp_msgs", increment=1)
+        except Exception as e:
+            logger.warning(f"Usage tracking failed for whatsapp_msgs: {e}")
+
+
+@task_registry.task("escalate_unresponsive_vendor", kind="async", concurrency=5, timeout=30)
+async def escalate_unresponsive_vendor(payload: Dict[str, Any], db: Optional[Session]) -> None:
+    workflow_id = payload.get("workflow_id")
+    logger.warning(f"Escalator: Delayed alerts triggered for workflow {workflow_id}.")
 
-        if task_name == "dispatch_whatsapp_outbox":
-            recipient  = payload.get("phone_number")
-            text       = payload.get("message_text")
-            org_id     = payload.get("organization_id")
-            logger.info(f"Outbox Dispatcher: Message successfully sent to {recipient}: '{text}'")
-            # Track WhatsApp message usage against subscription plan
-            if db is not None and org_id:
-                try:
-                    from app.services.subscription import check_limit
-                    check_limit(db, org_id, "whatsapp_msgs", increment=1)
-                except Exception as e:
-                    logger.warning(f"Usage tracking failed for whatsapp_msgs: {e}")
-
-        elif task_name == "escalate_unresponsive_vendor":
-            workflow_id = payload.get("workflow_id")
-            logger.warning(f"Escalator: Delayed alerts triggered for workflow {workflow_id}.")
-
-        await asyncio.sleep(0.01)
 
 # Backwards compatible alias properties to protect legacy validation mocks
 class WorkerQueueLegacyMock:
@@ -0,0 +1,75 @@
+# file: backend/scripts/bench_whatsapp_sender.py
+"""
+Throughput/latency benchmark for WhatsAppSender against scripts/mock_graph_api.py.
+
+    python backend/scripts/mock_graph_api.py --latency-ms 40 &
+    python backend/scripts/bench_whatsapp_sender.py --messages 2000 --concurrency 50
+
+Reports messages/second, latency percentiles and error counts. Use
+--connections to compare pool sizes (keep-alive reuse vs. connection churn).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.config import settings  # noqa: E402
+from app.services.whatsapp_sender import WhatsAppSender  # noqa: E402
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(args) -> None:
+    settings.WHATSAPP_HTTP_MAX_CONNECTIONS = args.connections
+    sender = WhatsAppSender(base_url=args.url, token="bench-token", phone_number_id="bench_phone_id")
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, outcomes = [], Counter()
+
+    async def send_one(i: int) -> None:
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": f"+9198{i:08d}",
+            "recipient_type": "individual",
+            "type": "text",
+            "text": {"body": f"Please confirm PO-BENCH-{i}"},
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await sender.send(payload)
+                outcomes["sent"] += 1
+            except Exception as e:
+                outcomes[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send_one(i) for i in range(args.messages)))
+    elapsed = time.perf_counter() - started
+    await sender.aclose()
+
+    latencies.sort()
+    print(f"messages={args.messages} concurrency={args.concurrency} connections={args.connections}")
+    print(f"elapsed={elapsed:.2f}s throughput={args.messages / elapsed:.1f} msg/s")
+    print(
+        f"latency p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms max={latencies[-1]:.1f}ms"
+    )
+    print(f"outcomes={dict(outcomes)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8099/v20.0")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,82 @@
+# file: backend/scripts/mock_graph_api.py
+"""
+Local stand-in for the WhatsApp Cloud API (Graph API) messages endpoint.
+
+    python backend/scripts/mock_graph_api.py --port 8099 --latency-ms 40 --error-rate 0.02
+
+Then point the backend at it:
+
+    META_GRAPH_API_URL=http://127.0.0.1:8099/v20.0
+    META_WHATSAPP_TOKEN=local-test-token
+
+Simulated latency, 5xx errors and 429 throttling let the outbox worker and
+scripts/bench_whatsapp_sender.py be exercised offline. GET /stats reports counts.
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Mock Graph API")
+app.state.latency_ms = 0.0
+app.state.error_rate = 0.0
+app.state.throttle_rate = 0.0
+STATS: Counter = Counter()
+
+
+@app.post("/{version}/{phone_number_id}/messages")
+async def send_message(version: str, phone_number_id: str, request: Request):
+    payload = await request.json()
+    if app.state.latency_ms:
+        # +/-50% jitter around the configured latency
+        await asyncio.sleep(app.state.latency_ms / 1000 * random.uniform(0.5, 1.5))
+
+    roll = random.random()
+    if roll < app.state.throttle_rate:
+        STATS["throttled"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "1"},
+            content={"error": {"message": "(#130429) Rate limit hit", "code": 130429}},
+        )
+    if roll < app.state.throttle_rate + app.state.error_rate:
+        STATS["errors"] += 1
+        return JSONResponse(status_code=503, content={"error": {"message": "Service temporarily unavailable", "code": 2}})
+    if not request.headers.get("authorization", "").startswith("Bearer "):
+        STATS["rejected"] += 1
+        return JSONResponse(status_code=401, content={"error": {"message": "Invalid OAuth access token", "code": 190}})
+    if "to" not in payload or payload.get("type") not in {"text", "template"}:
+        STATS["rejected"] += 1
+        return JSONResponse(status_code=400, content={"error": {"message": "Invalid parameter", "code": 100}})
+
+    STATS["sent"] += 1
+    STATS[f"type_{payload['type']}"] += 1
+    return {
+        "messaging_product": "whatsapp",
+        "contacts": [{"input": payload["to"], "wa_id": payload["to"].lstrip("+")}],
+        "messages": [{"id": f"wamid.mock.{uuid.uuid4().hex}"}],
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return dict(STATS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean simulated Graph API latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = parser.parse_args()
+    app.state.latency_ms = args.latency_ms
+    app.state.error_rate = args.error_rate
+    app.state.throttle_rate = args.throttle_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,103 @@
+# file: backend/scripts/mock_openai_api.py
+"""
+Local stand-in for the OpenAI chat completions endpoint, answering vendor
+message parses with the backend's rule-based parser.
+
+    python backend/scripts/mock_openai_api.py --port 8098 --latency-ms 300 --error-rate 0.02
+
+Then point the backend at it:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8098/v1
+    OPENAI_API_KEY=local-test-key
+
+Both the single-message prompt and the batched prompt (a JSON array of
+messages after "Messages:") are understood. --drop-rate omits individual
+results from batched responses to exercise the per-message fallback.
+GET /stats reports requests, messages and prompt characters.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.ai_service import AIService  # noqa: E402
+
+app = FastAPI(title="Mock OpenAI API")
+app.state.latency_ms = 0.0
+app.state.error_rate = 0.0
+app.state.drop_rate = 0.0
+STATS: Counter = Counter()
+_parser = AIService(api_key=None)._mock_rule_based_parser
+_SINGLE = re.compile(r'Analyze this incoming WhatsApp message from a vendor:\s*"(.*)"', re.DOTALL)
+
+
+def _completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+    STATS["requests"] += 1
+    STATS["prompt_chars"] += len(prompt)
+    if app.state.latency_ms:
+        # +/-50% jitter around the configured latency
+        await asyncio.sleep(app.state.latency_ms / 1000 * random.uniform(0.5, 1.5))
+    if random.random() < app.state.error_rate:
+        STATS["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "The server had an error", "type": "server_error"}})
+
+    model = body.get("model", "mock")
+    if "Messages:" in prompt:
+        messages = json.loads(prompt.rsplit("Messages:", 1)[1])
+        results = []
+        for message in messages:
+            if random.random() < app.state.drop_rate:
+                STATS["dropped"] += 1
+                continue
+            results.append({"index": message["index"], **_parser(message["text"])})
+        STATS["messages"] += len(messages)
+        return _completion(model, json.dumps({"results": results}))
+
+    match = _SINGLE.search(prompt)
+    STATS["messages"] += 1
+    return _completion(model, json.dumps(_parser(match.group(1) if match else prompt)))
+
+
+@app.get("/stats")
+async def stats():
+    return dict(STATS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean simulated completion latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of batched results left out")
+    args = parser.parse_args()
+    app.state.latency_ms = args.latency_ms
+    app.state.error_rate = args.error_rate
+    app.state.drop_rate = args.drop_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -34,6 +34,19 @@ def db_session():
         poolclass=StaticPool
     )
     Base.metadata.create_all(bind=engine)
+    # Token buckets are process-global; start every test with full buckets
+    from app.services.rate_limiter import whatsapp_rate_limiter
+    from app.services.outbound_webhooks import _route_cache
+    from app.services.vendor_resolver import vendor_resolver
+    from app.services.webhook_idempotency import webhook_idempotency
+    from app.services.delivery_status import delivery_statuses
+    from app.services.parse_cache import parse_cache
+    whatsapp_rate_limiter.reset()
+    _route_cache.clear()
+    vendor_resolver.clear()
+    webhook_idempotency.clear()
+    delivery_statuses.clear()
+    parse_cache.clear()
     
     SessionClass = sessionmaker(bind=engine)
     session = SessionClass()
@@ -345,3 +358,1415 @@ def test_invite_details_api(db_session):
         assert "expired" in response.json()["detail"].lower()
     finally:
         app.dependency_overrides.clear()
+
+
+# --------------------------------------------------
+# TEST 8: LEASED JOB CLAIMS ACROSS WORKERS
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_worker_leases_prevent_double_claims(db_session):
+    """Two workers never claim the same job, and expired leases from crashed workers are reclaimed."""
+    from app.services.worker import WorkerQueue
+
+    job_ids = [
+        worker_queue.enqueue_job(
+            task_name="dispatch_whatsapp_outbox",
+            payload={"phone_number": f"+9198765{i:05d}", "message_text": f"Lease trace {i}"},
+            db=db_session
+        )
+        for i in range(4)
+    ]
+    db_session.commit()
+
+    worker_a = WorkerQueue(worker_id="worker-a")
+    worker_b = WorkerQueue(worker_id="worker-b")
+    claimed_a = worker_a.claim_jobs(db_session, limit=3)
+    claimed_b = worker_b.claim_jobs(db_session, limit=3)
+
+    ids_a = {job.id for job in claimed_a}
+    ids_b = {job.id for job in claimed_b}
+    assert len(ids_a) == 3
+    assert ids_a.isdisjoint(ids_b)
+    assert ids_a | ids_b == set(job_ids)
+    assert all(job.lease_owner == "worker-a" and job.lease_expires_at is not None for job in claimed_a)
+
+    # Worker A crashes: its leases lapse and the jobs become claimable again
+    for job in claimed_a:
+        job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+
+    assert worker_b.reclaim_stale_leases(db_session) == 3
+    db_session.commit()
+
+    executed = await worker_b.execute_pending_jobs(db=db_session, concurrency=2)
+    assert executed == 3
+    statuses = {job.id: job.status for job in db_session.query(ActiveJob).filter(ActiveJob.id.in_(ids_a))}
+    assert set(statuses.values()) == {"completed"}
+
+
+# --------------------------------------------------
+# TEST 9: EVENT-DRIVEN WORKER WAKEUP
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_enqueue_commit_wakes_worker(db_session):
+    """The worker is woken when an enqueue commits (not on rollback) and can sleep until the next run_at."""
+    from app.services.job_notifier import job_notifier
+
+    job_notifier.attach()
+
+    worker_queue.enqueue_job(task_name="escalate_unresponsive_vendor", payload={"workflow_id": "wf_x"}, db=db_session)
+    db_session.rollback()
+    assert await job_notifier.wait(timeout=0.05) is False
+
+    worker_queue.enqueue_job(
+        task_name="escalate_unresponsive_vendor",
+        payload={"workflow_id": "wf_x"},
+        delay_seconds=30,
+        db=db_session
+    )
+    db_session.commit()
+    assert await job_notifier.wait(timeout=1.0) is True
+
+    next_due = worker_queue.next_due_at(db_session)
+    assert next_due is not None
+    assert timedelta(seconds=25) < next_due - datetime.utcnow() <= timedelta(seconds=30)
+
+
+# --------------------------------------------------
+# TEST 10: PER-JOB TRANSACTION ISOLATION
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_failing_job_does_not_roll_back_completed_neighbours(db_session, monkeypatch):
+    """A failing job is retried on its own while the rest of the pass stays completed and committed."""
+    from app.core.config import settings
+    from app.services.worker import WorkerQueue
+
+    monkeypatch.setattr(settings, "WORKER_COMMIT_BATCH_SIZE", 1)
+    ok_ids = [
+        worker_queue.enqueue_job("dispatch_whatsapp_outbox", {"phone_number": f"+9198765{i:05d}", "message_text": f"ok {i}"}, db=db_session)
+        for i in range(2)
+    ]
+    bad_id = worker_queue.enqueue_job("dispatch_whatsapp_outbox", {"force_failure": True}, db=db_session)
+    db_session.commit()
+
+    worker = WorkerQueue(worker_id="worker-isolation")
+    executed = await worker.execute_pending_jobs(db=db_session)
+    db_session.rollback()  # Anything not committed by the worker would be lost here
+
+    assert executed == 2
+    assert {db_session.get(ActiveJob, job_id).status for job_id in ok_ids} == {"completed"}
+    bad_job = db_session.get(ActiveJob, bad_id)
+    assert bad_job.status == "queued"
+    assert bad_job.attempts == 1
+    assert worker.last_pass_stats.to_dict() | {"duration_ms": 0} == {
+        "claimed": 3, "completed": 2, "retried": 1, "deferred": 0, "failed": 0, "commits": 3, "duration_ms": 0
+    }
+
+
+# --------------------------------------------------
+# TEST 11: PER-TASK RETRY POLICIES WITH BACKOFF
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_retry_policy_backoff_and_overrides(db_session):
+    """Retries back off exponentially with jitter, honour per-enqueue overrides and skip non-retryable errors."""
+    import random
+    from app.services.retry_policy import RetryPolicy, get_retry_policy
+
+    policy = RetryPolicy(max_attempts=5, base_delay_seconds=2, max_delay_seconds=10, jitter="none")
+    assert [policy.next_delay(n) for n in range(1, 5)] == [2, 4, 8, 10]
+    jittered = RetryPolicy(base_delay_seconds=8, jitter="full")
+    rng = random.Random(7)
+    assert all(0 <= jittered.next_delay(3, rng) <= 32 for _ in range(50))
+
+    outbox = get_retry_policy("dispatch_whatsapp_outbox")
+    assert not outbox.is_retryable(ValueError("bad phone number"))
+    assert outbox.is_retryable(ConnectionError("503"))
+
+    override = RetryPolicy(max_attempts=2, base_delay_seconds=60, jitter="none")
+    job_id = worker_queue.enqueue_job(
+        "dispatch_whatsapp_outbox", {"force_failure": True}, db=db_session, retry_policy=override
+    )
+    db_session.commit()
+    assert db_session.get(ActiveJob, job_id).retries_remaining == 1
+
+    before = datetime.utcnow()
+    await worker_queue.execute_pending_jobs(db=db_session)
+    job = db_session.get(ActiveJob, job_id)
+    assert job.status == "queued" and job.attempts == 1 and job.retries_remaining == 0
+    assert timedelta(seconds=59) <= job.run_at - before <= timedelta(seconds=61)
+
+    # Second (final) attempt exhausts the override's max_attempts
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    await worker_queue.execute_pending_jobs(db=db_session)
+    assert db_session.get(ActiveJob, job_id).status == "failed"
+
+
+# --------------------------------------------------
+# TEST 12: TASK REGISTRY (CONCURRENCY, EXECUTORS, HISTOGRAMS)
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_task_registry_limits_and_latency(db_session):
+    """Registered tasks honour their concurrency limit and timeout, run blocking work off-loop, and record latency."""
+    import asyncio
+    import threading
+    import time
+    from app.services.task_registry import TaskRegistry, task_registry
+
+    registry = TaskRegistry()
+    running, peak = 0, 0
+
+    @registry.task("limited", concurrency=2, timeout=1)
+    async def limited(payload, db):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    @registry.task("blocking", kind="io", timeout=1)
+    def blocking(payload):
+        time.sleep(0.02)
+        return threading.current_thread().name
+
+    @registry.task("slow", timeout=0.05)
+    async def slow(payload, db):
+        await asyncio.sleep(1)
+
+    await asyncio.gather(*(registry.run("limited", {}) for _ in range(6)))
+    assert peak == 2
+    assert (await registry.run("blocking", {})).startswith("task-io")
+    with pytest.raises(asyncio.TimeoutError):
+        await registry.run("slow", {})
+
+    metrics = registry.metrics()
+    assert metrics["limited"]["latency"]["count"] == 6
+    assert metrics["blocking"]["latency"]["p50_ms"] >= 10
+    assert metrics["slow"]["errored"] == 1
+    registry.shutdown()
+
+    # The shared registry serves the built-in tasks; unknown task names fail without retrying
+    assert {"dispatch_whatsapp_outbox", "escalate_unresponsive_vendor"} <= set(task_registry.names())
+    job_id = worker_queue.enqueue_job("no_such_task", {}, db=db_session)
+    db_session.commit()
+    await worker_queue.execute_pending_jobs(db=db_session)
+    job = db_session.get(ActiveJob, job_id)
+    assert job.status == "failed" and job.attempts == 1
+
+
+# --------------------------------------------------
+# TEST 13: BULK ENQUEUE
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_enqueue_many_single_insert(db_session):
+    """enqueue_many() writes every job in one INSERT statement and the worker drains them."""
+    from sqlalchemy import event
+    from app.services.worker import JobRequest
+
+    inserts = []
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT INTO ACTIVE_JOBS"):
+            inserts.append(statement)
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", count_inserts)
+    try:
+        job_ids = worker_queue.enqueue_many(
+            [JobRequest("dispatch_whatsapp_outbox", {"phone_number": f"+9198765{i:05d}", "message_text": f"PO {i}"}) for i in range(25)]
+            + [JobRequest("escalate_unresponsive_vendor", {"workflow_id": "wf_bulk"}, delay_seconds=3600)],
+            db=db_session,
+        )
+        db_session.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", count_inserts)
+
+    assert len(inserts) == 1
+    assert len(set(job_ids)) == 26
+    assert worker_queue.enqueue_many([], db=db_session) == []
+
+    assert await worker_queue.execute_pending_jobs(db=db_session) == 25
+    escalation = db_session.get(ActiveJob, job_ids[-1])
+    assert escalation.status == "queued" and escalation.retries_remaining == 3
+
+
+# --------------------------------------------------
+# TEST 14: RATE-LIMITED WHATSAPP OUTBOX
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_whatsapp_rate_limiter_defers_over_limit_jobs(db_session, monkeypatch):
+    """Sends beyond the per-number tier or per-recipient pair limit are requeued, not failed."""
+    from app.core.config import settings
+    from app.services.rate_limiter import RateLimited, WhatsAppRateLimiter, whatsapp_rate_limiter
+
+    clock = [0.0]
+    monkeypatch.setattr(settings, "WHATSAPP_MESSAGES_PER_SECOND", 2.0)
+    monkeypatch.setattr(settings, "WHATSAPP_PAIR_INTERVAL_SECONDS", 6.0)
+    limiter = WhatsAppRateLimiter(clock=lambda: clock[0])
+    limiter.acquire("+911111111111")
+    with pytest.raises(RateLimited) as exc:
+        limiter.acquire("+911111111111")
+    assert exc.value.retry_after == pytest.approx(6.0)
+    limiter.acquire("+912222222222")
+    with pytest.raises(RateLimited) as exc:
+        limiter.acquire("+913333333333")   # Number tier (2/s burst) now empty
+    assert exc.value.retry_after == pytest.approx(0.5)
+    clock[0] += 0.5
+    limiter.acquire("+913333333333")
+    assert limiter.snapshot()["deferred_total"] == 2
+
+    # Three messages to one vendor: the first sends, the rest are rescheduled without using an attempt
+    monkeypatch.setattr(settings, "WHATSAPP_MESSAGES_PER_SECOND", 80.0)
+    whatsapp_rate_limiter.reset()
+    job_ids = [
+        worker_queue.enqueue_job("dispatch_whatsapp_outbox", {"phone_number": "+919876543210", "message_text": f"PO {i}"}, db=db_session)
+        for i in range(3)
+    ]
+    db_session.commit()
+    before = datetime.utcnow()
+    assert await worker_queue.execute_pending_jobs(db=db_session) == 1
+    assert worker_queue.last_pass_stats.deferred == 2
+    deferred = [db_session.get(ActiveJob, j) for j in job_ids if db_session.get(ActiveJob, j).status == "queued"]
+    assert len(deferred) == 2
+    for job in deferred:
+        assert job.attempts == 0 and job.lease_owner is None
+        assert job.run_at - before >= timedelta(seconds=5)
+    assert whatsapp_rate_limiter.snapshot()["recipients_throttled"] == 1
+
+
+# --------------------------------------------------
+# TEST 15: ASYNC WHATSAPP SENDER
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_whatsapp_sender_maps_graph_api_responses(db_session, monkeypatch):
+    """Outbox jobs send through the pooled Graph API client and record the returned wamid."""
+    import json
+    import httpx
+    import app.services.worker as worker_module
+    from app.models import Message
+    from app.services.rate_limiter import RateLimited
+    from app.services.whatsapp_sender import (
+        WhatsAppRejectedError, WhatsAppSender, WhatsAppTransientError, parse_retry_after,
+    )
+
+    requests_seen = []
+    def graph_api(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests_seen.append((request, body))
+        status = {"+910000000429": 429, "+910000000503": 503, "+910000000400": 400}.get(body["to"], 200)
+        if status != 200:
+            return httpx.Response(status, headers={"Retry-After": "7"}, json={"error": {"code": status}})
+        return httpx.Response(200, json={"messages": [{"id": f"wamid.test.{len(requests_seen)}"}]})
+
+    sender = WhatsAppSender(base_url="http://graph.mock/v20.0", token="t0k", phone_number_id="pn_1",
+                            transport=httpx.MockTransport(graph_api))
+    with pytest.raises(RateLimited) as throttled:
+        await sender.send({"to": "+910000000429", "type": "text"})
+    assert throttled.value.retry_after == 7
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0   # HTTP-date in the past
+    future = (datetime.utcnow() + timedelta(seconds=30)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    assert 25 <= parse_retry_after(future) <= 30
+    assert parse_retry_after("soon") == 1.0 and parse_retry_after(None) == 1.0
+    with pytest.raises(WhatsAppTransientError):
+        await sender.send({"to": "+910000000503", "type": "text"})
+    with pytest.raises(WhatsAppRejectedError):
+        await sender.send({"to": "+910000000400", "type": "text"})
+    assert requests_seen[0][0].url.path == "/v20.0/pn_1/messages"
+    assert requests_seen[0][0].headers["authorization"] == "Bearer t0k"
+
+    # Vendor has never messaged us → outside the 24h window → approved template with PO variables
+    monkeypatch.setattr(worker_module, "whatsapp_sender", sender)
+    job_id = worker_queue.enqueue_job("dispatch_whatsapp_outbox", {
+        "organization_id": "org_test_vatva", "vendor_id": "vendor_test_laxmi", "vendor_name": "Laxmi Fasteners",
+        "po_number": "PO-9001", "phone_number": "+919876543210", "message_text": "Please confirm PO-9001",
+    }, db=db_session)
+    db_session.commit()
+    assert await worker_queue.execute_pending_jobs(db=db_session) == 1
+    await sender.aclose()
+
+    sent_body = requests_seen[-1][1]
+    assert sent_body["type"] == "template"
+    assert [p["text"] for p in sent_body["template"]["components"][0]["parameters"]] == ["Laxmi Fasteners", "PO-9001"]
+    message = db_session.query(Message).filter(Message.vendor_id == "vendor_test_laxmi").one()
+    assert message.whatsapp_message_id == f"wamid.test.{len(requests_seen)}"
+    assert message.sender_type == "system_outbox"
+    assert db_session.get(ActiveJob, job_id).status == "completed"
+
+
+# --------------------------------------------------
+# TEST 16: OUTBOUND WEBHOOK FANOUT AS DURABLE JOBS
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_transition_enqueues_webhook_delivery_instead_of_posting(db_session, monkeypatch):
+    """Transitions only enqueue a delivery job; the worker delivers and narrows retries to failed endpoints."""
+    import httpx
+    import app.services.outbound_webhooks as outbound
+    from app.models import OutboundWebhookLog, WebhookEndpoint
+    from app.services.webhook_delivery import WebhookDeliveryEngine
+
+    posted = []
+    def customer_endpoints(request: httpx.Request) -> httpx.Response:
+        posted.append((request.url.host, request.headers["x-procurehub-delivery"]))
+        return httpx.Response(200 if request.url.host == "erp.example" else 400)
+    monkeypatch.setattr(outbound, "webhook_engine", WebhookDeliveryEngine(transport=httpx.MockTransport(customer_endpoints)))
+
+    db_session.add_all([
+        WebhookEndpoint(id="ep_ok", organization_id="org_test_vatva", url="https://erp.example/hook"),
+        WebhookEndpoint(id="ep_down", organization_id="org_test_vatva", url="https://down.example/hook"),
+        WebhookEndpoint(id="ep_filtered", organization_id="org_test_vatva", url="https://x.example", event_filter="HITL_APPROVED"),
+        ProcurementWorkflow(id="wf_hook", organization_id="org_test_vatva", po_number="PO-HOOK", current_state=WorkflowState.CREATED.value),
+    ])
+    db_session.flush()
+
+    state_machine.transition_workflow(db_session, "wf_hook", WorkflowState.VENDOR_PENDING, "org_test_vatva")
+    db_session.commit()
+    assert posted == []   # Nothing sent while the transition held its row lock
+    job = db_session.query(ActiveJob).filter(ActiveJob.task_name == "deliver_outbound_webhook").one()
+    assert set(job.payload["deliveries"]) == {"ep_ok", "ep_down"}
+
+    await worker_queue.execute_pending_jobs(db=db_session)
+    assert {host for host, _ in posted} == {"erp.example", "down.example"}
+    assert db_session.query(OutboundWebhookLog).count() == 2
+    follow_up = db_session.query(ActiveJob).filter(
+        ActiveJob.task_name == "deliver_outbound_webhook", ActiveJob.status == "queued"
+    ).one()
+    assert follow_up.payload["deliveries"] == {"ep_down": job.payload["deliveries"]["ep_down"]}
+    assert follow_up.payload["attempt"] == 2
+
+
+# --------------------------------------------------
+# TEST 17: ASYNC WEBHOOK ENGINE (PARALLELISM, RETRIES, BREAKERS)
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_webhook_engine_parallel_retry_breaker_and_auto_disable(db_session, monkeypatch):
+    """Fan-out time tracks the slowest endpoint; flaky endpoints retry; dead ones trip the breaker and get disabled."""
+    import asyncio
+    import time
+    import httpx
+    from app.core.config import settings
+    from app.models import OutboundWebhookLog, WebhookEndpoint
+    from app.services.webhook_delivery import CircuitBreaker, EndpointTarget, WebhookDeliveryEngine
+
+    monkeypatch.setattr(settings, "WEBHOOK_INLINE_RETRIES", 2)
+    monkeypatch.setattr(settings, "WEBHOOK_BREAKER_FAILURES", 3)
+    monkeypatch.setattr(settings, "WEBHOOK_AUTO_DISABLE_FAILURES", 2)
+    monkeypatch.setattr("app.services.webhook_delivery.random.uniform", lambda low, high: 0)   # No backoff sleeps
+    calls = {}
+    async def endpoints(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        calls[host] = calls.get(host, 0) + 1
+        if host.startswith("slow"):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200)
+        if host == "flaky.example":
+            return httpx.Response(503 if calls[host] == 1 else 204)
+        return httpx.Response(500)
+
+    engine = WebhookDeliveryEngine(transport=httpx.MockTransport(endpoints))
+    targets = [EndpointTarget(f"ep_slow{i}", f"https://slow{i}.example/h") for i in range(5)]
+    targets += [EndpointTarget("ep_flaky", "https://flaky.example/h"), EndpointTarget("ep_dead", "https://dead.example/h")]
+    db_session.add_all([WebhookEndpoint(id=t.id, organization_id="org_test_vatva", url=t.url) for t in targets])
+    db_session.flush()
+    envelopes = {t.id: {"delivery_id": f"d_{t.id}", "event_type": "STATE_TRANSITION", "data": {}} for t in targets}
+
+    started = time.monotonic()
+    results = await engine.fanout([(t, envelopes[t.id]) for t in targets])
+    assert time.monotonic() - started < 0.2 * 5   # Concurrent, not the serial sum
+    by_id = {r["endpoint_id"]: r for r in results}
+    assert by_id["ep_flaky"]["success"] and by_id["ep_flaky"]["attempts"] == 2
+    assert not by_id["ep_dead"]["success"] and by_id["ep_dead"]["attempts"] == 3
+    assert engine.breaker("ep_dead").state == "open"
+
+    # Open circuit: no request is made for the dead endpoint
+    dead_calls = calls["dead.example"]
+    retry = await engine.deliver(targets[-1], envelopes["ep_dead"])
+    assert retry["short_circuited"] and calls["dead.example"] == dead_calls
+
+    assert engine.record_results(db_session, "org_test_vatva", envelopes, results) == []
+    assert db_session.query(OutboundWebhookLog).count() == 7   # Written as one batch
+    assert engine.record_results(db_session, "org_test_vatva", envelopes, [by_id["ep_dead"]]) == ["ep_dead"]
+    dead = db_session.get(WebhookEndpoint, "ep_dead")
+    db_session.refresh(dead)
+    assert dead.is_active is False and dead.consecutive_failures == 2 and dead.disabled_reason
+    await engine.aclose()
+
+    clock = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: clock[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock[0] = 10
+    assert breaker.allow() and not breaker.allow()   # Single half-open probe
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+# --------------------------------------------------
+# TEST 18: CACHED WEBHOOK ROUTING TABLE
+# --------------------------------------------------
+def test_webhook_routing_cache_negative_entries_and_invalidation(db_session):
+    """Orgs without endpoints cost no query per transition; endpoint edits invalidate the cached table."""
+    from sqlalchemy import event
+    from app.api.outbound_webhooks import EndpointUpdate, update_endpoint
+    from app.models import WebhookEndpoint
+    from app.services.outbound_webhooks import _matching_endpoints, _route_cache
+
+    endpoint_queries = []
+    def count_queries(conn, cursor, statement, parameters, context, executemany):
+        if "FROM webhook_endpoints" in statement:
+            endpoint_queries.append(statement)
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", count_queries)
+    try:
+        for i in range(3):
+            db_session.add(ProcurementWorkflow(id=f"wf_route_{i}", organization_id="org_test_vatva",
+                                               po_number=f"PO-R{i}", current_state=WorkflowState.CREATED.value))
+            db_session.flush()
+            state_machine.transition_workflow(db_session, f"wf_route_{i}", WorkflowState.VENDOR_PENDING, "org_test_vatva")
+        assert len(endpoint_queries) == 1   # Negative entry cached after the first transition
+    finally:
+        event.remove(engine, "before_cursor_execute", count_queries)
+    assert db_session.query(ActiveJob).filter(ActiveJob.task_name == "deliver_outbound_webhook").count() == 0
+
+    db_session.add_all([
+        WebhookEndpoint(id="ep_all", organization_id="org_test_vatva", url="https://all.example"),
+        WebhookEndpoint(id="ep_hitl", organization_id="org_test_vatva", url="https://hitl.example", event_filter="HITL_APPROVED, ESCALATION"),
+    ])
+    db_session.commit()
+    assert _matching_endpoints(db_session, "org_test_vatva", "STATE_TRANSITION") == []   # Still the cached entry
+
+    update_endpoint("ep_hitl", EndpointUpdate(description="ops"), org_id="org_test_vatva", db=db_session)
+    assert [t.id for t in _matching_endpoints(db_session, "org_test_vatva", "STATE_TRANSITION")] == ["ep_all"]
+    assert {t.id for t in _matching_endpoints(db_session, "org_test_vatva", "ESCALATION")} == {"ep_all", "ep_hitl"}
+
+    update_endpoint("ep_all", EndpointUpdate(is_active=False), org_id="org_test_vatva", db=db_session)
+    assert _matching_endpoints(db_session, "org_test_vatva", "STATE_TRANSITION") == []
+    assert _route_cache.stats()["hits"] >= 3
+
+
+# --------------------------------------------------
+# TEST 19: STREAMING PO INGESTION PIPELINE
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_streaming_ingestion_chunks_and_normalization(db_session):
+    """CSV and XLSX uploads stream in chunks; POs spanning chunks or reappearing later are assembled correctly."""
+    import io
+    from fastapi import UploadFile
+    from openpyxl import Workbook
+    from app.api.ingestion import ingest_excel_po
+    from app.models import ProcurementItem, ProcurementTask
+    from decimal import Decimal
+    from app.services.ingestion_pipeline import ParsedPO, POStream, SkippedPO
+
+    csv_text = (
+        "PO Number , Vendor Name,Mobile,Item,Qty,Rate,Amount\n"
+        "PO-1,Laxmi Fasteners,9876543210,Hex Bolts,100,12.5,\n"
+        "PO-1,Laxmi Fasteners,9876543210,Washers,\"1,000\",2,\n"
+        "PO-1,Laxmi Fasteners,9876543210,Nuts,10,1,99\n"      # Explicit amount wins
+        "PO-2,Radhe Steel,919825012345,MS Plates,abc,10,\n"   # Unparseable qty → 1
+        "PO-3,No Phone Co,,Glaze,1,1,\n"
+        ",Orphan,9999999999,Row,1,1,\n"
+        "PO-1,Laxmi Fasteners,9876543210,Late Row,1,5,\n"     # Non-contiguous: continuation
+    )
+    records = list(POStream(io.BytesIO(csv_text.encode()), "tally.csv", chunk_rows=2))
+    parsed = [r for r in records if isinstance(r, ParsedPO)]
+    skipped = [r for r in records if isinstance(r, SkippedPO)]
+    assert [(p.po_number, p.continuation, len(p.items)) for p in parsed] == [("PO-1", False, 3), ("PO-2", False, 1), ("PO-1", True, 1)]
+    assert parsed[0].vendor_phone == "+919876543210" and parsed[1].vendor_phone == "+919825012345"
+    assert parsed[0].total_amount == Decimal("1250") + Decimal("2000") + Decimal("99")
+    assert parsed[1].items[0]["quantity"] == Decimal("1")
+    assert {s.po_number for s in skipped} == {"PO-3", ""}
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Voucher Number", "Party Name", "WhatsApp", "Particulars", "Quantity", "Rate"])
+    for i in range(5):
+        sheet.append(["PO-X1" if i < 3 else "PO-X2", "Somnath Bolt", 9898022334.0, f"Item {i}", i + 1, 10])
+    xlsx = io.BytesIO()
+    workbook.save(xlsx)
+    xlsx.seek(0)
+
+    response = await ingest_excel_po(
+        file=UploadFile(file=xlsx, filename="Tally.XLSX"), x_org_id="org_test_vatva", db=db_session
+    )
+    assert response["summary"] == {"total_rows_processed": 5, "imported_purchase_orders": 2, "skipped_purchase_orders": 0}
+    task = db_session.query(ProcurementTask).filter(ProcurementTask.po_number == "PO-X1").one()
+    assert task.total_amount == Decimal("60")
+    assert db_session.query(ProcurementItem).filter(ProcurementItem.task_id == task.id).count() == 3
+    assert db_session.query(Vendor).filter(Vendor.phone_number == "+919898022334").count() == 1
+
+# --------------------------------------------------
+# TEST 20: SET-BASED INGESTION WRITES
+# --------------------------------------------------
+def test_ingestion_batch_writer_fixed_statement_count(db_session):
+    """Re-ingesting a batch costs the same handful of statements however many POs it holds."""
+    from decimal import Decimal
+    from sqlalchemy import event
+    from app.models import ProcurementItem
+    from app.services.ingestion_pipeline import ParsedPO
+    from app.services.ingestion_writer import POBatchWriter
+
+    def batch(vendor_name):
+        return [
+            ParsedPO(
+                po_number=f"PO-B{i}", vendor_name=vendor_name if i % 2 else "Laxmi Fasteners",
+                vendor_phone=f"+9198765{i % 5:05d}" if i % 2 else "+919876543210",
+                items=[{"description": "Bolts", "quantity": Decimal("2"), "rate": Decimal("5"), "amount": Decimal("10")}],
+                total_amount=Decimal("10"),
+            )
+            for i in range(40)
+        ]
+
+    jobs = POBatchWriter(db_session, "org_test_vatva", "first.csv").write(batch("Radhe Steel"))
+    db_session.commit()
+    assert len(jobs) == 40
+    assert db_session.query(Vendor).count() == 6      # Seeded Laxmi reused + 5 new numbers
+    assert db_session.query(ProcurementWorkflow).filter(
+        ProcurementWorkflow.current_state == WorkflowState.VENDOR_PENDING.value
+    ).count() == 40
+
+    statements = []
+    listener = lambda conn, cursor, sql, params, context, executemany: statements.append(sql)
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        writer = POBatchWriter(db_session, "org_test_vatva", "second.csv")
+        writer.write(batch("Radhe Steel Pvt Ltd"))
+        assert len(statements) == 8   # 3 prefetch, vendor + task upserts, item delete + insert, events
+        late = ParsedPO("PO-B3", "Radhe Steel Pvt Ltd", "+919876500003", continuation=True, total_amount=Decimal("7"),
+                        items=[{"description": "Late", "quantity": Decimal("1"), "rate": Decimal("7"), "amount": Decimal("7")}])
+        writer.write([late])
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    db_session.commit()
+
+    task = db_session.query(ProcurementTask).filter(ProcurementTask.po_number == "PO-B3").one()
+    assert task.total_amount == Decimal("17")
+    assert db_session.query(ProcurementItem).filter(ProcurementItem.task_id == task.id).count() == 2
+    assert db_session.query(ProcurementTask).count() == 40
+    assert db_session.query(Vendor).filter(Vendor.name == "Radhe Steel Pvt Ltd").count() == 5
+    assert db_session.query(WorkflowEvent).filter(WorkflowEvent.event_type == "PO_REINGESTED").count() == 40
+
+# --------------------------------------------------
+# TEST 21: BACKGROUND IMPORT JOBS
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_background_import_resumes_from_checkpoints(db_session, tmp_path, monkeypatch):
+    """A spooled upload is ingested in checkpointed worker slices; progress and NDJSON logs are exposed."""
+    import io
+    import json
+    import os
+    from decimal import Decimal
+    from fastapi import UploadFile
+    from app.api.ingestion import create_import, get_import
+    from app.core.config import settings
+    from app.models import ImportJob, ProcurementItem
+    from app.services.import_jobs import iter_log, log_path
+
+    monkeypatch.setattr(settings, "INGESTION_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "INGESTION_WRITE_BATCH_POS", 1)
+    monkeypatch.setattr(settings, "INGESTION_IMPORT_SLICE_POS", 2)
+    monkeypatch.setattr(settings, "INGESTION_CHUNK_ROWS", 2)
+
+    rows = ["PO Number,Vendor Name,Phone,Item,Qty,Rate"]
+    rows += [f"PO-I{i},Vendor {i},98250{i:05d},Item,1,10" for i in range(5)]
+    rows += ["PO-NOPHONE,Nobody,,Item,1,1", "PO-I0,Vendor 0,9825000000,Late Item,2,10"]
+    response = create_import(
+        file=UploadFile(file=io.BytesIO("\n".join(rows).encode()), filename="big.csv"),
+        x_org_id="org_test_vatva", db=db_session,
+    )
+    assert response["status"] == "queued"
+    import_id = response["import_id"]
+
+    slices = 0
+    while db_session.get(ImportJob, import_id).status != "completed":
+        job = db_session.get(ImportJob, import_id)
+        if slices == 1:
+            # A slice that crashed after writing log lines: the retry must not duplicate them
+            with open(log_path(job), "ab") as log:
+                log.write(b'{"po_number": "GHOST"}\n')
+        await worker_queue.execute_pending_jobs(db=db_session)
+        db_session.expire_all()
+        slices += 1
+        assert slices < 10
+
+    status = get_import(import_id, x_org_id="org_test_vatva", db=db_session)
+    assert status["status"] == "completed"
+    assert (status["rows_processed"], status["pos_imported"], status["pos_skipped"]) == (7, 5, 1)
+    assert status["rows_per_second"] is not None
+
+    lines = [json.loads(line) for line in b"".join(iter_log(db_session.get(ImportJob, import_id))).splitlines()]
+    assert [line["po_number"] for line in lines] == ["PO-I0", "PO-I1", "PO-I2", "PO-I3", "PO-I4", "PO-NOPHONE", "PO-I0"]
+    assert lines[-1]["status"] == "appended"
+
+    # The spooled upload is gone once the import completes; its log is kept
+    job = db_session.get(ImportJob, import_id)
+    assert not os.path.exists(job.spool_path) and os.path.exists(log_path(job))
+
+    # The late row of PO-I0 (written two slices earlier) was appended to its task
+    task = db_session.query(ProcurementTask).filter(ProcurementTask.po_number == "PO-I0").one()
+    assert task.total_amount == Decimal("30")
+    assert db_session.query(ProcurementItem).filter(ProcurementItem.task_id == task.id).count() == 2
+
+# --------------------------------------------------
+# TEST 22: BATCHED STATE TRANSITIONS
+# --------------------------------------------------
+def test_transition_many_is_set_based_and_atomic(db_session):
+    """transition_many validates every transition, writes set-wise and queues one batched webhook."""
+    from app.models import WebhookEndpoint
+
+    db_session.add(WebhookEndpoint(id="ep_state", organization_id="org_test_vatva", url="https://erp.example/hook",
+                                   event_filter="STATE_TRANSITION"))
+    for i in range(30):
+        db_session.add(ProcurementWorkflow(id=f"wf_batch_{i:02d}", organization_id="org_test_vatva",
+                                           po_number=f"PO-BATCH-{i}", current_state=WorkflowState.CREATED.value))
+        db_session.add(ProcurementTask(organization_id="org_test_vatva", workflow_id=f"wf_batch_{i:02d}", vendor_id="vendor_test_laxmi",
+                                       po_number=f"PO-BATCH-{i}", po_date=date.today(), status=WorkflowState.CREATED.value))
+    db_session.add(ProcurementWorkflow(id="wf_batch_done", organization_id="org_test_vatva",
+                                       po_number="PO-BATCH-DONE", current_state=WorkflowState.COMPLETED.value))
+    db_session.commit()
+    batch = [(f"wf_batch_{i:02d}", WorkflowState.VENDOR_PENDING) for i in range(30)]
+
+    # One invalid transition rejects the whole batch
+    with pytest.raises(ValueError, match="Invalid transition"):
+        state_machine.transition_many(db_session, batch + [("wf_batch_done", WorkflowState.APPROVED)], "org_test_vatva")
+    db_session.rollback()
+    assert db_session.query(ProcurementWorkflow).filter(ProcurementWorkflow.current_state == WorkflowState.VENDOR_PENDING.value).count() == 0
+
+    result = state_machine.transition_many(
+        db_session, batch + [("wf_batch_done", WorkflowState.APPROVED), ("wf_missing", WorkflowState.APPROVED)],
+        "org_test_vatva", user_id="user_test_mgr", reason="Bulk import", skip_invalid=True,
+    )
+    db_session.commit()
+    assert len(result["transitioned"]) == 30
+    assert {r["workflow_id"] for r in result["rejected"]} == {"wf_batch_done", "wf_missing"}
+    assert db_session.query(ProcurementTask).filter(ProcurementTask.status == WorkflowState.VENDOR_PENDING.value).count() == 30
+    assert db_session.query(WorkflowEvent).filter(WorkflowEvent.event_type == "STATE_CHANGED_TO_VENDOR_PENDING").count() == 30
+    assert db_session.query(AuditLog).filter(AuditLog.user_id == "user_test_mgr").count() == 30
+
+    # STATE_TRANSITION subscribers receive the batch as one delivery
+    job = db_session.query(ActiveJob).filter(ActiveJob.task_name == "deliver_outbound_webhook").one()
+    assert job.payload["event_type"] == "STATE_TRANSITION_BATCH"
+    assert job.payload["data"]["count"] == 30 and list(job.payload["deliveries"]) == ["ep_state"]
+
+# --------------------------------------------------
+# TEST 23: OPTIMISTIC (VERSION CAS) TRANSITIONS
+# --------------------------------------------------
+def test_optimistic_transition_retries_on_version_conflict(db_session):
+    """A concurrent write between read and swap forces a re-read; persistent conflicts give up."""
+    from sqlalchemy import event
+    from app.services.state_machine import TransitionConflictError
+
+    db_session.add(ProcurementWorkflow(id="wf_cas", organization_id="org_test_vatva", po_number="PO-CAS",
+                                       current_state=WorkflowState.VENDOR_PENDING.value, version=1))
+    db_session.commit()
+
+    concurrent_writes = {"remaining": 1}
+    def competing_writer(orm_execute_state):
+        # Another writer commits DELAYED just before our compare-and-swap lands
+        if orm_execute_state.is_update and concurrent_writes["remaining"]:
+            concurrent_writes["remaining"] -= 1
+            orm_execute_state.session.connection().exec_driver_sql(
+                "UPDATE procurement_workflows SET current_state = 'DELAYED', version = version + 1 WHERE id = 'wf_cas'"
+            )
+    event.listen(db_session, "do_orm_execute", competing_writer)
+    try:
+        result = state_machine.transition_workflow(
+            db_session, "wf_cas", WorkflowState.ESCALATED, "org_test_vatva", optimistic=True
+        )
+        assert result["previous_state"] == WorkflowState.DELAYED   # Re-validated against the winner's state
+        db_session.commit()
+        wf = db_session.get(ProcurementWorkflow, "wf_cas")
+        assert (wf.current_state, wf.version) == (WorkflowState.ESCALATED.value, 3)
+
+        concurrent_writes["remaining"] = 10
+        with pytest.raises(TransitionConflictError):
+            state_machine.transition_workflow(
+                db_session, "wf_cas", WorkflowState.COMPLETED, "org_test_vatva", optimistic=True, max_retries=2
+            )
+        assert concurrent_writes["remaining"] == 7   # 1 try + 2 retries
+    finally:
+        event.remove(db_session, "do_orm_execute", competing_writer)
+    db_session.rollback()
+
+    # Pessimistic transitions bump the version too, so optimistic writers notice them
+    state_machine.transition_workflow(db_session, "wf_cas", WorkflowState.COMPLETED, "org_test_vatva")
+    assert db_session.get(ProcurementWorkflow, "wf_cas").version == 4
+
+# --------------------------------------------------
+# TEST 24: COMPILED TRANSITION TABLE
+# --------------------------------------------------
+def test_compiled_transition_table_matches_rules():
+    """SUCCESSORS/PREDECESSORS encode VALID_TRANSITIONS plus the cancel-anything-but-COMPLETED rule."""
+    from app.services.state_machine import PREDECESSORS, SUCCESSORS, VALID_TRANSITIONS, parse_state
+
+    for current in WorkflowState:
+        for target in WorkflowState:
+            expected = target in VALID_TRANSITIONS[current] or (
+                target == WorkflowState.CANCELLED and current != WorkflowState.COMPLETED
+            )
+            assert state_machine.is_transition_valid(current, target) is expected
+            assert (current in PREDECESSORS[target]) is expected
+    assert SUCCESSORS[WorkflowState.COMPLETED] == frozenset()
+    assert parse_state("ESCALATED") is WorkflowState.ESCALATED
+    with pytest.raises(ValueError):
+        parse_state("NOT_A_STATE")
+
+# --------------------------------------------------
+# TEST 25: SNAPSHOT + REPLAY PROJECTIONS
+# --------------------------------------------------
+@pytest.mark.asyncio
+async def test_projection_snapshots_replay_and_time_travel(db_session, monkeypatch):
+    """Snapshot + tail replay equals a full fold at any time T; drift from current_state is reported."""
+    from sqlalchemy.orm import sessionmaker
+    from app.core.config import settings
+    from app.models import ActiveJob, WorkflowSnapshot
+    from app.services.projections import apply_event, initial_state, project_workflows, rebuild_organization, state_at
+
+    db_session.add(ProcurementWorkflow(id="wf_proj", organization_id="org_test_vatva", po_number="PO-PROJ",
+                                       current_state=WorkflowState.COMPLETED.value))
+    t0 = datetime(2025, 1, 1, 9, 0)
+    path = ["VENDOR_PENDING", "VENDOR_CONFIRMED", "DISPATCHED", "DELIVERED", "INVOICE_RECEIVED", "COMPLETED"]
+    events = [("PO_INGESTED", {"po_number": "PO-PROJ", "total_amount": 1200.0, "line_items_count": 2}, t0)]
+    hours = [1, 2, 3, 3, 4, 5]   # The 4th/5th events share a timestamp across a snapshot boundary
+    for i, (state, hour) in enumerate(zip(path, hours)):
+        at = t0 + timedelta(hours=hour)
+        events.append((f"STATE_CHANGED_TO_{state}", {"new_state": state, "reason": f"step {i}"}, at))
+    for n, (event_type, payload, at) in enumerate(events):
+        db_session.add(WorkflowEvent(id=f"evt_proj_{n}", organization_id="org_test_vatva", workflow_id="wf_proj",
+                                     event_type=event_type, payload=payload, created_at=at))
+    db_session.commit()
+
+    def fold(until):
+        state = initial_state()
+        for event_type, payload, at in events:
+            if at <= until:
+                apply_event(state, event_type, payload, at)
+        return state
+
+    result = project_workflows(db_session, ["wf_proj"], snapshot_every=3)
+    assert (result["events_replayed"], result["snapshots_written"], result["drift"]) == (7, 2, [])
+    current = state_at(db_session, "wf_proj")
+    assert current["state"] == fold(events[-1][2]) and current["state"]["state"] == "COMPLETED"
+    assert (current["event_count"], current["replayed_events"]) == (7, 1)
+
+    # Time travel: every instant matches a full fold, from at most one snapshot plus a short tail
+    for _, _, at in events:
+        past = state_at(db_session, "wf_proj", at=at)
+        assert past["state"] == fold(at)
+        assert past["replayed_events"] < 3
+    assert state_at(db_session, "wf_proj", at=t0 + timedelta(hours=2))["state"]["state"] == "VENDOR_CONFIRMED"
+    assert state_at(db_session, "wf_proj", at=t0 - timedelta(hours=1))["state"] == initial_state()
+
+    # Incremental run only replays the new tail; current_state out of step with events is drift
+    db_session.add(WorkflowEvent(organization_id="org_test_vatva", workflow_id="wf_proj",
+                                 event_type="PO_REINGESTED", payload={"total_amount": 1500.0},
+                                 created_at=t0 + timedelta(hours=10)))
+    db_session.get(ProcurementWorkflow, "wf_proj").current_state = WorkflowState.ESCALATED.value
+    db_session.commit()
+    result = project_workflows(db_session, ["wf_proj"], snapshot_every=3)
+    assert (result["events_replayed"], result["drift"]) == (2, ["wf_proj"])
+    assert state_at(db_session, "wf_proj")["state"]["total_amount"] == 1500.0
+
+    # Full org rebuild drops and re-creates the snapshots
+    totals = rebuild_organization("org_test_vatva", full=True, batch_size=10, workers=1,
+                                  session_factory=sessionmaker(bind=db_session.get_bind()))
+    assert (totals["workflows"], totals["events_replayed"], totals["drift"]) == (1, 8, ["wf_proj"])
+    db_session.expire_all()
+    assert db_session.query(WorkflowSnapshot).filter_by(workflow_id="wf_proj").count() == totals["snapshots_written"]
+
+    # Every PROJECTION_SNAPSHOT_EVERY-th transition (by workflow version) queues one snapshot pass
+    monkeypatch.setattr(settings, "PROJECTION_SNAPSHOT_EVERY", 3)
+    db_session.add(ProcurementWorkflow(id="wf_live", organization_id="org_test_vatva", po_number="PO-LIVE",
+                                       current_state=WorkflowState.VENDOR_PENDING.value))
+    db_session.commit()
+    for target in (WorkflowState.ETA_RECEIVED, WorkflowState.APPROVAL_PENDING):
+        state_machine.transition_workflow(db_session, "wf_live", target, "org_test_vatva")
+    state_machine.transition_many(db_session, [("wf_live", WorkflowState.APPROVED)], "org_test_vatva")
+    db_session.commit()
+    assert db_session.query(ActiveJob).filter_by(task_name="extend_projections").count() == 1
+    await worker_queue.execute_pending_jobs(db=db_session)
+    db_session.expire_all()
+    live = state_at(db_session, "wf_live")
+    assert (live["state"]["state"], live["event_count"], live["replayed_events"]) == ("APPROVED", 3, 0)
+
+# --------------------------------------------------
+# TEST 26: CACHED VENDOR -> WORKFLOW RESOLVER
+# --------------------------------------------------
+def test_vendor_resolver_caches_and_invalidates(db_session, monkeypatch):
+    """Repeat lookups run no SQL; ingestion and closing transitions invalidate the cached context."""
+    from decimal import Decimal
+    from sqlalchemy import event
+    from app.services.ingestion_pipeline import ParsedPO
+    from app.services.ingestion_writer import POBatchWriter
+    from app.services.vendor_resolver import vendor_resolver
+
+    db_session.add_all([
+        ProcurementWorkflow(id="wf_res_1", organization_id="org_test_vatva", po_number="PO-RES-1",
+                            current_state=WorkflowState.VENDOR_PENDING.value, created_at=datetime(2025, 1, 1)),
+        ProcurementWorkflow(id="wf_res_2", organization_id="org_test_vatva", po_number="PO-RES-2",
+                            current_state=WorkflowState.VENDOR_PENDING.value, created_at=datetime(2025, 1, 2)),
+        ProcurementTask(id="task_res_1", organization_id="org_test_vatva", workflow_id="wf_res_1", vendor_id="vendor_test_laxmi",
+                        po_number="PO-RES-1", po_date=date.today(), created_at=datetime(2025, 1, 1)),
+        Vendor(id="vendor_res_new", organization_id="org_test_vatva", name="Shree Tools", phone_number="+919811111111"),
+    ])
+    db_session.commit()
+
+    statements = []
+    engine = db_session.get_bind()
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", count_statements)
+    try:
+        first = hitl_service._resolve_workflow_context("+919876543210", db_session)
+        assert first == {"organization_id": "org_test_vatva", "workflow_id": "wf_res_1",
+                         "task_id": "task_res_1", "vendor_id": "vendor_test_laxmi", "language": "en"}
+        loaded = len(statements)
+        first["workflow_id"] = "mutated"   # Callers get copies
+        assert hitl_service._resolve_workflow_context("+919876543210", db_session)["workflow_id"] == "wf_res_1"
+        assert vendor_resolver.resolve(db_session, "+910000000000")["organization_id"] is None
+        vendor_resolver.resolve(db_session, "+910000000000")
+        assert len(statements) == loaded + 1   # Hits (and the cached unknown phone) run no SQL
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statements)
+
+    # Vendor with no task falls back to the org's newest open workflow
+    assert vendor_resolver.resolve(db_session, "+919811111111")["workflow_id"] == "wf_res_2"
+    # Closing it bumps the org generation: the fallback moves on
+    state_machine.transition_workflow(db_session, "wf_res_2", WorkflowState.CANCELLED, "org_test_vatva")
+    assert vendor_resolver.resolve(db_session, "+919811111111")["workflow_id"] == "wf_res_2"   # Not until commit
+    db_session.commit()
+    assert vendor_resolver.resolve(db_session, "+919811111111")["workflow_id"] == "wf_res_1"
+
+    # Ingesting a newer PO for the vendor makes it the active one
+    POBatchWriter(db_session, "org_test_vatva", "new.csv").write([ParsedPO(
+        po_number="PO-RES-3", vendor_name="Laxmi Fasteners", vendor_phone="+919876543210",
+        items=[{"description": "Nuts", "quantity": Decimal("1"), "rate": Decimal("4"), "amount": Decimal("4")}],
+        total_amount=Decimal("4"),
+    )])
+    db_session.commit()
+    context = vendor_resolver.resolve(db_session, "+919876543210")
+    new_task = db_session.query(ProcurementTask).filter_by(po_number="PO-RES-3").one()
+    assert (context["task_id"], context["workflow_id"]) == (new_task.id, new_task.workflow_id)
+
+    # One webhook POST, one savepoint per message: the first closes a workflow, the second fails.
+    # The invalidation waits for the request's commit and survives the second savepoint's rollback.
+    from fastapi.testclient import TestClient
+    from app.api import webhooks as webhooks_api
+    from app.core.database import get_db
+    from app.main import app
+    from app.services.ai_service import ai_service
+
+    assert vendor_resolver.resolve(db_session, "+919811111111")["workflow_id"] == new_task.workflow_id
+    generation = vendor_resolver._generation("org_test_vatva")
+    during = []
+    def process(db, message_id, from_phone, text_body, analysis):
+        if text_body == "close":
+            state_machine.transition_workflow(db, new_task.workflow_id, WorkflowState.CANCELLED, "org_test_vatva")
+            return {"status": "processed", "message_id": message_id}
+        during.append(vendor_resolver._generation("org_test_vatva"))
+        raise RuntimeError("HITL routing failed")
+    monkeypatch.setattr(webhooks_api, "_process_message", process)
+    monkeypatch.setattr(ai_service, "parse_vendor_message", lambda text: {"intent": "general_query"})
+
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        response = TestClient(app).post("/api/v1/webhooks/whatsapp", json={"entry": [{"changes": [{"value": {"messages": [
+            {"id": "wamid.RES1", "from": "919811111111", "type": "text", "text": {"body": "close"}},
+            {"id": "wamid.RES2", "from": "919811111111", "type": "text", "text": {"body": "boom"}},
+        ]}}]}]})
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    assert response.status_code == 500 and response.json()["summary"]["failed"] == 1
+    assert during == [generation]   # Released savepoint: not yet invalidated
+    db_session.commit()
+    assert vendor_resolver.resolve(db_session, "+919811111111")["workflow_id"] == "wf_res_1"
+
+# --------------------------------------------------
+# TEST 27: ASYNC INBOUND WEBHOOKS WITH PER-VENDOR ORDERING
+# --------------------------------------------------
+async def test_async_inbound_webhook_acks_and_processes_in_vendor_order(db_session, monkeypatch):
+    """Async mode only records + enqueues; the worker processes one vendor's messages strictly in order."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.core.config import settings
+    from app.core.database import get_db
+    from app.services.ai_service import ai_service
+    from app.services.retry_policy import RETRY_POLICIES, RetryPolicy
+
+    monkeypatch.setattr(settings, "WEBHOOK_INBOUND_MODE", "async")
+    # Full jitter can draw a near-zero backoff; pin it so A1's retry is still pending below
+    monkeypatch.setitem(RETRY_POLICIES, "process_inbound_message",
+                        RetryPolicy(max_attempts=5, base_delay_seconds=2, non_retryable=(KeyError,), jitter="none"))
+    parsed, failures = [], {"remaining": 1}
+    def fake_parse(text):
+        if text == "A1" and failures["remaining"]:
+            failures["remaining"] -= 1
+            raise ConnectionError("OpenAI timeout")
+        parsed.append(text)
+        return {"intent": "general_query"}
+    monkeypatch.setattr(ai_service, "parse_vendor_message", fake_parse)
+
+    def inbound(message_id, phone, text):
+        return {"entry": [{"changes": [{"value": {"messages": [
+            {"id": message_id, "from": phone, "type": "text", "text": {"body": text}}
+        ]}}]}]}
+
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        client = TestClient(app)
+        for message_id, phone, text in [("wamid.A1", "+919876543210", "A1"), ("wamid.B1", "+919811111111", "B1"),
+                                        ("wamid.A2", "+919876543210", "A2"), ("wamid.A3", "+919876543210", "A3")]:
+            response = client.post("/api/v1/webhooks/whatsapp", json=inbound(message_id, phone, text))
+            assert response.status_code == 200 and response.json()["events"][0]["status"] == "queued"
+            db_session.commit()
+        duplicate = client.post("/api/v1/webhooks/whatsapp", json=inbound("wamid.A1", "+919876543210", "A1"))
+        assert duplicate.json()["events"][0]["status"] == "duplicate_bypassed"
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    assert parsed == []   # Nothing parsed inside the request
+    assert db_session.query(ActiveJob).filter(ActiveJob.ordering_key == "vendor:+919876543210").count() == 3
+
+    # A1 fails and is rescheduled; A2/A3 stay blocked behind it while B1 proceeds
+    await worker_queue.execute_pending_jobs(db=db_session)
+    assert parsed == ["B1"]
+    await worker_queue.execute_pending_jobs(db=db_session)
+    assert parsed == ["B1"]
+
+    retrying = db_session.query(ActiveJob).filter(ActiveJob.payload["event_id"].as_string() == "wamid.A1").one()
+    # A2/A3 are past their run_at but blocked: the loop waits out A1's backoff instead of spinning
+    next_due = worker_queue.next_due_at(db_session)
+    assert next_due == retrying.run_at and next_due > datetime.utcnow()
+    retrying.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    for _ in range(3):
+        await worker_queue.execute_pending_jobs(db=db_session)
+    assert parsed == ["B1", "A1", "A2", "A3"]
+    statuses = {e.event_id: e.processed_status for e in db_session.query(WebhookEvent)}
+    assert set(statuses.values()) == {"processed"}
+
+    # A redelivered job for a processed event is a no-op
+    worker_queue.enqueue_job("process_inbound_message", {"event_id": "wamid.A1", "phone_number": "+919876543210", "text": "A1"},
+                             db=db_session, ordering_key="vendor:+919876543210")
+    db_session.commit()
+    await worker_queue.execute_pending_jobs(db=db_session)
+    assert parsed == ["B1", "A1", "A2", "A3"]
+
+    # A job that fails for good flags its event 'failed', so Meta's redelivery is processed, not bypassed
+    def broken(text):
+        raise KeyError("intent")   # Non-retryable for process_inbound_message
+    monkeypatch.setattr(ai_service, "parse_vendor_message", broken)
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        client = TestClient(app)
+        client.post("/api/v1/webhooks/whatsapp", json=inbound("wamid.C1", "+919822222222", "C1"))
+        db_session.commit()
+        await worker_queue.execute_pending_jobs(db=db_session)
+        event = db_session.query(WebhookEvent).filter_by(event_id="wamid.C1").one()
+        assert event.processed_status == "failed" and "intent" in event.error_message
+
+        monkeypatch.setattr(ai_service, "parse_vendor_message", fake_parse)
+        redelivery = client.post("/api/v1/webhooks/whatsapp", json=inbound("wamid.C1", "+919822222222", "C1"))
+        assert redelivery.json()["events"][0]["status"] == "queued"
+        db_session.commit()
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    await worker_queue.execute_pending_jobs(db=db_session)
+    assert parsed[-1] == "C1"
+
+# --------------------------------------------------
+# TEST 28: BATCHED META WEBHOOK DELIVERIES
+# --------------------------------------------------
+def test_webhook_batch_processes_every_entry_change_and_message(db_session, monkeypatch):
+    """All entries/changes/messages/statuses are handled; new events are one INSERT, conflicts one IN query."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.main import app
+    from app.core.database import get_db
+    from app.services.ai_service import ai_service
+
+    parsed = []
+    def fake_parse(text):
+        if text == "boom":
+            raise RuntimeError("parser crashed")
+        parsed.append(text)
+        return {"intent": "general_query"}
+    monkeypatch.setattr(ai_service, "parse_vendor_message", fake_parse)
+    db_session.add(WebhookEvent(event_id="wamid.OLD", event_type="message_received", processed_status="processed"))
+    db_session.commit()
+
+    def text(message_id, body, phone="+919876543210"):
+        return {"id": message_id, "from": phone, "type": "text", "text": {"body": body}}
+    payload = {"entry": [
+        {"changes": [
+            {"value": {"metadata": {"phone_number_id": "123"},
+                       "messages": [text("wamid.M1", "first"), text("wamid.OLD", "old"), text("wamid.M2", "boom")]}},
+            {"value": {"statuses": [{"id": "wamid.S1", "status": "delivered", "recipient_id": "919876543210"},
+                                    {"id": "wamid.S2", "status": "read", "recipient_id": "919876543210"}]}},
+        ]},
+        {"changes": [{"value": {"messages": [text("wamid.M3", "third", "+919811111111"), text("wamid.M1", "first")]}}]},
+    ]}
+
+    statements = []
+    engine = db_session.get_bind()
+    def track(conn, cursor, statement, *args):
+        if "webhook_events" in statement and not statement.lstrip().upper().startswith("UPDATE"):
+            statements.append(statement.lstrip().split()[0].upper())
+    app.dependency_overrides[get_db] = lambda: db_session
+    event.listen(engine, "before_cursor_execute", track)
+    try:
+        client = TestClient(app)
+        response = client.post("/api/v1/webhooks/whatsapp", json=payload)
+    finally:
+        event.remove(engine, "before_cursor_execute", track)
+    db_session.commit()
+
+    assert statements == ["INSERT", "SELECT"]   # ON CONFLICT insert, then only the conflicting wamid.OLD read back
+    assert response.status_code == 500   # One message failed: Meta will redeliver
+    body = response.json()
+    assert [e["status"] for e in body["events"]] == [
+        "processed", "duplicate_bypassed", "failed", "status_logged", "status_logged", "processed", "duplicate_bypassed",
+    ]
+    assert body["summary"] == {"events": 7, "processed": 4, "queued": 0, "failed": 1, "duplicates": 2}
+    assert sorted(parsed) == ["first", "third"]   # Parsed concurrently
+    events = {e.event_id: e for e in db_session.query(WebhookEvent)}
+    assert events["wamid.M2"].processed_status == "failed" and "parser crashed" in events["wamid.M2"].error_message
+    assert events["wamid.S2:read"].event_type == "status_read"
+    assert events["wamid.M1"].raw_payload["messages"][0]["id"] == "wamid.M1"
+
+    # Redelivery: only the failed message is dispatched again
+    monkeypatch.setattr(ai_service, "parse_vendor_message", lambda t: parsed.append(t) or {"intent": "general_query"})
+    try:
+        retry = client.post("/api/v1/webhooks/whatsapp", json=payload)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    db_session.commit()
+    assert retry.status_code == 200 and retry.json()["summary"]["processed"] == 1
+    assert parsed[2:] == ["boom"]
+    db_session.expire_all()
+    assert db_session.query(WebhookEvent).filter_by(event_id="wamid.M2").one().processed_status == "processed"
+
+# --------------------------------------------------
+# TEST 29: IN-MEMORY WEBHOOK IDEMPOTENCY FRONT
+# --------------------------------------------------
+def test_webhook_idempotency_front_keeps_duplicates_off_the_db(db_session):
+    """Duplicate status pings never reach the DB; ids are remembered only after commit; Bloom rotates."""
+    from sqlalchemy import event
+    from app.api.webhooks import iter_notifications, register_events
+    from app.services.webhook_idempotency import RotatingBloomFilter, webhook_idempotency
+
+    def pings(*statuses):
+        return {"entry": [{"changes": [{"value": {"statuses": [
+            {"id": "wamid.OUT1", "status": s, "recipient_id": "919876543210"} for s in statuses
+        ]}}]}]}
+
+    first = register_events(db_session, list(iter_notifications(pings("sent", "delivered", "read"))))
+    assert [n.get("result") for n in first] == [None, None, None]   # Same wamid, three distinct receipts
+    webhook_idempotency.remember_after_commit(db_session, {n["event_id"]: "processed" for n in first})
+    db_session.rollback()   # Rolled back: nothing remembered, redelivery is new again
+    assert webhook_idempotency.recent_status("wamid.OUT1:sent") is None
+
+    again = register_events(db_session, list(iter_notifications(pings("sent", "delivered", "read"))))
+    webhook_idempotency.remember_after_commit(db_session, {n["event_id"]: "processed" for n in again})
+    with db_session.begin_nested():
+        pass   # A released savepoint is not the commit
+    assert webhook_idempotency.recent_status("wamid.OUT1:sent") is None
+    try:
+        with db_session.begin_nested():
+            raise ValueError("later message failed")
+    except ValueError:
+        pass   # Nor does a rolled back savepoint discard what the transaction queued
+    db_session.commit()
+    assert webhook_idempotency.recent_status("wamid.OUT1:sent") == "processed"
+    assert db_session.query(WebhookEvent).count() == 3
+
+    statements = []
+    engine = db_session.get_bind()
+    def track(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", track)
+    try:
+        for _ in range(20):   # Meta redelivery storm
+            storm = register_events(db_session, list(iter_notifications(pings("sent", "delivered", "read"))))
+            assert {n["result"]["status"] for n in storm} == {"duplicate_bypassed"}
+        # Evicted from the LRU: status pings are still answered by the Bloom filter
+        webhook_idempotency.recent.clear()
+        storm = register_events(db_session, list(iter_notifications(pings("read"))))
+        assert storm[0]["result"]["status"] == "duplicate_bypassed"
+    finally:
+        event.remove(engine, "before_cursor_execute", track)
+    assert statements == []
+
+    bloom = RotatingBloomFilter(capacity=100, error_rate=0.01)
+    for i in range(150):
+        bloom.add(f"id{i}")
+    assert bloom.rotations == 1 and all(f"id{i}" in bloom for i in range(150))
+    for i in range(150, 300):
+        bloom.add(f"id{i}")
+    assert "id0" not in bloom and "id299" in bloom   # The oldest generation was dropped
+
+# --------------------------------------------------
+# TEST 30: COALESCED DELIVERY RECEIPTS AND FUNNEL
+# --------------------------------------------------
+def test_delivery_receipts_coalesce_into_bulk_updates(db_session, monkeypatch):
+    """Receipts keep the highest status per wamid, flush as one UPDATE per status, never regress; funnel counts."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.main import app
+    from app.core.config import settings
+    from app.core.database import get_db
+    from app.models import Message
+    from app.services.delivery_status import delivery_statuses, delivery_funnel
+
+    for i in range(1, 6):
+        db_session.add(Message(id=f"msg_{i}", organization_id="org_test_vatva", sender_type="system_outbox",
+                               whatsapp_message_id=f"wamid.OUT{i}", message_content="PO reminder", delivery_status="sent"))
+    db_session.add(Message(id="msg_in", organization_id="org_test_vatva", sender_type="vendor",
+                           message_content="ok", delivery_status="sent"))   # Inbound: not in the funnel
+    db_session.commit()
+
+    def pings(*receipts):
+        return {"entry": [{"changes": [{"value": {"statuses": [
+            {"id": wamid, "status": s, "recipient_id": "919876543210"} for wamid, s in receipts
+        ]}}]}]}
+
+    monkeypatch.setattr(settings, "WHATSAPP_STATUS_FLUSH_SECONDS", 3600.0)
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        client = TestClient(app)
+        # Out of order and redelivered: OUT1 read before delivered, OUT2 delivered twice
+        client.post("/api/v1/webhooks/whatsapp", json=pings(
+            ("wamid.OUT1", "read"), ("wamid.OUT1", "delivered"), ("wamid.OUT2", "delivered"),
+            ("wamid.OUT3", "delivered"), ("wamid.OUT4", "failed"),
+        ))
+        client.post("/api/v1/webhooks/whatsapp", json=pings(("wamid.OUT3", "read"), ("wamid.OUT2", "delivered")))
+        db_session.commit()
+        assert db_session.query(Message).filter(Message.delivery_status != "sent").count() == 0   # Still buffered
+        assert delivery_statuses.snapshot()["pending"] == 4
+
+        updates = []
+        engine = db_session.get_bind()
+        def track(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith("UPDATE MESSAGES"):
+                updates.append(statement)
+        event.listen(engine, "before_cursor_execute", track)
+        try:
+            assert delivery_statuses.flush(db_session) == 4
+        finally:
+            event.remove(engine, "before_cursor_execute", track)
+        assert len(updates) == 3   # read, delivered, failed
+
+        # A late "delivered" for a read message never moves it backwards
+        delivery_statuses.add("wamid.OUT1", "delivered")
+        assert delivery_statuses.flush(db_session) == 0
+        statuses = dict(db_session.query(Message.whatsapp_message_id, Message.delivery_status)
+                        .filter(Message.whatsapp_message_id.isnot(None)).all())
+        assert statuses == {"wamid.OUT1": "read", "wamid.OUT2": "delivered", "wamid.OUT3": "read",
+                            "wamid.OUT4": "failed", "wamid.OUT5": "sent"}
+
+        # A receipt that beats the outbox commit of its Message row is retried on later flushes, then dropped
+        monkeypatch.setattr(settings, "WHATSAPP_STATUS_UNMATCHED_FLUSHES", 2)
+        delivery_statuses.add("wamid.LATE", "delivered")
+        delivery_statuses.add("wamid.NEVER", "read")
+        assert delivery_statuses.flush(db_session) == 0
+        assert delivery_statuses.snapshot()["pending"] == 2
+        db_session.add(Message(id="msg_late", organization_id="org_test_vatva", sender_type="system_outbox",
+                               whatsapp_message_id="wamid.LATE", message_content="PO reminder", delivery_status="sent"))
+        db_session.commit()
+        assert delivery_statuses.flush(db_session) == 1
+        assert db_session.get(Message, "msg_late").delivery_status == "delivered"
+        assert delivery_statuses.flush(db_session) == 0
+        snapshot = delivery_statuses.snapshot()
+        assert (snapshot["pending"], snapshot["requeued"], snapshot["dropped"]) == (0, 3, 1)
+        db_session.delete(db_session.get(Message, "msg_late"))
+        db_session.commit()
+
+        # Size-triggered flush rides on the webhook request's own commit
+        monkeypatch.setattr(settings, "WHATSAPP_STATUS_FLUSH_SIZE", 1)
+        client.post("/api/v1/webhooks/whatsapp", json=pings(("wamid.OUT5", "delivered")))
+        db_session.commit()
+        assert db_session.get(Message, "msg_5").delivery_status == "delivered"
+
+        funnel = client.get("/api/v1/review/messages/funnel", params={"org_id": "org_test_vatva"}).json()
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    assert {k: funnel[k] for k in ("sent", "delivered", "read", "failed")} == {"sent": 5, "delivered": 4, "read": 2, "failed": 1}
+    assert funnel["delivery_rate"] == 0.8 and funnel["read_rate"] == 0.5
+    assert delivery_funnel(db_session, "org_unknown")["delivery_rate"] is None
+
+# --------------------------------------------------
+# TEST 31: MICRO-BATCHED VENDOR MESSAGE PARSING
+# --------------------------------------------------
+async def test_vendor_messages_parsed_in_micro_batches(monkeypatch):
+    """Concurrent parses share one completion per batch; dropped items and failed batches fall back per message."""
+    import asyncio
+    import httpx
+    from app.core.config import settings
+    from app.services.ai_service import AIService
+    from app.services.parse_cache import parse_cache
+    from scripts import mock_openai_api
+
+    parse_cache.clear()
+    monkeypatch.setattr(settings, "AI_PARSE_BATCH_SIZE", 4)
+    monkeypatch.setattr(settings, "AI_PARSE_BATCH_WINDOW_MS", 50.0)
+    mock_openai_api.STATS.clear()
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_openai_api.app))
+    service = AIService(api_key="local-test-key", http_client=http_client)
+    texts = ["Okay, PO mil gaya", "Material will be late", "ETA date is next week", "Need clarification",
+             "Dispatch delay due to stock"]
+    expected = [service._mock_rule_based_parser(text) for text in texts]
+    try:
+        # Four fill a batch at once; the fifth waits out the window alone
+        results = await asyncio.gather(*(service.parse_vendor_message_async(text) for text in texts))
+        assert results == expected
+        assert mock_openai_api.STATS["requests"] == 2 and mock_openai_api.STATS["messages"] == 5
+        assert service.batcher.snapshot()["fallbacks"] == 0
+
+        # Items missing from the response, then a failed request: every caller still gets a parse
+        fresh = ["Okay noted", "Late by a week", "Share ETA"]
+        monkeypatch.setattr(mock_openai_api.app.state, "drop_rate", 1.0)
+        assert await asyncio.gather(*(service.parse_vendor_message_async(t) for t in fresh[:2])) == [
+            service._mock_rule_based_parser(t) for t in fresh[:2]
+        ]
+        monkeypatch.setattr(mock_openai_api.app.state, "error_rate", 1.0)
+        assert await service.parse_vendor_message_async(fresh[2]) == service._mock_rule_based_parser(fresh[2])
+    finally:
+        await service.aclose()
+        await http_client.aclose()
+    assert service.batcher.snapshot()["fallbacks"] == 3
+    assert mock_openai_api.STATS["errors"] == 2   # One retry, then the fallback
+
+# --------------------------------------------------
+# TEST 32: CONTENT-ADDRESSED PARSE CACHE
+# --------------------------------------------------
+async def test_parse_cache_reuses_parses_and_reresolves_relative_etas(db_session, monkeypatch):
+    """Repeat texts skip the LLM (LRU, then DB tier); relative ETAs follow the message date; TTL expires entries."""
+    import httpx
+    from app.core.config import settings
+    from app.models import ParseCacheEntry
+    from app.services.ai_service import AIService
+    from app.services.parse_cache import cache_key, parse_cache
+    from scripts import mock_openai_api
+
+    monkeypatch.setattr(settings, "AI_PARSE_BATCH_WINDOW_MS", 5.0)
+    mock_openai_api.STATS.clear()
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_openai_api.app))
+    service = AIService(api_key="local-test-key", http_client=http_client)
+    may_25, jun_10 = datetime(2026, 5, 25, 9), datetime(2026, 6, 10, 9)
+
+    async def parse(text, at, hint="en"):
+        return await service.parse_vendor_message_async(text, received_at=at, language_hint=hint, db=db_session)
+
+    try:
+        # The mock answers "eta" texts with 2026-05-29: four days after a May 25 message
+        assert (await parse("ETA kal tak", may_25))["extracted_eta"] == "2026-05-29"
+        repeat = await parse("  eta KAL tak! ", jun_10)   # Same normalized text, two weeks later
+        assert repeat["extracted_eta"] == "2026-06-14" and repeat["intent"] == "provide_eta"
+        assert mock_openai_api.STATS["requests"] == 1
+
+        # An explicit date is served as-is; a weekday is never cached; the language hint is part of the key
+        await parse("Dispatch date 29/05", may_25)
+        assert (await parse("dispatch date 29/05", jun_10))["extracted_eta"] == "2026-05-29"
+        await parse("ETA monday", may_25)
+        await parse("ETA monday", jun_10)
+        await parse("ok", may_25, hint="gu")
+        await parse("ok", may_25, hint="gu")
+        await parse("ok", may_25, hint="en")
+        assert mock_openai_api.STATS["requests"] == 6
+
+        # Another process: empty LRU, answered by the parse_cache table once the stores commit
+        with db_session.begin_nested():
+            pass   # The webhook handler's per-message savepoint: releasing it is not the commit
+        await parse_cache.drain()
+        assert db_session.query(ParseCacheEntry).count() == 0
+        db_session.commit()
+        await parse_cache.drain()
+        parse_cache.lru.clear()
+        assert (await parse("eta kal tak", jun_10))["extracted_eta"] == "2026-06-14"
+        assert mock_openai_api.STATS["requests"] == 6
+
+        # Expired rows are misses
+        parse_cache.lru.clear()
+        db_session.query(ParseCacheEntry).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        await parse("eta kal tak", jun_10)
+        assert mock_openai_api.STATS["requests"] == 7
+    finally:
+        await service.aclose()
+        await http_client.aclose()
+
+    stats = parse_cache.stats()
+    assert (stats["lru_hits"], stats["db_hits"], stats["misses"], stats["skipped"]) == (3, 1, 7, 2)
+    assert stats["hit_rate"] == round(4 / 11, 4)
+    db_session.commit()
+    await parse_cache.drain()
+    assert db_session.query(ParseCacheEntry).count() == 4   # The weekday text was never stored
+    assert parse_cache.purge_expired(db_session) == 3   # Only the re-parsed text is still live
+    assert db_session.query(ParseCacheEntry).count() == 1
+
+    # Switching models never serves the old model's parses
+    key = cache_key("2", "ok", "en")
+    monkeypatch.setattr(settings, "OPENAI_MODEL", "gpt-4o")
+    assert cache_key("2", "ok", "en") != key
+
+# --------------------------------------------------
+# TEST 33: CONCURRENT JOBS ON A FILE-BACKED SQLITE DATABASE
+# --------------------------------------------------
+async def test_sqlite_worker_runs_claimed_jobs_one_at_a_time(tmp_path):
+    """A job awaiting with flushed writes holds SQLite's write lock; its neighbours must not run beside it."""
+    import asyncio
+    from app.services.task_registry import task_registry
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'worker.db'}", connect_args={"check_same_thread": False, "timeout": 0.2})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    @task_registry.task("test_sqlite_writer", concurrency=10, timeout=5)
+    async def writer(payload, job_db):
+        job_db.add(AuditLog(organization_id="org_file", action="TEST_WRITE", description=str(payload["n"])))
+        job_db.flush()
+        await asyncio.sleep(0.02)   # e.g. the Graph API call after the outbox row is written
+
+    try:
+        for n in range(5):
+            worker_queue.enqueue_job("test_sqlite_writer", {"n": n}, db=db)
+        db.commit()
+        assert await worker_queue.execute_pending_jobs(db=db, concurrency=10) == 5
+        assert worker_queue.last_pass_stats.retried == 0
+        assert db.query(AuditLog).filter_by(action="TEST_WRITE").count() == 5
+    finally:
+        task_registry._tasks.pop("test_sqlite_writer", None)
+        db.close()
+        engine.dispose()
+
+# --------------------------------------------------
+# TEST 34: DELIVERY RECEIPT FLUSHER STAYS OFF THE EVENT LOOP
+# --------------------------------------------------
+async def test_status_flusher_flushes_off_the_event_loop(db_session, monkeypatch):
+    """The background flusher runs the blocking UPDATE + commit in a thread, not on the loop."""
+    import asyncio
+    import threading
+    from app.core.config import settings
+    from app.models import Message
+    from app.services.delivery_status import delivery_statuses, run_status_flusher
+
+    db_session.add(Message(id="msg_flush", organization_id="org_test_vatva", sender_type="system_outbox",
+                           whatsapp_message_id="wamid.FLUSH", message_content="PO reminder", delivery_status="sent"))
+    db_session.commit()
+    monkeypatch.setattr(settings, "WHATSAPP_STATUS_FLUSH_SECONDS", 0.0)
+
+    flush_threads = []
+    real_flush = delivery_statuses.flush
+    def tracking_flush(db, commit=True):
+        updated = real_flush(db, commit)
+        flush_threads.append(threading.current_thread())
+        return updated
+    monkeypatch.setattr(delivery_statuses, "flush", tracking_flush)
+
+    delivery_statuses.add("wamid.FLUSH", "read")
+    flusher = asyncio.create_task(run_status_flusher(lambda: db_session))
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if flush_threads:
+                break
+    finally:
+        flusher.cancel()
+    assert flush_threads and threading.current_thread() not in flush_threads
+    db_session.expire_all()
+    assert db_session.get(Message, "msg_flush").delivery_status == "read"
@@ -254,6 +254,10 @@ CREATE TABLE active_jobs (
     run_at TIMESTAMP WITH TIME ZONE NOT NULL,
     status VARCHAR(50) DEFAULT 'queued',   -- 'queued', 'running', 'completed', 'failed'
     retries_remaining INTEGER DEFAULT 3,
+    attempts INTEGER DEFAULT 0,            -- Executions so far; drives exponential backoff
+    retry_policy JSONB,                    -- Per-job RetryPolicy override (NULL = task default)
+    lease_owner VARCHAR(255),              -- Worker id holding the claim while 'running'
+    lease_expires_at TIMESTAMP WITH TIME ZONE, -- Expired leases are reclaimed by other workers
     correlation_id UUID,                   -- Trace ID for observability
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -275,6 +279,7 @@ CREATE INDEX idx_workflows_state ON procurement_workflows(current_state);
 CREATE INDEX idx_tasks_po_number ON procurement_tasks(po_number);
 CREATE INDEX idx_vendors_whatsapp ON vendors(phone_number);
 CREATE INDEX idx_active_jobs_run ON active_jobs(run_at);
+CREATE INDEX idx_active_jobs_status_lease ON active_jobs(status, lease_expires_at);
 
 -- Auto modified triggers
 CREATE OR REPLACE FUNCTION update_modified_column()